@@ -1,14 +1,114 @@
+import copy
+import fcntl
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import re
+import sqlite3
+import threading
+import time
+import traceback
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from pathlib import Path
 from typing import Dict, List, Optional
 
+from elasticsearch.helpers import bulk, scan
 from haystack.document_store import ElasticsearchDocumentStore
 from haystack.document_store.base import BaseDocumentStore
+from haystack.pipeline import Pipeline
+from haystack.reader.transformers import TransformersReader
 from haystack.retriever import ElasticsearchRetriever
+from haystack.retriever.base import BaseRetriever
 from haystack.schema import BaseComponent
 from haystack.retriever.dense import EmbeddingRetriever
+import networkx as nx
 import numpy as np
 from haystack import Document
 
 
+class ParallelPipeline(Pipeline):
+    """
+    A Pipeline that runs concurrently the sibling nodes fed by the Query node,
+    such as the retrievers before a JoinDocumentsCustom. The nodes are
+    otherwise visited in the same order as in Pipeline.run, so join nodes
+    receive their inputs in the same order.
+
+    Only the nodes fed by the Query node run concurrently: the nodes further
+    down receive the same documents and answers objects, which some of them
+    modify (such as AnswerifyDocuments), so they are run one after the other.
+
+    Unlike Pipeline.run, a join node does not wait for the predecessors that
+    were skipped by a routing node (such as ConfidenceRouter): it runs with the
+    inputs of the other ones.
+    """
+
+    max_workers = 4
+
+    def __init__(self, pipeline_type: str = "Query"):
+        super().__init__(pipeline_type=pipeline_type)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+
+    def run(self, **kwargs):
+        node_output = None
+        stack = {
+            self.root_node_id: {"pipeline_type": self.pipeline_type, **kwargs}
+        }  # ordered dict with "node_id" -> "input" mapping that acts as a FIFO stack
+        nodes_executed = set()
+        futures = {}
+        i = -1  # the last item is popped off the stack unless it is a join node with unprocessed predecessors
+        while stack:
+            node_id = list(stack.keys())[i]
+            node_input = stack[node_id]
+            predecessors = set(self.graph.predecessors(node_id))
+            # only execute if the predecessors nodes that can still run are executed
+            if not self.can_run(predecessors - nodes_executed, stack):
+                # Start the nodes fed by the Query node waiting on the stack
+                for sibling_id, sibling_input in stack.items():
+                    if (sibling_input is node_input and sibling_id not in futures
+                            and self.is_fed_by_root(sibling_id)):
+                        futures[sibling_id] = self.executor.submit(
+                            self.graph.nodes[sibling_id]["component"].run, **sibling_input)
+                try:
+                    if node_id in futures:
+                        node_output, stream_id = futures.pop(node_id).result()
+                    else:
+                        node_output, stream_id = self.graph.nodes[node_id]["component"].run(**node_input)
+                except Exception as e:
+                    tb = traceback.format_exc()
+                    raise Exception(f"Exception while running node `{node_id}` with input `{node_input}`: {e}, full stack trace: {tb}")
+                nodes_executed.add(node_id)
+                stack.pop(node_id)
+                next_nodes = self.get_next_nodes(node_id, stream_id)
+                for n in next_nodes:  # add successor nodes with corresponding inputs to the stack
+                    if self.graph.in_degree(n) > 1:
+                        # concatenate inputs if it's a join node, also when it only gets one input because its
+                        # other predecessors were skipped
+                        stack.setdefault(n, {"inputs": []})["inputs"].append(node_output)
+                    else:
+                        stack[n] = node_output
+                i = -1
+            else:  # attempt executing lower nodes in the stack as `node_id` has unprocessed dependency nodes
+                i -= 1
+        return node_output
+
+    def is_fed_by_root(self, node_id) -> bool:
+        return set(self.graph.predecessors(node_id)) == {self.root_node_id}
+
+    def can_run(self, nodes, stack) -> bool:
+        """
+        Returns True if one of the nodes is on the stack or can be reached from a node of the stack.
+        """
+        for node in nodes:
+            if node in stack or not nx.ancestors(self.graph, node).isdisjoint(stack):
+                return True
+        return False
+
+
 class LabelElasticsearchRetriever(ElasticsearchRetriever):
     """
      A node to search if a question is a perfect match.
@@ -89,6 +189,848 @@ class TitleEmbeddingRetriever(EmbeddingRetriever):
         return self.embedding_encoder.embed(texts)
 
 
+class CachedRetriever(BaseRetriever):
+    """
+    A node that wraps a retriever and keeps its results in an LRU cache with a
+    time to live. Results are keyed on the normalized query, top_k and
+    filters. The query is only normalized for unicode and whitespace, as the
+    embedding models are case-sensitive.
+    """
+
+    def __init__(self, retriever: BaseRetriever, max_size: int = 1000, ttl: Optional[float] = 3600):
+        """
+        :param retriever: The retriever whose results are cached
+        :param max_size: Maximum number of results kept in the cache
+        :param ttl: Number of seconds a result is kept in the cache. If set to None, results never expire
+        """
+
+        # save init parameters to enable export of component config as YAML
+        self.set_config(retriever = retriever, max_size = max_size, ttl = ttl)
+
+        self.retriever = retriever
+        self.document_store = retriever.document_store
+        self.max_size = max_size
+        self.ttl = ttl
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def retrieve(self, query: str, filters: dict = None, top_k: Optional[int] = None, index: str = None) -> List[Document]:
+        key = json.dumps([normalize_query(query), top_k, filters, index], sort_keys=True)
+        now = time.monotonic()
+
+        with self.lock:
+            entry = self.cache.get(key)
+            if entry and (self.ttl is None or now - entry[0] < self.ttl):
+                self.cache.move_to_end(key)
+                self.hits += 1
+                # The documents are modified by the next nodes of the pipeline
+                return copy.deepcopy(entry[1])
+            self.misses += 1
+
+        documents = self.retriever.retrieve(query, filters, top_k, index)
+
+        with self.lock:
+            self.cache[key] = (now, copy.deepcopy(documents))
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.max_size:
+                self.cache.popitem(last=False)
+
+        return documents
+
+    def cache_info(self) -> Dict:
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self.cache)}
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", query).split())
+
+
+class ANNElasticsearchDocumentStore(ElasticsearchDocumentStore):
+    """
+    An ElasticsearchDocumentStore whose dense retrieval is done with an in-process faiss index (HNSW by default)
+    instead of a script_score query that scans every document of the index. The documents, their meta and their
+    embeddings stay in Elasticsearch: the faiss index only maps the embeddings to the document ids, and the documents
+    found are fetched from Elasticsearch by id.
+
+    The faiss index is built when the documents are inserted, by update_embeddings (or build_ann_index), and saved to
+    ann_index_path. The queries only load it, again when the file changes, so that a process serving queries picks up
+    the index built by another one. Queries with filters, and queries on an index that has no saved faiss index, are
+    still sent to Elasticsearch.
+    """
+
+    def __init__(self, ann_index_path: str = "./dense_index.faiss", faiss_index_factory_str: str = "HNSW32",
+                 ef_search: int = 128, n_probe: int = 16, **kwargs):
+        """
+        :param ann_index_path: Path of the file where the faiss index is saved
+        :param faiss_index_factory_str: The faiss index type, e.g. "HNSW32", "IVF256,Flat" or "Flat" for an exact
+                                        search. See https://github.com/facebookresearch/faiss/wiki/The-index-factory
+        :param ef_search: Size of the candidate list of an HNSW search
+        :param n_probe: Number of clusters visited by an IVF search
+        :param kwargs: The parameters of ElasticsearchDocumentStore
+        """
+        super().__init__(**kwargs)
+
+        # save init parameters to enable export of component config as YAML. The config saved by
+        # ElasticsearchDocumentStore.__init__ is replaced to add the faiss parameters.
+        self.pipeline_config = {}
+        self.set_config(ann_index_path = ann_index_path, faiss_index_factory_str = faiss_index_factory_str,
+                        ef_search = ef_search, n_probe = n_probe, **kwargs)
+
+        self.ann_index_path = Path(ann_index_path)
+        self.faiss_index_factory_str = faiss_index_factory_str
+        self.ef_search = ef_search
+        self.n_probe = n_probe
+        self.ann_index = None
+        self.ann_ids = []
+        self.ann_source_index = None
+        self.ann_mtime = None
+        self.ann_lock = threading.Lock()
+
+    def update_embeddings(self, retriever, index: Optional[str] = None, **kwargs):
+        super().update_embeddings(retriever, index=index, **kwargs)
+        self.build_ann_index(index)
+
+    def build_ann_index(self, index: Optional[str] = None):
+        """
+        Builds the faiss index of the embeddings stored in the Elasticsearch index and saves it to ann_index_path.
+        """
+        import faiss
+
+        index = index or self.index
+        ids, embeddings = [], []
+        for doc in self.get_all_documents_generator(index=index, return_embedding=True):
+            if doc.embedding is not None:
+                ids.append(doc.id)
+                embeddings.append(doc.embedding)
+
+        serialized_index = None
+        if embeddings:
+            embeddings = self._prepare_vectors(embeddings)
+            ann_index = faiss.index_factory(embeddings.shape[1], self.faiss_index_factory_str,
+                                            faiss.METRIC_INNER_PRODUCT)
+            if not ann_index.is_trained:
+                ann_index.train(embeddings)
+            ann_index.add(embeddings)
+            serialized_index = faiss.serialize_index(ann_index)
+
+        # Written to a temporary file first, so that the processes reading the index never see a partial file
+        self.ann_index_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.ann_index_path.with_name(self.ann_index_path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump({"index": index, "ids": ids, "faiss_index": serialized_index}, f)
+        tmp_path.replace(self.ann_index_path)
+        self.load_ann_index()
+
+    def load_ann_index(self) -> bool:
+        """
+        Loads the faiss index from ann_index_path if the file changed since it was last loaded. Returns False if there
+        is no saved index.
+        """
+        import faiss
+
+        if not self.ann_index_path.exists():
+            return False
+        mtime = self.ann_index_path.stat().st_mtime
+        with self.ann_lock:
+            if mtime != self.ann_mtime:
+                with open(self.ann_index_path, "rb") as f:
+                    saved = pickle.load(f)
+                ann_index = None
+                if saved["faiss_index"] is not None:
+                    ann_index = faiss.deserialize_index(saved["faiss_index"])
+                    parameter_space = faiss.ParameterSpace()
+                    for name, value in [("efSearch", self.ef_search), ("nprobe", self.n_probe)]:
+                        try:
+                            parameter_space.set_index_parameter(ann_index, name, value)
+                        except RuntimeError:
+                            pass  # The parameter does not apply to this index type
+                self.ann_index, self.ann_ids, self.ann_source_index = ann_index, saved["ids"], saved["index"]
+                self.ann_mtime = mtime
+        return True
+
+    def query_by_embedding(self, query_emb: np.ndarray, filters: Optional[Dict[str, List[str]]] = None,
+                           top_k: int = 10, index: Optional[str] = None,
+                           return_embedding: Optional[bool] = None) -> List[Document]:
+        index = index or self.index
+        if return_embedding is None:
+            return_embedding = self.return_embedding
+
+        if filters or not self.load_ann_index() or self.ann_source_index != index:
+            # No faiss index was built for these documents: building one here would block the query for the time of a
+            # scan of the whole index
+            return super().query_by_embedding(query_emb, filters, top_k, index, return_embedding)
+
+        ann_index, ann_ids = self.ann_index, self.ann_ids
+        if ann_index is None:
+            return []
+        scores, rows = ann_index.search(self._prepare_vectors([query_emb]), top_k)
+        hits = [(ann_ids[row], float(score)) for row, score in zip(rows[0], scores[0]) if row >= 0]
+        if not hits:
+            return []
+
+        body = {"size": len(hits), "query": {"ids": {"values": [doc_id for doc_id, _ in hits]}}}
+        excluded_meta_data = list(self.excluded_meta_data or [])
+        if not return_embedding and self.embedding_field not in excluded_meta_data:
+            excluded_meta_data.append(self.embedding_field)
+        if excluded_meta_data:
+            body["_source"] = {"excludes": excluded_meta_data}
+        result = self.client.search(index=index, body=body)["hits"]["hits"]
+        documents = {hit["_id"]: self._convert_es_hit_to_document(hit, return_embedding=return_embedding)
+                     for hit in result}
+
+        # Same scores as the script_score query of ElasticsearchDocumentStore
+        ranked_documents = []
+        for doc_id, score in hits:
+            doc = documents.get(doc_id)
+            if doc is None:
+                continue  # deleted since the faiss index was built
+            doc.score = score
+            if self.similarity == "cosine":
+                doc.probability = (score + 1) / 2
+            else:
+                doc.probability = float(1 / (1 + np.exp(-score / 100)))
+            ranked_documents.append(doc)
+        return ranked_documents
+
+    def _prepare_vectors(self, vectors) -> np.ndarray:
+        import faiss
+
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if self.similarity == "cosine":
+            faiss.normalize_L2(vectors)
+        return vectors
+
+
+class EmbeddingCache:
+    """
+    An on-disk cache of passage embeddings for one embedding model.
+
+    The embeddings are appended to a float32 file which is read as a memory
+    mapped array, and the file index.txt contains the key of each row. The
+    cache only grows and can be shared by several processes: writes are
+    done under a file lock. The keys are kept in memory, and only the keys
+    appended since they were last read are read again from index.txt, when
+    its size or modification time changed.
+    """
+
+    def __init__(self, cache_dir, model_key: str):
+        self.path = Path(cache_dir) / model_key
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.path / "index.txt"
+        self.embeddings_path = self.path / "embeddings.f32"
+        self.lock_path = self.path / "lock"
+        self.rows = {}
+        self.n_rows = 0
+        self.embeddings = None
+        # Number of bytes of index.txt read so far, and its (size, mtime) then
+        self.index_offset = 0
+        self.index_stat = None
+        self.load()
+
+    def load(self):
+        """
+        Reads the keys appended to index.txt since the last call, if any.
+        """
+        if not self.index_path.exists():
+            return
+        stat = self.index_path.stat()
+        if (stat.st_size, stat.st_mtime) == self.index_stat:
+            return
+        with open(self.index_path, "rb") as f:
+            f.seek(self.index_offset)
+            data = f.read()
+        # Only complete lines, the last one may still be being written
+        data = data[:data.rfind(b"\n") + 1]
+        self.append_keys(data.decode("utf-8").split())
+        self.index_offset += len(data)
+        self.index_stat = (stat.st_size, stat.st_mtime)
+
+    def append_keys(self, keys: List[str]):
+        """
+        Adds keys to the rows following the ones already known, and maps the
+        new rows of the embeddings file. Rows are written before their keys,
+        so the index never refers to missing rows.
+        """
+        for i, key in enumerate(keys, self.n_rows):
+            self.rows[key] = i
+        self.n_rows += len(keys)
+        if self.n_rows and (self.embeddings is None or len(self.embeddings) < self.n_rows):
+            dim = int((self.path / "dim").read_text())
+            self.embeddings = np.memmap(self.embeddings_path, dtype=np.float32,
+                                        mode="r", shape=(self.n_rows, dim))
+
+    def get(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        return {key: np.array(self.embeddings[self.rows[key]])
+                for key in keys if key in self.rows}
+
+    def add(self, keys: List[str], embeddings: List[np.ndarray]):
+        if not len(keys):
+            return
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        with open(self.lock_path, "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # Rows added by other processes come before the new ones
+            self.load()
+            (self.path / "dim").write_text(str(embeddings.shape[1]))
+            with open(self.embeddings_path, "ab") as f:
+                # Drops the rows of a writer interrupted before it wrote their
+                # keys, so that the new rows are the ones of the new keys
+                f.truncate(self.n_rows * embeddings.shape[1] * 4)
+                f.write(embeddings.tobytes())
+            data = "".join(f"{key}\n" for key in keys).encode("utf-8")
+            with open(self.index_path, "ab") as f:
+                f.write(data)
+            self.append_keys(keys)
+            self.index_offset += len(data)
+            stat = self.index_path.stat()
+            self.index_stat = (stat.st_size, stat.st_mtime)
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def embedding_model_key(retriever) -> str:
+    """
+    Returns a key identifying the passage embeddings computed by retriever:
+    its class and the parameters it was created with (model name, version,
+    pooling strategy...), apart from the ones that do not change the
+    embeddings.
+    """
+    ignored = ["document_store", "top_k", "use_gpu", "batch_size", "progress_bar",
+               "weight_when_document_found"]
+    params = {k: v for k, v in retriever.pipeline_config["params"].items()
+              if k not in ignored}
+    description = json.dumps([type(retriever).__name__, params], sort_keys=True, default=str)
+    return hashlib.md5(description.encode("utf-8")).hexdigest()
+
+
+def passage_key(retriever, doc: Document) -> str:
+    """
+    Returns the hash of the content of doc embedded by retriever.
+    """
+    if isinstance(retriever, TitleEmbeddingRetriever):
+        content = doc.meta["name"]
+    else:
+        content = json.dumps([doc.text, doc.meta.get("name")])
+    return hashlib.md5(content.encode("utf-8")).hexdigest()
+
+
+@contextmanager
+def cached_embeddings(retriever, cache_dir):
+    """
+    Within this context, retriever.embed_passages reads the embeddings of the
+    passages already seen from an EmbeddingCache stored in cache_dir and only
+    computes the missing ones. Typical use:
+
+    with cached_embeddings(retriever, "./.cache/embeddings"):
+        document_store.update_embeddings(retriever, index=doc_index)
+    """
+    cache = EmbeddingCache(cache_dir, embedding_model_key(retriever))
+    original_embed_passages = retriever.embed_passages
+
+    def embed_passages(docs: List[Document]) -> List[np.ndarray]:
+        keys = [passage_key(retriever, doc) for doc in docs]
+        embeddings = cache.get(keys)
+        missing = [(key, doc) for key, doc in zip(keys, docs) if key not in embeddings]
+        if missing:
+            new_embeddings = original_embed_passages([doc for _, doc in missing])
+            cache.add([key for key, _ in missing], new_embeddings)
+            embeddings.update(zip([key for key, _ in missing], new_embeddings))
+        return [embeddings[key] for key in keys]
+
+    retriever.embed_passages = embed_passages
+    try:
+        yield
+    finally:
+        del retriever.embed_passages
+
+
+class ReaderPredictionCache:
+    """
+    Wraps the transformers question-answering pipeline of a TransformersReader
+    and memoizes its predictions for each (question, passage) pair in a SQLite
+    database. The key of a prediction is made of the model key, the question,
+    the hash of the passage and the arguments of the call (top_k_per_candidate,
+    max_seq_len...). Predictions are not stored while `writable` is False.
+    The cache can be shared by several threads. The numbers of predictions read
+    from the cache and computed by the model are counted in hits and misses.
+    """
+
+    def __init__(self, qa_pipeline, cache_path, model_key: str):
+        self.qa_pipeline = qa_pipeline
+        self.model_key = model_key
+        self.writable = True
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(str(cache_path), timeout=60, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS predictions (key TEXT PRIMARY KEY, predictions TEXT)")
+        self.connection.commit()
+
+    def __getattr__(self, name):
+        return getattr(self.qa_pipeline, name)
+
+    def __call__(self, inputs, **kwargs):
+        if not isinstance(inputs, dict):
+            return self.qa_pipeline(inputs, **kwargs)
+
+        context_hash = hashlib.md5(inputs["context"].encode("utf-8")).hexdigest()
+        description = json.dumps([self.model_key, inputs["question"], context_hash, kwargs],
+                                 sort_keys=True)
+        key = hashlib.md5(description.encode("utf-8")).hexdigest()
+
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT predictions FROM predictions WHERE key = ?", (key,)).fetchone()
+            if row:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if row:
+            return json.loads(row[0])
+
+        predictions = self.qa_pipeline(inputs, **kwargs)
+        if self.writable:
+            with self.lock:
+                self.connection.execute("INSERT OR REPLACE INTO predictions VALUES (?, ?)",
+                                        (key, json.dumps(predictions)))
+                self.connection.commit()
+        return predictions
+
+    def get_metrics(self) -> Dict:
+        """
+        Returns the share of the predictions read from the cache.
+        """
+        calls = self.hits + self.misses
+        return {"reader_cache_hit_rate": self.hits / calls if calls else 0}
+
+
+def enable_prediction_cache(reader, cache_path):
+    """
+    Makes the TransformersReader reader read its predictions from a
+    ReaderPredictionCache stored in cache_path, and only run the model on the
+    (question, passage) pairs it has not seen before.
+    """
+    import transformers
+
+    params = reader.pipeline_config["params"]
+    # The predictions of an ONNXTransformersReader, quantized or not, differ from the ones of the pytorch model
+    model_key = json.dumps([type(reader).__name__, params.get("model_name_or_path"), params.get("model_version"),
+                            params.get("tokenizer"), params.get("quantize"), transformers.__version__])
+    reader.model = ReaderPredictionCache(reader.model, cache_path, model_key)
+
+
+class ONNXTransformersReader(TransformersReader):
+    """
+    A TransformersReader whose model is run on CPU by onnxruntime. The model is exported to ONNX and, if quantize is
+    True, its weights are quantized to int8 (dynamic quantization). The exported models are cached in onnx_cache_dir,
+    so that the export is only done once per model version.
+
+    The transformers question-answering pipeline is kept for the pre and post processing: the answers are the same
+    dicts as the ones of TransformersReader.
+    """
+
+    def __init__(
+        self,
+        model_name_or_path: str = "etalab-ia/camembert-base-squadFR-fquad-piaf",
+        model_version: Optional[str] = None,
+        tokenizer: Optional[str] = None,
+        context_window_size: int = 70,
+        use_gpu: int = -1,
+        top_k: int = 10,
+        top_k_per_candidate: int = 4,
+        return_no_answers: bool = True,
+        max_seq_len: int = 256,
+        doc_stride: int = 128,
+        onnx_cache_dir: str = "./.cache/onnx",
+        quantize: bool = True,
+        n_threads: Optional[int] = None,
+    ):
+        """
+        :param use_gpu: Ignored, the model always runs on CPU
+        :param onnx_cache_dir: Folder where the exported models are saved
+        :param quantize: Whether the weights of the model are quantized to int8
+        :param n_threads: Number of threads used by onnxruntime, by default the number of cores
+        See TransformersReader for the other parameters.
+        """
+        super().__init__(model_name_or_path=model_name_or_path, model_version=model_version, tokenizer=tokenizer,
+                         context_window_size=context_window_size, use_gpu=-1, top_k=top_k,
+                         top_k_per_candidate=top_k_per_candidate, return_no_answers=return_no_answers,
+                         max_seq_len=max_seq_len, doc_stride=doc_stride)
+
+        # save init parameters to enable export of component config as YAML. The config saved by
+        # TransformersReader.__init__ is replaced to add the onnx parameters.
+        self.pipeline_config = {}
+        self.set_config(model_name_or_path=model_name_or_path, model_version=model_version, tokenizer=tokenizer,
+                        context_window_size=context_window_size, use_gpu=use_gpu, top_k=top_k,
+                        top_k_per_candidate=top_k_per_candidate, return_no_answers=return_no_answers,
+                        max_seq_len=max_seq_len, doc_stride=doc_stride, onnx_cache_dir=onnx_cache_dir,
+                        quantize=quantize, n_threads=n_threads)
+
+        onnx_path = export_onnx_reader(self.model.model, self.model.tokenizer, onnx_cache_dir,
+                                       model_key=[model_name_or_path, model_version, tokenizer], quantize=quantize)
+        # The pytorch model is not needed anymore
+        self.model.model = ONNXQuestionAnsweringModel(onnx_path, self.model.model.config, n_threads=n_threads)
+
+
+class ONNXQuestionAnsweringModel:
+    """
+    Runs an ONNX question answering model with the interface of the pytorch model used by the transformers
+    question-answering pipeline: it is called with the input tensors and returns the start and end logits.
+    """
+
+    def __init__(self, onnx_path, config, n_threads: Optional[int] = None):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if n_threads:
+            options.intra_op_num_threads = n_threads
+        self.session = onnxruntime.InferenceSession(str(onnx_path), options, providers=["CPUExecutionProvider"])
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+        self.config = config
+
+    def __call__(self, **inputs):
+        import torch
+
+        feed = {name: inputs[name].cpu().numpy().astype(np.int64) for name in self.input_names}
+        start_logits, end_logits = self.session.run(["start_logits", "end_logits"], feed)
+        return torch.from_numpy(start_logits), torch.from_numpy(end_logits)
+
+
+def export_onnx_reader(model, tokenizer, onnx_cache_dir, model_key, quantize: bool = True) -> Path:
+    """
+    Exports the pytorch question answering model to ONNX, quantized to int8 if quantize is True, and returns the path
+    of the exported model. The model is exported once for each model_key (the model name and version) and versions of
+    transformers and torch, the next calls return the path of the cached model.
+    """
+    import torch
+    import transformers
+
+    key = hashlib.md5(json.dumps([model_key, transformers.__version__, torch.__version__]).encode("utf-8")).hexdigest()
+    cache_dir = Path(onnx_cache_dir) / key
+    fp32_path = cache_dir / "model.onnx"
+    onnx_path = cache_dir / ("model-int8.onnx" if quantize else "model.onnx")
+    if onnx_path.exists():
+        return onnx_path
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    # Several processes may export the same model: each one writes its own file and moves it to the cache
+    suffix = f".{os.getpid()}.tmp"
+
+    if not fp32_path.exists():
+        inputs = tokenizer("Quelle est la question ?", "Voici le contexte.", return_tensors="pt")
+        # The inputs are given to the model in the order of its arguments
+        input_names = [name for name in inspect.signature(model.forward).parameters if name in inputs]
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names + ["start_logits", "end_logits"]}
+
+        return_dict = model.config.return_dict
+        model.config.return_dict = False
+        model.eval()
+        try:
+            with torch.no_grad():
+                torch.onnx.export(model, tuple(inputs[name] for name in input_names),
+                                  str(fp32_path.with_name(fp32_path.name + suffix)), input_names=input_names,
+                                  output_names=["start_logits", "end_logits"], dynamic_axes=dynamic_axes,
+                                  opset_version=11)
+        finally:
+            model.config.return_dict = return_dict
+        os.replace(fp32_path.with_name(fp32_path.name + suffix), fp32_path)
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(fp32_path, onnx_path.with_name(onnx_path.name + suffix), weight_type=QuantType.QInt8)
+        os.replace(onnx_path.with_name(onnx_path.name + suffix), onnx_path)
+
+    return onnx_path
+
+
+def iter_squad_articles(filename, buffer_size: int = 1 << 20):
+    """
+    Yields the articles of the "data" list of a SQuAD file one at a time. The
+    file is read by blocks of buffer_size characters, so that the whole file is
+    never loaded in memory. The "data" list is looked for in the keys of the
+    root object only: the values of the other keys are skipped.
+    """
+    decoder = json.JSONDecoder()
+    with open(filename, encoding="utf-8") as f:
+        buffer = ""
+
+        def skip(chars: str = "") -> str:
+            """
+            Drops the whitespaces and chars at the beginning of the buffer and
+            returns the next character, "" at the end of the file.
+            """
+            nonlocal buffer
+            while True:
+                buffer = buffer.lstrip(" \t\r\n" + chars)
+                if buffer:
+                    return buffer[0]
+                buffer = f.read(buffer_size)
+                if not buffer:
+                    return ""
+
+        def decode():
+            """
+            Decodes the JSON value at the beginning of the buffer.
+            """
+            nonlocal buffer
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer)
+                except json.JSONDecodeError:
+                    value, end = None, None
+                # A number is only complete when followed by a delimiter, it may go on in the next block
+                if end is not None and (not isinstance(value, (int, float))
+                                        or buffer[end:end + 1] in list(",]} \t\r\n")):
+                    buffer = buffer[end:]
+                    return value
+                # The value is not complete yet
+                block = f.read(buffer_size)
+                if not block:
+                    if end is None:
+                        raise ValueError(f"Could not parse {filename}")
+                    buffer = ""
+                    return value
+                buffer += block
+
+        # Go to the beginning of the "data" list
+        if skip() != "{":
+            return
+        buffer = buffer[1:]
+        while skip(",") == '"':
+            key = decode()
+            skip(":")
+            if key == "data":
+                break
+            decode()
+        else:
+            return
+        if skip() != "[":
+            raise ValueError(f"The data of {filename} is not a list")
+        buffer = buffer[1:]
+
+        while skip(",") not in ("]", ""):
+            yield decode()
+        if not buffer:
+            raise ValueError(f"Could not parse the articles of {filename}")
+
+
+def stream_eval_data(document_store: BaseDocumentStore, filename, doc_index: str, label_index: str,
+                     preprocessor=None, chunk_size: int = 500, thread_count: int = 4):
+    """
+    Same as document_store.add_eval_data for a SQuAD file, without loading the whole file in memory. The articles
+    are read one at a time, split by the preprocessor, and their documents and labels are written by chunks of
+    about chunk_size documents, with thread_count chunks written concurrently.
+    """
+    from haystack.preprocessor.utils import _extract_docs_and_labels_from_dict
+
+    def chunks():
+        docs, labels = [], []
+        for article in iter_squad_articles(filename):
+            article_docs, article_labels = _extract_docs_and_labels_from_dict(article, preprocessor)[:2]
+            docs.extend(article_docs)
+            labels.extend(article_labels)
+            if len(docs) >= chunk_size:
+                yield docs, labels
+                docs, labels = [], []
+        if docs or labels:
+            yield docs, labels
+
+    def write(docs, labels):
+        document_store.write_documents(docs, index=doc_index)
+        document_store.write_labels(labels, index=label_index)
+
+    # The indices are refreshed once at the end rather than after each chunk
+    refresh_type = getattr(document_store, "refresh_type", None)
+    if refresh_type:
+        document_store.refresh_type = "false"
+    try:
+        chunk_iterator = chunks()
+        # The first chunk creates the indices
+        for docs, labels in chunk_iterator:
+            write(docs, labels)
+            break
+
+        with ThreadPoolExecutor(max_workers=thread_count) as executor:
+            pending = set()
+            for docs, labels in chunk_iterator:
+                # Do not read the file faster than the chunks are written
+                if len(pending) >= thread_count:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                pending.add(executor.submit(write, docs, labels))
+            for future in pending:
+                future.result()
+    finally:
+        if refresh_type:
+            document_store.refresh_type = refresh_type
+
+    # The in-memory document stores have no index to refresh
+    if isinstance(document_store, ElasticsearchDocumentStore):
+        document_store.client.indices.refresh(index=f"{doc_index},{label_index}", ignore_unavailable=True)
+
+
+LABEL_KEY_FIELDS = ["question", "answer", "is_correct_answer", "is_correct_document", "origin", "document_id",
+                    "offset_start_in_doc", "no_answer"]
+
+
+def content_hash(value) -> str:
+    return hashlib.md5(json.dumps(value, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+
+def label_key(label: dict) -> str:
+    return content_hash([label.get(field) for field in LABEL_KEY_FIELDS])
+
+
+def stable_docs_and_labels(article, preprocessor=None):
+    """
+    Returns the documents and labels of a SQuAD article, as haystack's _extract_docs_and_labels_from_dict, except
+    that the id of each document is the hash of its text and meta. The same passage thus always gets the same id,
+    and a passage whose text or meta changed gets a new one.
+    """
+    from haystack.preprocessor.utils import _extract_docs_and_labels_from_dict
+
+    docs, labels = _extract_docs_and_labels_from_dict(article, preprocessor)[:2]
+    new_ids = {}
+    for doc in docs:
+        new_ids[doc.id] = content_hash({"text": doc.text, "meta": doc.meta})
+        doc.id = new_ids[doc.id]
+    for label in labels:
+        label.document_id = new_ids.get(label.document_id, label.document_id)
+    return docs, labels
+
+
+def delete_ids(client, index: str, ids):
+    bulk(client, ({"_op_type": "delete", "_index": index, "_id": _id} for _id in ids),
+         raise_on_error=False, request_timeout=300)
+
+
+def sync_eval_data(document_store: ElasticsearchDocumentStore, filename, doc_index: str, label_index: str,
+                   preprocessor=None, retriever=None, chunk_size: int = 500) -> Dict[str, int]:
+    """
+    Incremental version of stream_eval_data. The documents are identified by the hash of their text and meta (see
+    stable_docs_and_labels) and are compared with the ones already in doc_index: only the new documents are written,
+    and the documents that are not in the SQuAD file anymore are deleted. The labels are synced the same way.
+
+    :param retriever: If given, the embeddings of the new documents are computed with this retriever before they are
+                      written, so that update_embeddings does not need to be run on the whole index
+    :return: The number of documents and labels added, deleted and kept
+    """
+    client = document_store.client
+    indexed_doc_ids = set()
+    if client.indices.exists(index=doc_index):
+        indexed_doc_ids = {hit["_id"] for hit in scan(client, index=doc_index, query={"_source": False})}
+    indexed_labels = {}
+    if client.indices.exists(index=label_index):
+        for hit in scan(client, index=label_index, query={"_source": LABEL_KEY_FIELDS}):
+            indexed_labels[label_key(hit["_source"])] = hit["_id"]
+
+    doc_ids, label_keys = set(), set()
+
+    def chunks():
+        docs, labels = [], []
+        for article in iter_squad_articles(filename):
+            article_docs, article_labels = stable_docs_and_labels(article, preprocessor)
+            for doc in article_docs:
+                if doc.id not in doc_ids and doc.id not in indexed_doc_ids:
+                    docs.append(doc)
+                doc_ids.add(doc.id)
+            for label in article_labels:
+                key = label_key(label.to_dict())
+                if key not in label_keys and key not in indexed_labels:
+                    labels.append(label)
+                label_keys.add(key)
+            if len(docs) >= chunk_size:
+                yield docs, labels
+                docs, labels = [], []
+        if docs or labels:
+            yield docs, labels
+
+    added_docs, added_labels = 0, 0
+    for docs, labels in chunks():
+        if retriever is not None and docs:
+            for doc, embedding in zip(docs, retriever.embed_passages(docs)):
+                doc.embedding = embedding
+        if docs:
+            document_store.write_documents(docs, index=doc_index)
+        if labels:
+            document_store.write_labels(labels, index=label_index)
+        added_docs += len(docs)
+        added_labels += len(labels)
+
+    deleted_doc_ids = indexed_doc_ids - doc_ids
+    deleted_label_ids = [_id for key, _id in indexed_labels.items() if key not in label_keys]
+    delete_ids(client, doc_index, deleted_doc_ids)
+    delete_ids(client, label_index, deleted_label_ids)
+    client.indices.refresh(index=f"{doc_index},{label_index}", ignore_unavailable=True)
+
+    return {
+        "added_documents": added_docs,
+        "deleted_documents": len(deleted_doc_ids),
+        "kept_documents": len(doc_ids) - added_docs,
+        "added_labels": added_labels,
+        "deleted_labels": len(deleted_label_ids),
+        "kept_labels": len(label_keys) - added_labels,
+    }
+
+
+def aliased_index(client, alias: str) -> Optional[str]:
+    """
+    Returns the index behind the alias, the alias itself if it is a plain index, or None if it does not exist.
+    """
+    if client.indices.exists_alias(name=alias):
+        return list(client.indices.get_alias(name=alias).keys())[0]
+    if client.indices.exists(index=alias):
+        return alias
+    return None
+
+
+def blue_green_sync(document_store: ElasticsearchDocumentStore, filename, doc_index: str, label_index: str,
+                    preprocessor=None, retriever=None, chunk_size: int = 500) -> Dict[str, int]:
+    """
+    Same as sync_eval_data, but doc_index and label_index are aliases and the sync is done on a copy of the indices
+    they point to (the "<alias>_blue" or "<alias>_green" indices, whichever is not in use). The aliases are then
+    swapped in one request, so that the queries never see a partly synced index. The previous indices are kept until
+    the next sync, to be able to switch back to them.
+
+    Plain indices named doc_index or label_index, created before the aliases were used, are copied and replaced by the
+    aliases.
+    """
+    client = document_store.client
+    live_indices, new_indices = {}, {}
+    for alias, create_index in [(doc_index, document_store._create_document_index),
+                                (label_index, document_store._create_label_index)]:
+        live_index = aliased_index(client, alias)
+        new_index = f"{alias}_blue" if live_index == f"{alias}_green" else f"{alias}_green"
+        client.indices.delete(index=new_index, ignore=[404])
+        create_index(new_index)
+        if live_index:
+            client.reindex(body={"source": {"index": live_index}, "dest": {"index": new_index}},
+                           wait_for_completion=True, refresh=True, request_timeout=3600)
+        live_indices[alias] = live_index
+        new_indices[alias] = new_index
+
+    stats = sync_eval_data(document_store, filename, new_indices[doc_index], new_indices[label_index],
+                           preprocessor=preprocessor, retriever=retriever, chunk_size=chunk_size)
+
+    actions = []
+    for alias, live_index in live_indices.items():
+        if live_index == alias:
+            actions.append({"remove_index": {"index": live_index}})
+        elif live_index:
+            actions.append({"remove": {"index": live_index, "alias": alias}})
+        actions.append({"add": {"index": new_indices[alias], "alias": alias}})
+    client.indices.update_aliases(body={"actions": actions})
+
+    return stats
+
+
 class JoinDocumentsCustom(BaseComponent):
     """
     A node to join documents outputted by multiple retriever nodes.
@@ -129,6 +1071,212 @@ class JoinDocumentsCustom(BaseComponent):
         return output, "output_1"
 
 
+class PruneDocuments(BaseComponent):
+    """
+    A node placed before a Reader that adapts the number of passages read to the confidence of the retriever. The
+    documents, sorted by decreasing score, are normalized by the score of the top hit (mode "score_gap") or by the sum
+    of the scores (mode "cumulative_score"):
+
+    * score_gap: keep the documents whose score is at least (1 - threshold) times the score of the top hit,
+    * cumulative_score: keep the first documents until their share of the total score reaches threshold.
+
+    At least min_k and at most max_k documents are kept. The scores must come from one retriever (with positive
+    scores), not from a join of several retrievers. The documents without a score are all kept, up to max_k.
+    """
+
+    outgoing_edges = 1
+
+    def __init__(self, mode: str = "score_gap", threshold: float = 0.5, min_k: int = 1, max_k: Optional[int] = None):
+        """
+        :param mode: "score_gap" or "cumulative_score"
+        :param threshold: The maximum gap to the top hit (score_gap) or the score mass to reach (cumulative_score),
+                          between 0 and 1
+        :param min_k: The minimum number of documents kept
+        :param max_k: The maximum number of documents kept, None for no limit
+        """
+        if mode not in ["score_gap", "cumulative_score"]:
+            raise ValueError(f"Unknown pruning mode {mode}. Choose one from score_gap or cumulative_score.")
+
+        # save init parameters to enable export of component config as YAML
+        self.set_config(mode = mode, threshold = threshold, min_k = min_k, max_k = max_k)
+
+        self.mode = mode
+        self.threshold = threshold
+        self.min_k = min_k
+        self.max_k = max_k
+        self.query_count = 0
+        self.kept_count = 0
+
+    def prune(self, documents: List[Document]) -> List[Document]:
+        documents = sorted(documents, key=lambda doc: doc.score or 0, reverse=True)[:self.max_k]
+        if not documents or any(doc.score is None for doc in documents):
+            return documents
+
+        scores = np.maximum([doc.score for doc in documents], 0)
+        if self.mode == "score_gap":
+            keep = scores >= (1 - self.threshold) * scores[0]
+            n_kept = int(np.count_nonzero(keep))
+        else:
+            mass = np.cumsum(scores) / scores.sum() if scores.sum() > 0 else np.ones(len(scores))
+            n_kept = int(np.searchsorted(mass, self.threshold - 1e-9)) + 1
+        return documents[:max(n_kept, self.min_k)]
+
+    def run(self, **kwargs):
+        documents = self.prune(list(kwargs.get("documents") or []))
+        self.query_count += 1
+        self.kept_count += len(documents)
+
+        output = kwargs.copy()
+        output["documents"] = documents
+        return output, "output_1"
+
+    def get_metrics(self) -> Dict:
+        """
+        Returns the mean number of documents kept per query.
+        """
+        return {"mean_kept_documents": self.kept_count / self.query_count if self.query_count else 0}
+
+
+class CrossEncoderReranker(BaseComponent):
+    """
+    A node placed between the retrievers and the Reader, that scores each (query, document) pair with a cross-encoder
+    and only passes the top_k documents to the reader, sorted by decreasing cross-encoder score. As the reader is much
+    slower than a small cross-encoder, retrieving many documents and reading a few of them is faster than reading all
+    of them, for a similar accuracy.
+
+    The documents get the cross-encoder logit as score and its sigmoid as probability. The scores are kept in a
+    RerankerScoreCache stored in cache_path, so that the pairs already seen are not scored again.
+    """
+
+    outgoing_edges = 1
+
+    def __init__(
+        self,
+        model_name_or_path: str = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1",
+        model_version: Optional[str] = None,
+        top_k: int = 3,
+        use_gpu: int = -1,
+        batch_size: int = 32,
+        max_seq_len: int = 256,
+        cache_path: Optional[str] = "./.cache/reranker_scores.sqlite",
+    ):
+        """
+        :param model_name_or_path: A transformers sequence classification model trained as a cross-encoder
+        :param model_version: The version of the model (a branch name, tag or commit hash)
+        :param top_k: The number of documents passed to the reader
+        :param use_gpu: The id of the GPU used by the model, -1 for CPU
+        :param batch_size: Number of pairs scored in one forward pass
+        :param max_seq_len: Maximum number of tokens of a pair, the documents are truncated
+        :param cache_path: Path of the SQLite database of the scores, None to disable the cache
+        """
+        import torch
+        from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+        # save init parameters to enable export of component config as YAML
+        self.set_config(model_name_or_path = model_name_or_path, model_version = model_version, top_k = top_k,
+                        use_gpu = use_gpu, batch_size = batch_size, max_seq_len = max_seq_len,
+                        cache_path = cache_path)
+
+        self.top_k = top_k
+        self.batch_size = batch_size
+        self.max_seq_len = max_seq_len
+        self.device = torch.device(f"cuda:{use_gpu}" if use_gpu >= 0 and torch.cuda.is_available() else "cpu")
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name_or_path, revision=model_version)
+        self.model = AutoModelForSequenceClassification.from_pretrained(model_name_or_path, revision=model_version)
+        self.model.to(self.device)
+        self.model.eval()
+
+        self.cache = None
+        if cache_path:
+            model_key = json.dumps([model_name_or_path, model_version, max_seq_len])
+            self.cache = RerankerScoreCache(cache_path, model_key)
+
+    def predict_scores(self, query: str, texts: List[str]) -> List[float]:
+        """
+        Returns the cross-encoder logits of the pairs (query, text).
+        """
+        import torch
+
+        scores = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start:start + self.batch_size]
+            inputs = self.tokenizer([query] * len(batch), batch, padding=True, truncation="only_second",
+                                    max_length=self.max_seq_len, return_tensors="pt").to(self.device)
+            with torch.no_grad():
+                logits = self.model(**inputs)[0]
+            # A model with two labels (not relevant, relevant) is turned into a single logit
+            if logits.shape[1] > 1:
+                logits = logits[:, -1:] - logits[:, :1]
+            scores.extend(logits[:, 0].tolist())
+        return scores
+
+    def score(self, query: str, documents: List[Document]) -> List[float]:
+        """
+        Returns the cross-encoder scores of the documents for query, read from the cache when available.
+        """
+        if self.cache is None:
+            return self.predict_scores(query, [doc.text for doc in documents])
+
+        keys = [self.cache.key(query, doc.text) for doc in documents]
+        scores = self.cache.get(keys)
+        missing = [(key, doc) for key, doc in zip(keys, documents) if key not in scores]
+        if missing:
+            new_scores = self.predict_scores(query, [doc.text for _, doc in missing])
+            new_scores = dict(zip([key for key, _ in missing], new_scores))
+            self.cache.add(new_scores)
+            scores.update(new_scores)
+        return [scores[key] for key in keys]
+
+    def run(self, **kwargs):
+        documents = list(kwargs.get("documents") or [])
+        if documents:
+            scores = self.score(kwargs["query"], documents)
+            for doc, score in zip(documents, scores):
+                doc.score = score
+                doc.probability = float(1 / (1 + np.exp(-score)))
+            # Stable sort: the ties keep the order of the retrievers
+            documents = sorted(documents, key=lambda doc: doc.score, reverse=True)[:self.top_k]
+
+        output = kwargs.copy()
+        output["documents"] = documents
+        return output, "output_1"
+
+
+class RerankerScoreCache:
+    """
+    The cross-encoder scores of (query, document) pairs for one model, stored in a SQLite database. The key of a
+    score is the hash of the model key, the query and the hash of the document text. The cache can be shared by
+    several threads and processes.
+    """
+
+    def __init__(self, cache_path, model_key: str):
+        self.model_key = model_key
+        self.lock = threading.Lock()
+        Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(str(cache_path), timeout=60, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS scores (key TEXT PRIMARY KEY, score REAL)")
+        self.connection.commit()
+
+    def key(self, query: str, text: str) -> str:
+        text_hash = hashlib.md5(text.encode("utf-8")).hexdigest()
+        description = json.dumps([self.model_key, query, text_hash])
+        return hashlib.md5(description.encode("utf-8")).hexdigest()
+
+    def get(self, keys: List[str]) -> Dict[str, float]:
+        if not keys:
+            return {}
+        placeholders = ", ".join("?" * len(keys))
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT key, score FROM scores WHERE key IN ({placeholders})", keys).fetchall()
+        return dict(rows)
+
+    def add(self, scores: Dict[str, float]):
+        with self.lock:
+            self.connection.executemany("INSERT OR REPLACE INTO scores VALUES (?, ?)", scores.items())
+            self.connection.commit()
+
+
 class AnswerifyDocuments(BaseComponent):
     """
     This component is used to transform the documents retrieved in a shape that can be used like a Reader answer.
@@ -166,6 +1314,49 @@ class AnswerifyDocuments(BaseComponent):
         return results, "output_1"
 
 
+class ConfidenceRouter(BaseComponent):
+    """
+    A routing node placed before a Reader, that skips the reader when a retriever is already confident about one of
+    the documents, e.g. when the LabelElasticsearchRetriever found the question in the labels (weight 99).
+
+    The documents are sent to output_1, connected to the reader, unless one of them has a meta "weight" or a score at
+    least equal to the thresholds. In this case, the confident documents are sent to output_2 and the reader branch
+    is skipped: the answers are the ones of the other branches, such as the AnswerifyDocuments one, or of an
+    AnswerifyDocuments node connected to output_2.
+
+    When the reader branch ends in a join node, the pipeline must be a ParallelPipeline, which does not wait for the
+    skipped nodes.
+    """
+    outgoing_edges = 2
+
+    def __init__(self, weight_threshold: Optional[float] = 99, score_threshold: Optional[float] = None):
+        """
+        :param weight_threshold: The minimum meta "weight" of a confident document, None to ignore the weights
+        :param score_threshold: The minimum score of a confident document, None to ignore the scores
+        """
+
+        # save init parameters to enable export of component config as YAML
+        self.set_config(weight_threshold = weight_threshold, score_threshold = score_threshold)
+
+        self.weight_threshold = weight_threshold
+        self.score_threshold = score_threshold
+
+    def is_confident(self, doc: Document) -> bool:
+        if self.weight_threshold is not None and doc.meta.get("weight", 0) >= self.weight_threshold:
+            return True
+        return self.score_threshold is not None and doc.score is not None and doc.score >= self.score_threshold
+
+    def run(self, **kwargs):
+        documents = kwargs.get("documents") or []
+        confident_documents = [doc for doc in documents if self.is_confident(doc)]
+        if not confident_documents:
+            return kwargs, "output_1"
+
+        output = kwargs.copy()
+        output["documents"] = confident_documents
+        return output, "output_2"
+
+
 class JoinAnswers(BaseComponent):
     """
         A node to join documents outputted by multiple reader nodes.
@@ -199,6 +1390,7 @@ class JoinAnswers(BaseComponent):
 
         count_answers = 0
         count_reader = 0
+        document_ids = set()
         for input_from_node in inputs:
             for answer in input_from_node['answers']:
                 if count_answers == self.top_k:
@@ -211,9 +1403,12 @@ class JoinAnswers(BaseComponent):
                             count_reader += 1
                     continue
                 else:
-                    if answer["answer"] is not None:
+                    # The same document can be answerified by several branches, e.g. after a ConfidenceRouter
+                    if answer["answer"] is not None and answer.get("document_id") not in document_ids:
                         results["answers"].append(answer)
                         count_answers += 1
+                        if answer.get("document_id") is not None:
+                            document_ids.add(answer["document_id"])
 
         return results, "output_1"
 
@@ -254,11 +1449,15 @@ class MergeOverlappingAnswers(BaseComponent):
             while not is_merged and i < len(merged_answers):
                 mans = merged_answers[i]
 
-                # Try to merge the two contexts
-                (new_merged_ctxt, _) = merge_strings(
-                    mans["context"],
-                    ans["context"],
-                    self.minimum_overlap_contexts)
+                # Try to merge the two contexts. Identical contexts merge into
+                # themselves.
+                if mans["context"] == ans["context"] and ans["context"] != "":
+                    new_merged_ctxt = ans["context"]
+                else:
+                    (new_merged_ctxt, _) = merge_strings(
+                        mans["context"],
+                        ans["context"],
+                        self.minimum_overlap_contexts)
 
                 # If context merge was successful
                 if new_merged_ctxt != "":
@@ -383,38 +1582,39 @@ def merge_strings(str1, str2, minimum_overlap):
 
     if str1 == "" or str2 == "": return ("", 0)
 
-    # Brute force algorithm for a start. Probably inefficient for large
-    # sequences.
-    # Outline: Start by comparing the end of str1 with the beginning of str2.
-    # Shift each sequence towards the other one character at a time. Keep the
-    # positions of the longest matching string in both sequences.
+    # Outline: Find the shifts of str2 relative to str1 for which the
+    # overlapping parts are equal with str.find, by looking for the first
+    # `anchor` characters of one string in the other, and keep the longest
+    # overlap. Among overlaps of the same size, the largest shift wins.
+
+    len1 = len(str1)
+    len2 = len(str2)
+    minimum_overlap_chars = int(minimum_overlap * min(len1, len2))
+    anchor = max(minimum_overlap_chars, 1)
+
+    # Candidate matches (s, i): i is the number of characters by which to shift
+    # the beginning of str2 to the right of the beginning of str1, s is the size
+    # of the overlap.
+    candidates = []
+
+    # str2 is a substring of str1
+    if len2 <= len1:
+        i = str1.rfind(str2)
+        if i != -1:
+            candidates.append((len2, i))
+
+    # The end of str1 is the beginning of str2 (or str1 is a prefix of str2)
+    i = first_overlap(str1, str2, max(len1 - len2 + 1, 0), anchor)
+    if i != -1:
+        candidates.append((min(len1 - i, len2), i))
+
+    # The end of str2 is the beginning of str1 (or str1 is a substring of str2)
+    j = first_overlap(str2, str1, 1, anchor)
+    if j != -1:
+        candidates.append((min(len2 - j, len1), -j))
 
     # Best match
-    best_i = len(str1)
-    best_s = 0
-
-    minimum_overlap_chars = int(minimum_overlap * min(len(str1), len(str2)))
-
-    # i is the number of characters by which to shift the beginning of str2 to
-    # the right of the beginning of str1.
-    for i in range(len(str1) - 1, -len(str2), -1):
-
-        if i >= 0:
-            # Current size of compared substrings
-            s = min(len(str1) - i, len(str2))
-            # Positions of compared substrings in str1 and str2
-            start1 = i
-            start2 = 0
-        else:  # i < 0
-            s = min(len(str2) + i, len(str1))
-            start1 = 0
-            start2 = -i
-
-        if s >= minimum_overlap_chars \
-                and s > best_s \
-                and str1[start1: start1 + s] == str2[start2: start2 + s]:
-            best_i = i
-            best_s = s
+    best_s, best_i = max(candidates, default=(0, len1))
 
     if best_s >= minimum_overlap_chars:
         if best_i >= 0:
@@ -425,6 +1625,21 @@ def merge_strings(str1, str2, minimum_overlap):
         return ("", 0)
 
 
+def first_overlap(str1, str2, start, anchor):
+    """
+    Returns the smallest position `i >= start` such that `str1[i:]` and `str2`
+    are equal on their common length and share at least `anchor` characters,
+    or -1 if there is none.
+    """
+    prefix = str2[:anchor]
+    i = str1.find(prefix, start)
+    while i != -1:
+        if str1.startswith(str2[:len(str1) - i], i):
+            return i
+        i = str1.find(prefix, i + 1)
+    return -1
+
+
 def get_weight(doc):
     return doc["meta"].get('weight') or 0
 
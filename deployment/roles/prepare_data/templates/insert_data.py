@@ -8,11 +8,28 @@ from rest_api.config import PIPELINE_YAML_PATH, QUERY_PIPELINE_NAME
 from haystack import Pipeline
 from haystack.preprocessor.preprocessor import PreProcessor
 # THIS IMPORT IS NEEDED: the Pipeline.load_from_yaml will not see the TitleEmbeddingRetriever
-from rest_api.pipeline.custom_component import TitleEmbeddingRetriever
+from rest_api.pipeline.custom_component import TitleEmbeddingRetriever, aliased_index, blue_green_sync, \
+    cached_embeddings, stream_eval_data, sync_eval_data
 
 evaluation_data = Path("./data/squad.json")
 split_by = "word"
 split_length = 1000
+# Embeddings of the passages already inserted once are read from this cache
+embedding_cache_dir = Path("./data/embedding_cache")
+# The documents are written by chunks of bulk_chunk_size documents, with
+# bulk_thread_count chunks written at the same time
+bulk_chunk_size = 500
+bulk_thread_count = 4
+# How the indices are updated:
+# - "full": delete the indices (and the blue/green indices behind the aliases
+#   of a previous "blue_green" sync) and insert everything again in new plain
+#   indices. The queries get empty results until the insertion is done.
+# - "incremental": only insert (and embed) the passages that are new or
+#   changed and delete the ones that were removed, in the indices in use.
+# - "blue_green": same as "incremental", on a copy of the indices. The
+#   document_elasticsearch and label_elasticsearch aliases are switched to the
+#   copy once it is up to date.
+sync_mode = "blue_green"
 
 ES_host = "elasticsearch"
 
@@ -24,9 +41,15 @@ port = "9200"
 
 
 def delete_indices(index="document"):
+    """
+    Deletes the index. When it is an alias created by blue_green_sync, the
+    blue and green indices are deleted instead, which removes the alias.
+    """
     logging.info(f"Delete index {index} inside Elasticsearch ...")
     es = Elasticsearch([f"http://{ES_host}:{port}/"], verify_certs=True)
-    es.indices.delete(index=index, ignore=[400, 404])
+    indices = {aliased_index(es, index), f"{index}_blue", f"{index}_green"} - {None}
+    for name in indices:
+        es.indices.delete(index=name, ignore=[404])
 
 
 doc_index = "document_elasticsearch"
@@ -44,16 +67,55 @@ preprocessor = PreProcessor(
     split_respect_sentence_boundary=False,
 )
 
-es_retriever = PIPELINE.get_node("ESRetriever")
-title_emb_retriever = PIPELINE.get_node("TitleEmbRetriever")
+
+
+def get_retriever(name):
+    """
+    Returns the retriever of the node name of the query pipeline. The
+    retrievers of the query pipelines are wrapped in CachedRetriever nodes: the
+    retriever itself is only a component of the node.
+    """
+    node = PIPELINE.get_node(name)
+    if node is None:
+        raise ValueError(f"The query pipeline of {PIPELINE_YAML_PATH} has no node {name}")
+    return node.retriever
+
+
+es_retriever = get_retriever("CachedESRetriever")
+title_emb_retriever = get_retriever("CachedTitleEmbRetriever")
 document_store = es_retriever.document_store
-delete_indices(index=doc_index)
-document_store.delete_documents(index=doc_index)
-document_store.delete_documents(index=label_index)
-document_store.add_eval_data(
-    evaluation_data.as_posix(),
-    doc_index=doc_index,
-    label_index=label_index,
-    preprocessor=preprocessor,
-)
-document_store.update_embeddings(title_emb_retriever, index=doc_index)
+if sync_mode == "full":
+    delete_indices(index=doc_index)
+    delete_indices(index=label_index)
+    document_store._create_document_index(doc_index)
+    document_store._create_label_index(label_index)
+    stream_eval_data(
+        document_store,
+        evaluation_data.as_posix(),
+        doc_index=doc_index,
+        label_index=label_index,
+        preprocessor=preprocessor,
+        chunk_size=bulk_chunk_size,
+        thread_count=bulk_thread_count,
+    )
+    with cached_embeddings(title_emb_retriever, embedding_cache_dir):
+        document_store.update_embeddings(title_emb_retriever, index=doc_index)
+else:
+    sync = blue_green_sync if sync_mode == "blue_green" else sync_eval_data
+    with cached_embeddings(title_emb_retriever, embedding_cache_dir):
+        stats = sync(
+            document_store,
+            evaluation_data.as_posix(),
+            doc_index=doc_index,
+            label_index=label_index,
+            preprocessor=preprocessor,
+            retriever=title_emb_retriever,
+            chunk_size=bulk_chunk_size,
+        )
+    logging.info(f"Indices synced with {evaluation_data}: {stats}")
+    # With an ANNElasticsearchDocumentStore, the faiss index used by the dense
+    # retrieval is built again from the embeddings of the document index (in
+    # the "full" mode, update_embeddings does it). The queries never build it:
+    # until it is saved, they scan the Elasticsearch index.
+    if hasattr(document_store, "build_ann_index"):
+        document_store.build_ann_index(index=doc_index)
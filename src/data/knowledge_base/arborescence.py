@@ -6,6 +6,8 @@ Usage: arborescence.py <file_path> <output_path> [options]
 Arguments:
     <file_path>             A path of a single XML fiche or a folder with multiple fiches XML
     <output_path>           A path where to store the extracted info
+    --incremental=<i> INCREMENTAL  Do not build the arborescence again when no XML file was added, changed or removed
+                            since the previous run [default: 0:int]
 """
 
 import json
@@ -17,6 +19,11 @@ from pathlib import Path
 from argopt import argopt
 from tqdm import tqdm
 
+from src.data.knowledge_base.manifest import (diff_manifest, load_manifest,
+                                              save_manifest)
+
+MANIFEST_NAME = ".arborescence_manifest.json"
+
 
 def concat_ID_and_name(id, name):
     return id + "//" + name
@@ -301,7 +308,7 @@ def reformat_json(arborescence):
     return {"version": "1.0", "data": all_data}
 
 
-def main(doc_files_path, output_path):
+def main(doc_files_path, output_path, incremental=False):
     doc_files_path = Path(doc_files_path)
     output_path = Path(output_path)
     # if not doc_files_path.is_dir() and doc_files_path.is_file():
@@ -317,6 +324,18 @@ def main(doc_files_path, output_path):
     #     raise Exception(f"Path {doc_paths} not found")
 
     path = output_path / "arborescence.json"
+    # The arborescence depends on all the files, so it is either kept as is or
+    # built again from scratch
+    manifest_path = output_path / MANIFEST_NAME
+    manifest = load_manifest(manifest_path) if incremental else {}
+    entries, changed, removed = diff_manifest(
+        manifest, doc_files_path, doc_paths_F + doc_paths_N
+    )
+    if incremental and path.exists() and not changed and not removed:
+        print(f"No XML file changed, {path} is up to date")
+        save_manifest(manifest_path, entries)
+        return
+
     arborescence = fill_arborescence_with_N_files(doc_paths_N)
     arborescence = complete_arbo_with_F_files(arborescence, doc_paths_F)
 
@@ -327,10 +346,12 @@ def main(doc_files_path, output_path):
 
     with open(path.as_posix(), "w", encoding="utf-8") as out_file:
         json.dump(arborescence, out_file, indent=4, ensure_ascii=False)
+    save_manifest(manifest_path, entries)
 
 
 if __name__ == "__main__":
     parser = argopt(__doc__).parse_args()
     doc_files_path = parser.file_path
     output_path = parser.output_path
-    main(doc_files_path=doc_files_path, output_path=output_path)
+    incremental = bool(parser.incremental)
+    main(doc_files_path=doc_files_path, output_path=output_path, incremental=incremental)
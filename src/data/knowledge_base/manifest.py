@@ -0,0 +1,93 @@
+"""
+Manifest of the SPF XML files used to build a knowledge base, used to only
+reprocess the files that changed since the previous build.
+
+The manifest is a JSON file {relative_path: {"size", "mtime", "hash", ...}}.
+The content hash is only computed when the size or the mtime of a file differ
+from the manifest, so that a file that was extracted again with the same
+content (e.g. from the daily SPF zip) is not considered as changed.
+"""
+
+import hashlib
+import json
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+MANIFEST_NAME = ".manifest.json"
+CHANGELOG_NAME = "changelog.jsonl"
+
+
+def file_hash(path: Path) -> str:
+    md5 = hashlib.md5()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def load_manifest(manifest_path: Path) -> Dict[str, dict]:
+    manifest_path = Path(manifest_path)
+    if not manifest_path.exists():
+        return {}
+    with open(manifest_path) as file:
+        return json.load(file)
+
+
+def save_manifest(manifest_path: Path, manifest: Dict[str, dict]):
+    # Written to a temporary file first so that an interrupted build does not
+    # leave a truncated manifest
+    manifest_path = Path(manifest_path)
+    tmp_path = manifest_path.with_name(manifest_path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=4, ensure_ascii=False, sort_keys=True)
+    tmp_path.replace(manifest_path)
+
+
+def diff_manifest(
+    manifest: Dict[str, dict], root: Path, doc_paths: List[Path]
+) -> Tuple[Dict[str, dict], List[Path], List[str]]:
+    """
+    Compares the files `doc_paths` with the manifest of the previous build.
+
+    :param manifest: The manifest of the previous build
+    :param root: The folder the paths of the manifest are relative to
+    :param doc_paths: The files of the current build
+    :return: The entries of the current files, the paths of the files that are
+        new or changed, and the relative paths of the files that were removed.
+        The entries of the unchanged files are copied from the manifest.
+    """
+    root = Path(root)
+    entries = {}
+    changed = []
+    for doc_path in doc_paths:
+        doc_path = Path(doc_path)
+        key = doc_path.relative_to(root).as_posix()
+        stat = doc_path.stat()
+        previous = manifest.get(key)
+        if (
+            previous
+            and previous["size"] == stat.st_size
+            and previous["mtime"] == stat.st_mtime
+        ):
+            entries[key] = previous
+            continue
+        entry = {"size": stat.st_size, "mtime": stat.st_mtime, "hash": file_hash(doc_path)}
+        if previous and previous["hash"] == entry["hash"]:
+            entries[key] = {**previous, **entry}
+            continue
+        entries[key] = entry
+        changed.append(doc_path)
+    removed = [key for key in manifest if key not in entries]
+    return entries, changed, removed
+
+
+def write_changelog(changelog_path: Path, changes: List[dict]):
+    """
+    Writes the changes of a build, one JSON object per line:
+    {"fiche_id": ..., "action": "upsert" | "delete", "files": [...],
+    "removed_files": [...]} where "files" are the output files to (re)index and
+    "removed_files" the output files whose documents must be deleted.
+    """
+    with open(changelog_path, "w", encoding="utf-8") as file:
+        for change in changes:
+            file.write(json.dumps(change, ensure_ascii=False) + "\n")
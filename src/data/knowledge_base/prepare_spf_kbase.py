@@ -12,20 +12,34 @@ Arguments:
     --cores=<n> CORES       Number of cores to use [default: 1:int]
     --as_json=<j> AS_JSON      Whether or not output JSON files instead of TXT [default: 0:int]
     --as_one=<j> AS_ONE     Whether or not output 1 file for 1 TXT, or consider sub-files [default: 0:int]
+    --incremental=<i> INCREMENTAL  Only treat the fiches that are new or changed (or whose arborescence changed)
+                            since the previous run on <output_path>, and delete the outputs of the removed fiches
+                            [default: 0:int]
+
+A manifest of the treated XML files is kept in <output_path>/.manifest.json and the changes of each run are written to
+<output_path>/changelog.jsonl, so that only the affected documents need to be indexed again.
 """
 import json
+import pickle
 import re
+import shutil
+import tempfile
 import unicodedata
 import xml.etree.ElementTree as ET
+from functools import lru_cache
 from glob import glob
 from pathlib import Path
-from typing import List
+from typing import Callable, Dict, List
 from xml.etree.ElementTree import Element
 
 from argopt import argopt
 from joblib import Parallel, delayed
 from tqdm import tqdm
 
+from src.data.knowledge_base.manifest import (CHANGELOG_NAME, MANIFEST_NAME,
+                                              diff_manifest, load_manifest,
+                                              save_manifest, write_changelog)
+
 TYPE_FICHES = ["associations", "particuliers", "entreprise"]
 ERROR_COUNT = 0
 
@@ -221,41 +235,78 @@ def get_arbo(arbo):
     return res
 
 
-def get_arborescence(arborescence, fiche_id):
-    arborescence = arborescence["data"]
-    for level_1_dict in arborescence:
-        arbo = [level_1_dict]  # used to remember the path to the fiche
-        for level_2_dict in level_1_dict["data"]:
-            if len(arbo) > 1:
-                arbo = arbo[:1]  # keep only the first level
-            arbo.append(level_2_dict)
-            for level_3_dict in level_2_dict["data"]:
-                if len(arbo) > 2:
-                    arbo = arbo[:2]  # keep only up to the 2nd level
-                arbo.append(level_3_dict)
-                if level_3_dict["id"] == fiche_id:
-                    return get_arbo(arbo)
-                elif level_3_dict["type"] == "fiche":
+def build_arborescence_index(arborescence) -> Dict[str, dict]:
+    """
+    Walks the arborescence once and returns a dict {fiche_id: arbo} with the
+    arbo (as returned by get_arbo) of every fiche, dossier or sous-dossier found
+    from the 3rd to the 5th level of the arborescence. When an id appears
+    several times, the first one found is kept, as with a linear search.
+    """
+    index = {}
+
+    def walk(level_dicts, path):
+        for level_dict in level_dicts:
+            arbo = path + [level_dict]
+            if len(arbo) >= 3:
+                index.setdefault(level_dict["id"], get_arbo(arbo))
+                if level_dict["type"] == "fiche":
                     continue
-                else:
-                    for level_4_dict in level_3_dict["data"]:
-                        if len(arbo) > 3:
-                            arbo = arbo[:3]  # keep only up to the 3rd level
-                        arbo.append(level_4_dict)
-                        if level_4_dict["id"] == fiche_id:
-                            return get_arbo(arbo)
-                        elif level_4_dict["type"] == "fiche":
-                            continue
-                        else:
-                            try:
-                                for level_5_dict in level_4_dict["data"]:
-                                    if len(arbo) > 4:
-                                        arbo = arbo[:4]  # keep only up to the 4th level
-                                    arbo.append(level_5_dict)
-                                    if level_5_dict["id"] == fiche_id:
-                                        return get_arbo(arbo)
-                            except:
-                                print("You should not be here")
+            if len(arbo) < 5:
+                walk(level_dict.get("data", []), arbo)
+
+    walk(arborescence["data"], [])
+    return index
+
+
+def get_arborescence(arborescence, fiche_id):
+    return build_arborescence_index(arborescence).get(fiche_id)
+
+
+def save_arborescence_index(path_arbo: Path, index_dir: Path) -> Path:
+    """
+    Builds the index of the arborescence.json file `path_arbo` and pickles it
+    in `index_dir`, so that it is loaded once by each worker instead of being
+    sent along with every fiche.
+
+    :return: The path of the pickled index
+    """
+    with open(path_arbo) as file:
+        index = build_arborescence_index(json.load(file))
+    path_index = Path(index_dir) / "arborescence_index.pkl"
+    with open(path_index, "wb") as file:
+        pickle.dump(index, file, protocol=pickle.HIGHEST_PROTOCOL)
+    return path_index
+
+
+@lru_cache(maxsize=1)
+def load_arborescence_index(path_index: Path) -> Dict[str, dict]:
+    with open(path_index, "rb") as file:
+        return pickle.load(file)
+
+
+def parse_fiche(doc_path: Path, tag: str, handle: Callable[[Element], None]) -> Element:
+    """
+    Parses the XML fiche `doc_path` with iterparse. Each outermost `tag`
+    element is passed to `handle` as soon as it is complete and is cleared
+    right after, so that its subtree is not kept in memory.
+
+    :return: The root of the fiche, without the content of the `tag` elements
+    """
+    root = None
+    depth = 0
+    for event, elem in ET.iterparse(doc_path, events=("start", "end")):
+        if root is None:
+            root = elem
+        if elem.tag != tag:
+            continue
+        if event == "start":
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                handle(elem)
+                elem.clear()
+    return root
 
 
 def try_get_text(root: Element, tag: str) -> str:
@@ -376,13 +427,10 @@ def try_get_title_fiche(child):
         return ""
 
 
-def treat_no_situation_fiche(root: Element):
+def treat_no_situation_fiche(fiche_text_list: List[List[str]]):
     # it is a fiche without situations
 
     fiche_text = ""
-    fiche_text_list = []
-    for paragraph in root.iter("Paragraphe"):
-        fiche_text_list.append(list(paragraph.itertext()))
     fiche_text_list = [" ".join(t) for t in fiche_text_list]
     if fiche_text_list:
         fiche_text = "\n".join(fiche_text_list)
@@ -409,24 +457,65 @@ def clean_elements(root: Element):
     tags = [tags[i] for i, t in enumerate(tag_names) if "http" not in t]
 
 
-def run(doc_path: Path, output_path: Path, path_arbo: Path, as_json: bool):
+def run(doc_path: Path, output_path: Path, path_index: Path, as_json: bool):
     global ERROR_COUNT
-    has_situations = True
     has_chapitres = True
     has_cases = True
-    with open(path_arbo) as file:
-        arborescence_file = json.load(file)
+    arborescence_index = load_arborescence_index(path_index)
+    # The sub-fiches are extracted while the fiche is parsed and saved once
+    # the title and the introduction of the fiche are known
+    subfiches = []
+
+    def extract_situation(situation):
+        nonlocal has_chapitres, has_cases
+        situation_text = try_get_situation_text(situation)
+        situation_title = try_get_situation_title(situation)  # kinda hacky :/
+        chapitres = list(situation.iter("Chapitre"))
+        if not chapitres:
+            chapitres = [situation]
+            has_chapitres = False
+        for chapitre in chapitres:
+            # chapitre_title = list(chapitre.iter("Titre"))[0].find("Paragraphe").text
+            chapitre_text, chapitre_title = "", ""
+            if has_chapitres:
+                chapitre_title = try_get_chapitre_title(chapitre)
+                chapitre_text = try_get_chapitre_text(chapitre)
+            cases = list(chapitre.iter("Cas"))
+            if not cases:
+                #  There aren't any cases, so we treat the chapitre element as the single case. This is hacky
+                cases = [chapitre]
+                has_cases = False
+            for cas in cases:
+                # cas_title = cas.find("Titre").find("Paragraphe").text
+                if len(cases) == 1:
+                    cas_title = ""
+                else:
+                    cas_title = try_get_title_cas(cas)
+                cas_text_list = []
+                for cas_paragraph in cas.iter("Paragraphe"):
+                    cas_text_list.append(list(cas_paragraph.itertext()))
+                cas_text_list = [" ".join(t) for t in cas_text_list]
+                cas_text = "\n".join(cas_text_list)
+                subfiches.append(
+                    dict(
+                        situation_title=situation_title,
+                        situation_text=situation_text,
+                        chapitre_title=chapitre_title,
+                        chapitre_text=chapitre_text,
+                        cas_title=cas_title,
+                        cas_text=cas_text,
+                    )
+                )
+
     try:
         tqdm.write(f"Extracting info from {doc_path}")
-        tree = ET.parse(doc_path)
-        root = tree.getroot()
+        root = parse_fiche(doc_path, "Situation", extract_situation)
         fiche_title = list(list(root.iter("Publication"))[0])[0].text
         introduction_text = try_get_text(root, "Introduction")
-        situations = list(root.iter("Situation"))
         fiche_id = re.search("[a-zA-Z0-9]*(?=\.xml)", str(doc_path)).group()
-        arborescence = get_arborescence(arborescence_file, fiche_id)
+        arborescence = arborescence_index.get(fiche_id)
 
-        if not situations:
+        if not subfiches:
             #     tqdm.write(f"\tFile {doc_path} has no situations !")
             #     subfiche_text = treat_no_situation_fiche(root)
             #     if subfiche_text:
@@ -440,52 +529,18 @@ def run(doc_path: Path, output_path: Path, path_arbo: Path, as_json: bool):
             for alt in alternative_tags:
                 found_tag = root.find(alt)
                 if root.find(alt):
-                    situations = [found_tag]
+                    extract_situation(found_tag)
                     break
-            has_situations = False
-        for situation in situations:
-            situation_text = try_get_situation_text(situation)
-            situation_title = try_get_situation_title(situation)  # kinda hacky :/
-            chapitres = list(situation.iter("Chapitre"))
-            if not chapitres:
-                chapitres = [situation]
-                has_chapitres = False
-            for chapitre in chapitres:
-                # chapitre_title = list(chapitre.iter("Titre"))[0].find("Paragraphe").text
-                chapitre_text, chapitre_title = "", ""
-                if has_chapitres:
-                    chapitre_title = try_get_chapitre_title(chapitre)
-                    chapitre_text = try_get_chapitre_text(chapitre)
-                cases = list(chapitre.iter("Cas"))
-                if not cases:
-                    #  There aren't any cases, so we treat the chapitre element as the single case. This is hacky
-                    cases = [chapitre]
-                    has_cases = False
-                for cas in cases:
-                    # cas_title = cas.find("Titre").find("Paragraphe").text
-                    if len(cases) == 1:
-                        cas_title = ""
-                    else:
-                        cas_title = try_get_title_cas(cas)
-                    cas_text_list = []
-                    for cas_paragraph in cas.iter("Paragraphe"):
-                        cas_text_list.append(list(cas_paragraph.itertext()))
-                    cas_text_list = [" ".join(t) for t in cas_text_list]
-                    cas_text = "\n".join(cas_text_list)
-                    save_subfiche(
-                        doc_path=doc_path,
-                        fiche_title=fiche_title,
-                        fiche_intro_text=introduction_text,
-                        situation_title=situation_title,
-                        situation_text=situation_text,
-                        chapitre_title=chapitre_title,
-                        chapitre_text=chapitre_text,
-                        cas_title=cas_title,
-                        cas_text=cas_text,
-                        arborescence=arborescence,
-                        output_path=output_path,
-                        as_json=as_json,
-                    )
+        for subfiche in subfiches:
+            save_subfiche(
+                doc_path=doc_path,
+                fiche_title=fiche_title,
+                fiche_intro_text=introduction_text,
+                arborescence=arborescence,
+                output_path=output_path,
+                as_json=as_json,
+                **subfiche,
+            )
 
         return 1
     except Exception as e:
@@ -495,21 +550,24 @@ def run(doc_path: Path, output_path: Path, path_arbo: Path, as_json: bool):
         return 0
 
 
-def run_fiche_as_one(doc_path: Path, path_arbo: Path, output_path: Path, as_json: bool):
+def run_fiche_as_one(doc_path: Path, path_index: Path, output_path: Path, as_json: bool):
     global ERROR_COUNT
     fiche_text = ""
 
     try:
         tqdm.write(f"Extracting info from {doc_path}")
-        with open(path_arbo) as file:
-            arborescence_file = json.load(file)
-        tree = ET.parse(doc_path)
-        root = tree.getroot()
+        arborescence_index = load_arborescence_index(path_index)
+        fiche_text_list = []
+        root = parse_fiche(
+            doc_path,
+            "Paragraphe",
+            lambda paragraph: fiche_text_list.append(list(paragraph.itertext())),
+        )
         fiche_title = list(list(root.iter("Publication"))[0])[0].text
-        fiche_text += treat_no_situation_fiche(root)
+        fiche_text += treat_no_situation_fiche(fiche_text_list)
         fiche_id = re.search("[a-zA-Z0-9]*(?=\.xml)", str(doc_path)).group()
 
-        arborescence = get_arborescence(arborescence_file, fiche_id)
+        arborescence = arborescence_index.get(fiche_id)
 
         save_fiche_as_one(
             doc_path=doc_path,
@@ -527,6 +585,17 @@ def run_fiche_as_one(doc_path: Path, path_arbo: Path, output_path: Path, as_json
         return 0
 
 
+def fiche_outputs(output_path: Path, fiche_id: str) -> List[str]:
+    """
+    Returns the names of the files saved in `output_path` for the fiche
+    `fiche_id`, either as one file or as sub-fiches.
+    """
+    outputs = list(output_path.glob(f"{fiche_id}.*")) + list(
+        output_path.glob(f"{fiche_id}--*")
+    )
+    return sorted(p.name for p in outputs)
+
+
 def main(
     doc_files_path: str,
     output_path: str,
@@ -534,34 +603,102 @@ def main(
     as_json: bool,
     n_jobs: int,
     as_one: bool,
+    incremental: bool = False,
 ):
     doc_files_path = Path(doc_files_path)
     output_path = Path(output_path)
     path_arbo = Path(path_arbo)
     if not doc_files_path.is_dir() and doc_files_path.is_file():
         doc_paths = [doc_files_path]
+        doc_root = doc_files_path.parent
     else:
         doc_paths = glob(doc_files_path.as_posix() + "/**/F*.xml", recursive=True)
         doc_paths += glob(doc_files_path.as_posix() + "/**/N*.xml", recursive=True)
         doc_paths = [Path(p) for p in doc_paths]
+        doc_root = doc_files_path
     if not doc_paths:
         raise Exception(f"Path {doc_paths} not found")
 
-    if n_jobs < 2:
-        job_output = []
-        for doc_path in tqdm(doc_paths):
-            tqdm.write(f"Converting file {doc_path}")
-            if as_one:
-                job_output.append(
-                    run_fiche_as_one(doc_path, path_arbo, output_path, as_json)
-                )
-            else:
-                job_output.append(run(doc_path, output_path, path_arbo, as_json))
-    else:
-        job_output = Parallel(n_jobs=n_jobs)(
-            delayed(run)(doc_path, output_path, path_arbo, as_json)
-            for doc_path in tqdm(doc_paths)
+    manifest_path = output_path / MANIFEST_NAME
+    manifest = load_manifest(manifest_path) if incremental else {}
+    entries, changed_paths, removed_keys = diff_manifest(manifest, doc_root, doc_paths)
+
+    # The arborescence is indexed once and each worker loads the index once
+    index_dir = Path(tempfile.mkdtemp())
+    try:
+        path_index = save_arborescence_index(path_arbo, index_dir)
+        arborescence_index = load_arborescence_index(path_index)
+
+        # A fiche is also treated again when its place in the arborescence
+        # changed, since the arborescence is saved with the fiche
+        changed_paths = set(changed_paths)
+        todo_paths = []
+        for doc_path in doc_paths:
+            entry = entries[doc_path.relative_to(doc_root).as_posix()]
+            arborescence = arborescence_index.get(doc_path.stem)
+            if doc_path in changed_paths or entry.get("arborescence") != arborescence:
+                entry["arborescence"] = arborescence
+                todo_paths.append(doc_path)
+        tqdm.write(
+            f"{len(todo_paths)} fiches to treat, {len(doc_paths) - len(todo_paths)} unchanged fiches, "
+            f"{len(removed_keys)} removed fiches"
+        )
+
+        # The outputs of the fiches treated again are replaced
+        previous_outputs = {}
+        for doc_path in todo_paths:
+            previous_outputs[doc_path] = fiche_outputs(output_path, doc_path.stem)
+            for name in previous_outputs[doc_path]:
+                (output_path / name).unlink()
+
+        if n_jobs < 2:
+            job_output = []
+            for doc_path in tqdm(todo_paths):
+                tqdm.write(f"Converting file {doc_path}")
+                if as_one:
+                    job_output.append(
+                        run_fiche_as_one(doc_path, path_index, output_path, as_json)
+                    )
+                else:
+                    job_output.append(run(doc_path, output_path, path_index, as_json))
+        else:
+            job_output = Parallel(n_jobs=n_jobs)(
+                delayed(run)(doc_path, output_path, path_index, as_json)
+                for doc_path in tqdm(todo_paths)
+            )
+    finally:
+        shutil.rmtree(index_dir, ignore_errors=True)
+
+    changes = []
+    for doc_path in todo_paths:
+        entry = entries[doc_path.relative_to(doc_root).as_posix()]
+        entry["outputs"] = fiche_outputs(output_path, doc_path.stem)
+        changes.append(
+            {
+                "fiche_id": doc_path.stem,
+                "action": "upsert",
+                "files": entry["outputs"],
+                "removed_files": sorted(
+                    set(previous_outputs[doc_path]) - set(entry["outputs"])
+                ),
+            }
         )
+    for key in removed_keys:
+        removed_files = manifest[key].get("outputs", [])
+        for name in removed_files:
+            if (output_path / name).exists():
+                (output_path / name).unlink()
+        changes.append(
+            {
+                "fiche_id": Path(key).stem,
+                "action": "delete",
+                "files": [],
+                "removed_files": removed_files,
+            }
+        )
+    write_changelog(output_path / CHANGELOG_NAME, changes)
+    save_manifest(manifest_path, entries)
+
     tqdm.write(
         f"{sum(job_output)} XML fiche files were extracted to TXT. {len(job_output) - sum(job_output)} files "
         f"had some error."
@@ -578,6 +715,7 @@ if __name__ == "__main__":
     n_jobs = parser.cores
     as_json = bool(parser.as_json)
     as_one = bool(parser.as_one)
+    incremental = bool(parser.incremental)
     main(
         doc_files_path=doc_files_path,
         output_path=output_path,
@@ -585,4 +723,5 @@ if __name__ == "__main__":
         as_json=as_json,
         n_jobs=n_jobs,
         as_one=as_one,
+        incremental=incremental,
     )
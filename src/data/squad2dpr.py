@@ -7,6 +7,9 @@ Arguments:
     <squad_file_path>                   SQuAD file path
     <dpr_output_path>                   DPR output folder path
     --num_hard_negative_ctxs HNEG       Number of hard negative contexts [default: 30:int]
+    --batch_size BATCH                  Number of questions retrieved together [default: 1:int]
+    --n_workers WORKERS                 Number of processes filtering the hard negative contexts [default: 1:int]
+    --jsonl                             Save the splits as JSON Lines files
 """
 import argparse
 import json
@@ -14,6 +17,7 @@ import logging
 import random
 import subprocess
 from itertools import islice
+from multiprocessing import Pool
 from pathlib import Path
 from time import sleep
 from typing import Dict, Iterator, Tuple
@@ -29,6 +33,8 @@ from haystack.retriever.dense import DensePassageRetriever  # keep it here !
 from haystack.retriever.sparse import ElasticsearchRetriever  # keep it here !
 from tqdm import tqdm
 
+from src.evaluation.utils.batch_pipeline import batched_calls
+
 random.seed(42)
 
 """
@@ -143,82 +149,152 @@ def get_number_of_questions(squad_data: dict):
     return nb_questions
 
 
+def iter_questions(squad_data: dict):
+    for article in squad_data:
+        for paragraph in article["paragraphs"]:
+            for question in paragraph["qas"]:
+                yield article["title"], paragraph["context"], question
+
+
+def retrieve_batches(
+    retriever: BaseRetriever, questions: Iterator, n_ctxs: int = 30, batch_size: int = 1
+):
+    """
+    Yields (article_title, context, question, retrieved_docs) for each item of questions, retrieved_docs being the
+    list of the (name, text) of the n_ctxs documents retrieved for the question. The documents of batch_size questions
+    are retrieved together: with one _msearch request for an ElasticsearchRetriever, with one batch of query
+    embeddings for a dense retriever.
+    """
+    questions = iter(questions)
+    while True:
+        batch = list(islice(questions, batch_size))
+        if not batch:
+            return
+        queries = [question["question"] for _, _, question in batch]
+        with batched_calls(retriever, queries, []):
+            for article_title, context, question in batch:
+                retrieved_docs = retriever.retrieve(
+                    query=question["question"], top_k=n_ctxs, index="document"
+                )
+                retrieved_docs = [(doc.meta["name"], doc.text) for doc in retrieved_docs]
+                yield article_title, context, question, retrieved_docs
+
+
+def make_dpr_example(item):
+    """
+    Returns the DPR example of an item of retrieve_batches, or None if it has no hard negative or positive context.
+    """
+    article_title, context, question, retrieved_docs = item
+    answers = [a["text"] for a in question["answers"]]
+    hard_negative_ctxs = filter_hard_negative_context(retrieved_docs, answers[0])
+    positive_ctxs = [
+        {"title": f"{article_title}_{i}", "text": c}
+        for i, c in enumerate([context for _ in question["answers"]])
+    ]
+
+    if not hard_negative_ctxs or not positive_ctxs:
+        return None
+    return {
+        "question": question["question"],
+        "answers": answers,
+        "positive_ctxs": positive_ctxs,
+        "negative_ctxs": [],
+        "hard_negative_ctxs": hard_negative_ctxs,
+    }
+
+
 def create_dpr_training_dataset(
-    squad_data: dict, retriever: BaseRetriever, num_hard_negative_ctxs: int = 30
+    squad_data: dict,
+    retriever: BaseRetriever,
+    num_hard_negative_ctxs: int = 30,
+    batch_size: int = 1,
+    n_workers: int = 1,
 ):
+    """
+    Yields the DPR examples of the questions of squad_data, in the same order.
+
+    :param batch_size: Number of questions whose contexts are retrieved together
+    :param n_workers: Number of processes filtering out the retrieved contexts that contain the answer, while the
+                      contexts of the next questions are retrieved
+    """
     n_non_added_questions = 0
     n_questions = 0
-    for idx_article, article in enumerate(tqdm(squad_data, unit="article")):
-        article_title = article["title"]
-        for paragraph in article["paragraphs"]:
-            context = paragraph["context"]
-            for question in paragraph["qas"]:
-                answers = [a["text"] for a in question["answers"]]
-                hard_negative_ctxs = get_hard_negative_context(
-                    retriever=retriever,
-                    question=question["question"],
-                    answer=answers[0],
-                    n_ctxs=num_hard_negative_ctxs,
+    items = retrieve_batches(
+        retriever, iter_questions(squad_data), num_hard_negative_ctxs, batch_size
+    )
+    pool = Pool(n_workers) if n_workers > 1 else None
+    try:
+        if pool:
+            examples = pool.imap(make_dpr_example, items, chunksize=max(batch_size // n_workers, 1))
+        else:
+            examples = map(make_dpr_example, items)
+        questions = iter_questions(squad_data)
+        for (article_title, _, question), dict_DPR in zip(
+            questions, tqdm(examples, unit="question", total=get_number_of_questions(squad_data))
+        ):
+            if dict_DPR is None:
+                logging.error(
+                    f"No retrieved candidates for article {article_title}, with question {question['question']}"
                 )
-                positive_ctxs = [
-                    {"title": f"{article_title}_{i}", "text": c}
-                    for i, c in enumerate([context for _ in question["answers"]])
-                ]
-
-                if not hard_negative_ctxs or not positive_ctxs:
-                    logging.error(
-                        f"No retrieved candidates for article {article_title}, with question {question['question']}"
-                    )
-                    n_non_added_questions += 1
-                    continue
-                dict_DPR = {
-                    "question": question["question"],
-                    "answers": answers,
-                    "positive_ctxs": positive_ctxs,
-                    "negative_ctxs": [],
-                    "hard_negative_ctxs": hard_negative_ctxs,
-                }
-                n_questions += 1
-                yield dict_DPR
+                n_non_added_questions += 1
+                continue
+            n_questions += 1
+            yield dict_DPR
+    finally:
+        if pool:
+            pool.terminate()
 
     print(f"Number of not added questions : {n_non_added_questions} / {n_questions}")
 
 
 def split_and_save_dataset(
-    iter_dpr: Iterator, dpr_output_path: Path, total_nb_questions: int
+    iter_dpr: Iterator, dpr_output_path: Path, total_nb_questions: int, jsonl: bool = False
 ):
+    """
+    Saves the first 80% of the examples of iter_dpr in DPR_train.json, the next 10% in DPR_dev.json and the rest in
+    DPR_test.json. With jsonl, the examples are written one per line in .jsonl files as they are created.
+    """
     nb_train_examples = int(total_nb_questions * 0.8)
     nb_dev_examples = int(total_nb_questions * 0.1)
 
     train_iter = islice(iter_dpr, nb_train_examples)
     dev_iter = islice(iter_dpr, nb_dev_examples)
 
+    extension = ".jsonl" if jsonl else ".json"
     dataset_splits = {
-        dpr_output_path / Path("DPR_train.json"): train_iter,
-        dpr_output_path / Path("DPR_dev.json"): dev_iter,
-        dpr_output_path / Path("DPR_test.json"): iter_dpr,
+        dpr_output_path / Path(f"DPR_train{extension}"): train_iter,
+        dpr_output_path / Path(f"DPR_dev{extension}"): dev_iter,
+        dpr_output_path / Path(f"DPR_test{extension}"): iter_dpr,
     }
 
     for path, set_iter in dataset_splits.items():
         with open(path, "w") as json_ds:
-            json.dump(IteratorAsList(set_iter), json_ds, indent=4)
+            if jsonl:
+                for dict_DPR in set_iter:
+                    json_ds.write(json.dumps(dict_DPR) + "\n")
+            else:
+                json.dump(IteratorAsList(set_iter), json_ds, indent=4)
+
+
+def filter_hard_negative_context(retrieved_docs, answer: str):
+    """
+    Returns the retrieved documents, given as (name, text) pairs, that do not contain the answer.
+    """
+    answer = answer.lower()
+    return [
+        {"title": name, "text": text}
+        for name, text in retrieved_docs
+        if answer not in text.lower()
+    ]
 
 
 def get_hard_negative_context(
     retriever: BaseRetriever, question: str, answer: str, n_ctxs: int = 30
 ):
-    list_hard_neg_ctxs = []
     retrieved_docs = retriever.retrieve(query=question, top_k=n_ctxs, index="document")
-    for retrieved_doc in retrieved_docs:
-        retrieved_doc_id = retrieved_doc.meta["name"]
-        retrieved_doc_text = retrieved_doc.text
-        if answer.lower() in retrieved_doc_text.lower():
-            continue
-        list_hard_neg_ctxs.append(
-            {"title": retrieved_doc_id, "text": retrieved_doc_text}
-        )
-
-    return list_hard_neg_ctxs
+    return filter_hard_negative_context(
+        [(doc.meta["name"], doc.text) for doc in retrieved_docs], answer
+    )
 
 
 def load_squad_file(squad_file_path: Path):
@@ -232,6 +308,9 @@ def main(
     document_store_type_config: Tuple[str, Dict] = ("ElasticsearchDocumentStore", {}),
     retriever_type_config: Tuple[str, Dict] = ("ElasticsearchRetriever", {}),
     num_hard_negative_ctxs: int = 30,
+    batch_size: int = 1,
+    n_workers: int = 1,
+    jsonl: bool = False,
 ):
     tqdm.write(f"Using SQuAD-like file {squad_file_path}")
 
@@ -270,6 +349,8 @@ def main(
         squad_data=squad_data,
         retriever=retriever,
         num_hard_negative_ctxs=num_hard_negative_ctxs,
+        batch_size=batch_size,
+        n_workers=n_workers,
     )
 
     # 7. Split (train, dev, test) and save dataset
@@ -278,6 +359,7 @@ def main(
         iter_dpr=iter_DPR,
         dpr_output_path=dpr_output_path,
         total_nb_questions=total_nb_questions,
+        jsonl=jsonl,
     )
 
 
@@ -306,6 +388,26 @@ if __name__ == "__main__":
         metavar="num_hard_negative_ctxs",
         default=30,
     )
+    parser.add_argument(
+        "--batch_size",
+        dest="batch_size",
+        help="Number of questions retrieved together with one multi-search request",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--n_workers",
+        dest="n_workers",
+        help="Number of processes filtering the hard negative contexts",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--jsonl",
+        dest="jsonl",
+        help="Save the splits as JSON Lines files, written as the examples are created",
+        action="store_true",
+    )
     args = parser.parse_args()
 
     preprocessor = PreProcessor(
@@ -335,4 +437,7 @@ if __name__ == "__main__":
         # retriever_type_config=("ElasticsearchRetriever", retriever_bm25_config), # dpr
         retriever_type_config=("ElasticsearchRetriever", retriever_bm25_config),  # bm25
         num_hard_negative_ctxs=num_hard_negative_ctxs,
+        batch_size=args.batch_size,
+        n_workers=args.n_workers,
+        jsonl=args.jsonl,
     )
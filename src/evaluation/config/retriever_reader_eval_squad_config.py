@@ -8,6 +8,30 @@ parameters = {
     "retriever_model_version": ["fcd5c2bb3e3aa74cd765d793fb576705e4ea797e"],
     "dpr_model_version": ["v1.0"],
     "retriever_type": ["dpr"], # Can be bm25, sbert, dpr, title or title_bm25
+    # Dense retrieval backend: "elasticsearch" (exact script_score search) or
+    # the faiss index factory string of an in-process index, e.g. "HNSW32" or
+    # "IVF256,Flat". The faiss index is saved next to the pipeline yaml.
+    "dense_index": ["elasticsearch"],
+    # BM25 backend when retriever_type == bm25: "elasticsearch" or "local"
+    # for the in-memory BM25DocumentStore, which does not need Elasticsearch.
+    "bm25_backend": ["elasticsearch"],
+    # Reader backend: "pytorch", or "onnx" to run the reader quantized to int8
+    # with onnxruntime on CPU. The exported model is cached in ./.cache/onnx.
+    "reader_backend": ["pytorch"],
+    # Adaptive number of documents read, for the single retriever pipelines
+    # (bm25, sbert, dpr, title): None reads the k_retriever documents,
+    # "score_gap" keeps the documents whose score is within pruning_threshold
+    # (relative) of the top hit, "cumulative_score" keeps the top documents
+    # holding pruning_threshold of the total score. k_retriever is the maximum
+    # and pruning_min_k the minimum number of documents read.
+    "pruning_mode": [None],
+    "pruning_threshold": [0.5],
+    "pruning_min_k": [1],
+    # Number of documents kept for the reader by a cross-encoder re-ranking
+    # the retrieved ones (k_retriever, or the joined ones for title_bm25).
+    # None disables the re-ranking. The scores are cached in ./.cache.
+    "k_reranker": [None],
+    "reranker_model_version": [None],
     "squad_dataset": ["./clients/cnil/knowledge_base/squad.json"],
     "filter_level": [None],
     "preprocessing": [False],
@@ -24,11 +48,58 @@ parameter_tuning_options = {
     # Tuning method alternatives:
     # - "optimization": use bayesian optimisation
     # - "grid_search"
+    # - "multi_objective": grid search logging the Pareto front of accuracy
+    #   versus latency to MLflow
+    # - "successive_halving": grid search evaluating the configs on growing
+    #   samples of the questions, keeping the best ones at each step
     "tuning_method": "grid_search",
 
     # Additionnal options for the grid search method
     "use_cache": False,
+    # Number of runs done in parallel, each one in its own process and with
+    # its own Elasticsearch indices (also used by the optimization method)
+    "n_workers": 1,
+    # Do the runs that only differ on k_retriever, k_title_retriever and
+    # k_reader_total together: the documents are retrieved once for the
+    # largest k and the reader predictions are shared.
+    "k_sweep": False,
 
-    # Additionnal options for the optimization method
+    # Additionnal options for the multi_objective method. The runs are done
+    # without k_sweep and without the prediction caches. If latency_budget (in
+    # seconds) is set, the most accurate run within the budget is logged.
+    "latency_metric": "query_latency_p95",
+    "latency_budget": None,
+
+    # Additionnal options for the successive_halving method: the configs are
+    # first evaluated on halving_min_fraction of the questions, and the best
+    # 1 / halving_eta of them are evaluated on halving_eta times more
+    # questions, up to all the questions. reuse_index avoids rebuilding the
+    # indices of a config at each step.
+    "halving_min_fraction": 0.1,
+    "halving_eta": 3,
+
+    # Additionnal options for the optimization method. With n_workers > 1,
+    # the runs are done in parallel, each new point being proposed by the
+    # optimizer as soon as a run finishes.
     "optimization_ncalls": 10,
+    # Start from the evaluations dumped in ./output/optimize_result.z by a
+    # previous optimization, and do optimization_ncalls more runs.
+    "optimization_resume": False,
+
+    # Keep the Elasticsearch indices built for a run and reuse them in the
+    # following runs with the same knowledge base, preprocessing, boosting and
+    # embeddings. The indices are named after a hash of these parameters and
+    # must be deleted by hand when they are not needed anymore.
+    "reuse_index": False,
+
+    # Read the reader predictions and the re-ranker scores computed by the
+    # previous runs from their caches. The accuracy is the same, but the
+    # latencies then measure cache hits rather than the models: the share of
+    # the reader predictions read from the cache is logged as the metric
+    # reader_cache_hit_rate. Always False with the multi_objective method.
+    "cache_predictions": True,
+
+    # Number of questions sent together through the pipeline (batched
+    # retrieval and reader forward passes). None runs the questions one by one.
+    "batch_size": None,
 }
@@ -7,7 +7,7 @@ from pathlib import Path
 from pprint import pprint
 
 from deployment.roles.haystack.files.custom_component import \
-        TitleEmbeddingRetriever
+        TitleEmbeddingRetriever, cached_embeddings, stream_eval_data
 
 from farm.utils import initialize_device_settings
 from haystack.document_store.elasticsearch import ElasticsearchDocumentStore
@@ -24,10 +24,12 @@ from src.evaluation.utils.elasticsearch_management import (delete_indices,
                                                            launch_ES,
                                                            prepare_mapping)
 from src.evaluation.utils import epitca_retriever
-from src.evaluation.utils.utils_eval import eval_retriever, save_results
+from src.evaluation.utils.utils_eval import eval_retriever_at_k, save_results
 
 import src.evaluation.utils.pipelines as pipelines
 
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR") or "./.cache/embeddings"
+
 device, n_gpu = initialize_device_settings(use_cuda=True)
 GPU_AVAILABLE = 1 if device.type == "cuda" else 0
 
@@ -44,12 +46,25 @@ def single_run(parameters, elasticsearch_hostname, elasticsearch_port,
     :param parameters: A dict with diverse config options 
     :return: A dict with the results obtained running the experiment with these parameters
     """
+    return sweep_run([parameters], elasticsearch_hostname, elasticsearch_port,
+            yaml_dir_prefix = yaml_dir_prefix)[0]
+
+
+def sweep_run(parameters_list, elasticsearch_hostname, elasticsearch_port,
+        yaml_dir_prefix = "./output/pipelines/retriever"):
+    """
+    Runs the grid search configs of parameters_list, that only differ on k.
+    The documents are retrieved once for the largest k and the results for the
+    smaller k are computed on the first k documents.
+
+    :param parameters_list: A list of dicts with diverse config options
+    :return: The list of the results obtained for each dict of parameters_list
+    """
     # col names
+    parameters = parameters_list[0]
     evaluation_data = Path(parameters["squad_dataset"])
     retriever_type = parameters["retriever_type"]
-    k = parameters["k"]
     epitca_perf_file = parameters["epitca_perf_file"]
-    experiment_id = hashlib.md5(str(parameters).encode("utf-8")).hexdigest()[:4]
 
     # deleted indice for elastic search to make sure mappings are properly passed
     delete_indices(index="document_elasticsearch")
@@ -72,7 +87,8 @@ def single_run(parameters, elasticsearch_hostname, elasticsearch_port,
         preprocessor = None
 
     # Add evaluation data to Elasticsearch document store
-    document_store.add_eval_data(
+    stream_eval_data(
+        document_store,
         evaluation_data.as_posix(),
         doc_index="document_elasticsearch",
         label_index="label_elasticsearch",
@@ -83,8 +99,9 @@ def single_run(parameters, elasticsearch_hostname, elasticsearch_port,
 
     if type(retriever) in [DensePassageRetriever, TitleEmbeddingRetriever, 
             EmbeddingRetriever]:
-        document_store.update_embeddings(retriever,
-                index="document_elasticsearch")
+        with cached_embeddings(retriever, EMBEDDING_CACHE_DIR):
+            document_store.update_embeddings(retriever,
+                    index="document_elasticsearch")
 
     if epitca_perf_file:
         expected_answers = epitca_retriever.load_perf_file_expected_answer(epitca_perf_file)
@@ -95,34 +112,53 @@ def single_run(parameters, elasticsearch_hostname, elasticsearch_port,
         custom_evaluation_questions = None
         get_doc_id = lambda doc: doc.id
 
-    retriever_eval_results = eval_retriever(
+    retriever_eval_results_at_k = eval_retriever_at_k(
         document_store=document_store,
         pipeline=p,
-        top_k=k,
+        ks=[params["k"] for params in parameters_list],
         label_index="label_elasticsearch",
         doc_index="document_elasticsearch",
         question_label_dict_list=custom_evaluation_questions,
         get_doc_id=get_doc_id,
     )
 
-    # Retriever Recall is the proportion of questions for which the correct document containing the answer is
-    # among the correct documents
-    print("Retriever Recall:", retriever_eval_results["recall"])
-    # Retriever Mean Avg Precision rewards retrievers that give relevant documents a higher rank
-    print("Retriever Mean Avg Precision:", retriever_eval_results["map"])
-
-    retriever_eval_results.update(parameters)
-    retriever_eval_results.update(
-        {
-            "date": datetime.today().strftime("%Y-%m-%d_%H-%M-%S"),
-            "hostname": socket.gethostname(),
-            "experiment_id": experiment_id,
-        }
-    )
+    results = []
+    for params in parameters_list:
+        retriever_eval_results = dict(retriever_eval_results_at_k[params["k"]])
+        experiment_id = hashlib.md5(str(params).encode("utf-8")).hexdigest()[:4]
+        pipelines.save_pipeline_yaml(p, params, prefix = Path(yaml_dir_prefix))
+
+        # Retriever Recall is the proportion of questions for which the correct document containing the answer is
+        # among the correct documents
+        print("Retriever Recall:", retriever_eval_results["recall"])
+        # Retriever Mean Avg Precision rewards retrievers that give relevant documents a higher rank
+        print("Retriever Mean Avg Precision:", retriever_eval_results["map"])
+
+        retriever_eval_results.update(params)
+        retriever_eval_results.update(
+            {
+                "date": datetime.today().strftime("%Y-%m-%d_%H-%M-%S"),
+                "hostname": socket.gethostname(),
+                "experiment_id": experiment_id,
+            }
+        )
+
+        pprint(retriever_eval_results)
+        results.append(retriever_eval_results)
 
-    pprint(retriever_eval_results)
+    return results
 
-    return retriever_eval_results
+
+def group_k_sweeps(parameters_grid):
+    """
+    Returns the list of the groups of configs of parameters_grid that only
+    differ on k, in the order of the grid.
+    """
+    groups = {}
+    for param in parameters_grid:
+        key = repr(sorted((k, v) for k, v in param.items() if k != "k"))
+        groups.setdefault(key, []).append(param)
+    return list(groups.values())
 
 
 if __name__ == "__main__":
@@ -135,10 +171,11 @@ if __name__ == "__main__":
 
     all_results = []
     launch_ES()
-    for param in tqdm(parameters_grid, desc="GridSearch"):
+    # The configs that only differ on k are evaluated with one retrieval
+    for parameters_list in tqdm(group_k_sweeps(parameters_grid), desc="GridSearch"):
         # START XP
-        run_results = single_run(param, elasticsearch_hostname,
+        list_run_results = sweep_run(parameters_list, elasticsearch_hostname,
                 elasticsearch_port,
                 yaml_dir_prefix = "./output/pipelines/retriever")
         # all_results.append(run_results)
-        save_results(result_file_path=result_file_path, results_list=run_results)
+        save_results(result_file_path=result_file_path, results_list=list_run_results)
@@ -1,13 +1,22 @@
+import copy
+import json
 import logging
+import multiprocessing
 import os
 import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, \
+    as_completed, wait
+from contextlib import ExitStack, contextmanager, nullcontext
 from pathlib import Path
 
+import numpy as np
 import torch
 
 from deployment.roles.haystack.files.custom_component import \
-        TitleEmbeddingRetriever
+        JoinDocumentsCustom, ReaderPredictionCache, TitleEmbeddingRetriever, \
+        cached_embeddings, enable_prediction_cache, stream_eval_data
 
+from haystack.document_store.elasticsearch import ElasticsearchDocumentStore
 from haystack.retriever.dense import EmbeddingRetriever, DensePassageRetriever
 
 from src.evaluation.utils.logging_management import clean_log
@@ -17,20 +26,24 @@ from farm.utils import BaseMLLogger, initialize_device_settings
 from mlflow.tracking import MlflowClient
 import pprint
 from sklearn.model_selection import ParameterGrid
-from skopt import dump, gp_minimize
+from skopt import Optimizer, dump, gp_minimize
+from skopt.callbacks import CheckpointSaver
 from skopt.utils import use_named_args
 import sys
 from tqdm import tqdm
 
 from src.evaluation.utils.utils_eval import save_results, \
-    full_eval_retriever_reader
+    full_eval_retriever_reader, stratified_question_order
 from src.evaluation.config.elasticsearch_mappings import SQUAD_MAPPING
 from src.evaluation.utils.elasticsearch_management import delete_indices, \
-    launch_ES, prepare_mapping
+    index_lock, is_index_complete, launch_ES, mark_index_complete, \
+    prepare_mapping
 from src.evaluation.utils.mlflow_management import add_extra_params, \
-    create_run_ids, get_list_past_run, prepare_mlflow_server, mlflow_log_run
+    create_index_key, create_run_ids, get_list_past_run, \
+    prepare_mlflow_server, mlflow_log_pareto_front, mlflow_log_rung, \
+    mlflow_log_run
 from src.evaluation.utils.utils_optimizer import LoggingCallback, \
-    create_dimensions_from_parameters
+    create_dimensions_from_parameters, load_previous_evaluations, pareto_front
 
 import src.evaluation.utils.pipelines as pipelines
 
@@ -38,6 +51,9 @@ BaseMLLogger.disable_logging = True
 load_dotenv()
 prepare_mlflow_server()
 
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR") or "./.cache/embeddings"
+READER_CACHE_PATH = os.getenv("READER_CACHE_PATH") or "./.cache/reader_predictions.sqlite"
+
 GPU_AVAILABLE = torch.cuda.is_available()
 
 if GPU_AVAILABLE:
@@ -46,6 +62,12 @@ else:
     n_gpu = -1
 
 
+# Parameters that only change how many documents or answers are kept. The runs
+# of a grid that only differ on these parameters can share their retrievals
+# (see sweep_run).
+K_PARAMETERS = ["k_retriever", "k_title_retriever", "k_reader_total"]
+
+
 def single_run(
         parameters,
         idx=None,
@@ -53,12 +75,63 @@ def single_run(
         elasticsearch_hostname = "localhost",
         elasticsearch_port = 9200,
         yaml_dir_prefix = "./output/pipelines/retriever_reader",
+        batch_size = None,
+        doc_index = "document_elasticsearch",
+        label_index = "label_elasticsearch",
+        reuse_index = False,
+        cache_predictions = True,
         ):
     """
     Perform one run of the pipeline under testing with the parameters given in the config file. The results are
     saved in the mlflow instance.
-    """
 
+    :param batch_size: If set, the questions are evaluated by groups of batch_size questions (see
+        src.evaluation.utils.batch_pipeline)
+    :param doc_index: Elasticsearch index where the documents are stored for this run
+    :param label_index: Elasticsearch index where the labels are stored for this run
+    :param reuse_index: If True, the indices are suffixed with a key identifying their content (see
+        create_index_key) and they are kept after the run, so that the next runs with the same key reuse them instead
+        of adding the evaluation data again
+    :param cache_predictions: If False, the reader predictions and the re-ranker scores are not read from their
+        caches, so that the latencies measured are the ones of the models
+    """
+    return sweep_run([parameters], gpu_id = gpu_id,
+                     elasticsearch_hostname = elasticsearch_hostname,
+                     elasticsearch_port = elasticsearch_port,
+                     yaml_dir_prefix = yaml_dir_prefix,
+                     batch_size = batch_size,
+                     doc_index = doc_index,
+                     label_index = label_index,
+                     reuse_index = reuse_index,
+                     cache_predictions = cache_predictions)[0]
+
+
+def sweep_run(
+        parameters_list,
+        gpu_id = -1,
+        elasticsearch_hostname = "localhost",
+        elasticsearch_port = 9200,
+        yaml_dir_prefix = "./output/pipelines/retriever_reader",
+        batch_size = None,
+        doc_index = "document_elasticsearch",
+        label_index = "label_elasticsearch",
+        reuse_index = False,
+        cache_predictions = True,
+        questions = None,
+        ):
+    """
+    Performs the runs of parameters_list, a list of parameters that only differ on the K_PARAMETERS, and returns
+    the list of their results. The pipeline and the indices are built once. The documents are retrieved once for the
+    largest k_retriever, and the runs with a smaller k use the first documents of these retrievals. The reader
+    predictions are shared through the reader prediction cache.
+
+    :param cache_predictions: If False, the reader predictions and the re-ranker scores are not read from their
+        caches, so that the latencies measured are the ones of the models. If True, the share of the reader
+        predictions read from the cache is returned as reader_cache_hit_rate.
+    :param questions: If set, only these questions are evaluated, see stratified_question_order
+    See single_run for the other arguments.
+    """
+    parameters = parameters_list[0]
     evaluation_data = Path(parameters["squad_dataset"])
 
     p = pipelines.retriever_reader(parameters,
@@ -76,6 +149,26 @@ def single_run(
     # to all of them. Take the first one.
     document_store = retrievers[0].document_store
 
+    # Reader predictions on (question, passage) pairs already seen in
+    # previous runs are read from the cache.
+    if cache_predictions:
+        enable_prediction_cache(p.get_node("Reader"), READER_CACHE_PATH)
+    elif p.get_node("Reranker"):
+        p.get_node("Reranker").cache = None
+
+    # An in-memory document store only lives as long as this run
+    reuse_index = reuse_index and pipelines.uses_elasticsearch(parameters)
+
+    if reuse_index:
+        index_key = create_index_key(parameters)
+        doc_index = f"{doc_index}_{index_key}"
+        label_index = f"{label_index}_{index_key}"
+
+    # The pipeline yaml always refers to the production indices. Point the
+    # document store to the indices of this run instead.
+    document_store.index = doc_index
+    document_store.label_index = label_index
+
     preprocessing = parameters["preprocessing"]
     split_by = parameters["split_by"]
     split_length = int(parameters["split_length"])  # this is intended to convert numpy.int64 to int
@@ -84,40 +177,59 @@ def single_run(
     else:
         preprocessor = None
 
-    # deleted indice for elastic search to make sure mappings are properly passed
-    delete_indices(elasticsearch_hostname, elasticsearch_port, index="document_elasticsearch")
-    delete_indices(elasticsearch_hostname, elasticsearch_port, index="label_elasticsearch")
+    with index_lock(doc_index) if reuse_index else nullcontext():
+        if reuse_index and is_index_complete(elasticsearch_hostname, elasticsearch_port, index=doc_index):
+            logging.info(f"Reusing indices {doc_index} and {label_index}.")
+        else:
+            build_indices(document_store, retrievers, evaluation_data, preprocessor,
+                          doc_index, label_index, elasticsearch_hostname, elasticsearch_port)
+            if reuse_index:
+                mark_index_complete(elasticsearch_hostname, elasticsearch_port, index=doc_index)
 
-    # Add evaluation data to Elasticsearch document store
-    document_store.add_eval_data(
-        evaluation_data.as_posix(),
-        doc_index="document_elasticsearch",
-        label_index="label_elasticsearch",
-        preprocessor=preprocessor,
-    )
+    if len(parameters_list) == 1:
+        return [evaluate_pipeline(p, document_store, parameters, label_index, batch_size, questions)]
 
-    for retriever in retrievers:
-        if type(retriever) in [DensePassageRetriever, TitleEmbeddingRetriever, 
-                EmbeddingRetriever]:
-            document_store.update_embeddings(retriever, index="document_elasticsearch")
+    max_k_retriever = max(retriever_top_k(params) for params in parameters_list)
+    results = []
+    with ExitStack() as stack:
+        for retriever in retrievers:
+            stack.enter_context(truncated_retrievals(retriever, max_k_retriever))
 
-    if parameters["retriever_type"] in ["title_bm25", "hot_reader"]:
-        # used to make sure the p.run method returns enough candidates
-        k_retriever = max(parameters["k_retriever"], parameters["k_title_retriever"])
+        for params in parameters_list:
+            logging.info(f"Doing run with config : {params}")
+            set_k_parameters(p, params)
+            reset_eval_nodes(p)
+            pipelines.save_pipeline_yaml(p, params, prefix = Path(yaml_dir_prefix))
+            results.append(evaluate_pipeline(p, document_store, params, label_index, batch_size, questions))
 
-    else:
-        k_retriever = parameters["k_retriever"]
+    return results
 
+
+def evaluate_pipeline(p, document_store, parameters, label_index, batch_size=None, questions=None):
+    """
+    Runs the evaluation questions through the pipeline p and returns the metrics of its EvalRetriever and
+    EvalReader nodes, and the latencies of its nodes. If questions is set, only these questions are evaluated.
+    """
+    k_retriever = retriever_top_k(parameters)
     k_reader_total = parameters["k_reader_total"]
 
+    node_timer = getattr(p, "node_timer", None)
+    if node_timer:
+        node_timer.reset()
+    prediction_cache = getattr(p.get_node("Reader"), "model", None)
+    if isinstance(prediction_cache, ReaderPredictionCache):
+        prediction_cache.hits = prediction_cache.misses = 0
+
     retriever_reader_eval_results = {}
     try:
         start = time.time()
-        full_eval_retriever_reader(document_store=document_store,
-                                   pipeline=p,
-                                   k_retriever=k_retriever,
-                                   k_reader_total=k_reader_total,
-                                   label_index="label_elasticsearch")
+        answers = full_eval_retriever_reader(document_store=document_store,
+                                             pipeline=p,
+                                             k_retriever=k_retriever,
+                                             k_reader_total=k_reader_total,
+                                             label_index=label_index,
+                                             batch_size=batch_size,
+                                             questions=questions)
 
         eval_retriever = p.get_node("EvalRetriever")
         eval_reader = p.get_node("EvalReader")
@@ -125,6 +237,14 @@ def single_run(
         retriever_reader_eval_results.update(eval_retriever.get_metrics())
         retriever_reader_eval_results.update(eval_reader.get_metrics())
 
+        prune_documents = p.get_node("PruneDocuments")
+        if prune_documents:
+            retriever_reader_eval_results.update(prune_documents.get_metrics())
+
+        # The latencies of the reader predictions read from the cache are not the ones of the model
+        if isinstance(prediction_cache, ReaderPredictionCache):
+            retriever_reader_eval_results.update(prediction_cache.get_metrics())
+
         end = time.time()
 
         logging.info(f"Retriever Recall: {retriever_reader_eval_results['recall']}")
@@ -134,29 +254,159 @@ def single_run(
         logging.info(f"reader_topk_f1: {retriever_reader_eval_results['reader_topk_f1']}")
 
         # Log time per label in metrics
-        time_per_label = (end - start) / document_store.get_label_count(
-            index="label_elasticsearch"
-        )
+        if questions is None:
+            n_labels = document_store.get_label_count(index=label_index)
+        else:
+            n_labels = len(answers)
+        time_per_label = (end - start) / n_labels
         retriever_reader_eval_results.update({"time_per_label": time_per_label})
 
+        if node_timer:
+            retriever_reader_eval_results.update(node_timer.get_metrics())
+
     except Exception as e:
         logging.error(f"Could not run this config: {parameters}. Error {e}.")
 
     return retriever_reader_eval_results
 
 
+def retriever_top_k(parameters):
+    """
+    Returns the number of documents asked to the retrievers of the pipeline.
+    """
+    if parameters["retriever_type"] in ["title_bm25", "hot_reader"]:
+        # used to make sure the p.run method returns enough candidates
+        return max(parameters["k_retriever"], parameters["k_title_retriever"])
+    else:
+        return parameters["k_retriever"]
+
+
+def set_k_parameters(p, parameters):
+    """
+    Sets the number of documents kept from each retriever by the JoinDocumentsCustom nodes of p, as done when the
+    pipeline is built from parameters.
+    """
+    for name in ["JoinResults", "JoinRetrieverResults"]:
+        join = p.get_node(name)
+        if isinstance(join, JoinDocumentsCustom):
+            join.ks_retriever = [parameters["k_retriever"], parameters["k_title_retriever"]]
+            join.pipeline_config["params"]["ks_retriever"] = join.ks_retriever
+
+
+def reset_eval_nodes(p):
+    """
+    Replaces the evaluation nodes of p with new ones, so that their metrics only count the next questions.
+    """
+    for name in ["EvalRetriever", "EvalReader", "PruneDocuments"]:
+        node = p.get_node(name)
+        if node:
+            p.graph.nodes[name]["component"] = type(node)(**node.pipeline_config["params"])
+            if getattr(p, "node_timer", None):
+                p.node_timer.wrap(name, p.graph.nodes[name]["component"])
+
+
+@contextmanager
+def truncated_retrievals(retriever, max_top_k):
+    """
+    Replaces `retriever.retrieve` so that the documents of each query are
+    retrieved once with top_k = max_top_k. The calls with a smaller top_k get
+    the first top_k of these documents.
+    """
+    original_retrieve = retriever.retrieve
+    retrievals = {}
+
+    def retrieve(query, filters=None, top_k=None, index=None):
+        if top_k is None or top_k > max_top_k:
+            return original_retrieve(query, filters, top_k, index)
+
+        key = (query, json.dumps(filters, sort_keys=True), index)
+        if key not in retrievals:
+            retrievals[key] = original_retrieve(query, filters, max_top_k, index)
+        # The documents are modified by the next nodes of the pipeline
+        return copy.deepcopy(retrievals[key][:top_k])
+
+    retriever.retrieve = retrieve
+    try:
+        yield
+    finally:
+        del retriever.retrieve
+
+
+def group_k_sweeps(list_run_ids, parameters_grid):
+    """
+    Returns the list of the groups [(run_ids, parameters_list), ...] of the
+    runs that only differ on the K_PARAMETERS, in the order of the grid.
+    """
+    groups = {}
+    for idx, param in zip(list_run_ids, parameters_grid):
+        key = repr(sorted((k, v) for k, v in param.items() if k not in K_PARAMETERS))
+        run_ids, parameters_list = groups.setdefault(key, ([], []))
+        run_ids.append(idx)
+        parameters_list.append(param)
+    return list(groups.values())
+
+
+def build_indices(document_store, retrievers, evaluation_data, preprocessor,
+                  doc_index, label_index, elasticsearch_hostname, elasticsearch_port):
+    """
+    (Re)creates the document and label indices from the evaluation data and computes the embeddings needed by the
+    retrievers.
+    """
+    # deleted indice for elastic search to make sure mappings are properly passed
+    if isinstance(document_store, ElasticsearchDocumentStore):
+        delete_indices(elasticsearch_hostname, elasticsearch_port, index=doc_index)
+        delete_indices(elasticsearch_hostname, elasticsearch_port, index=label_index)
+
+    # Add evaluation data to Elasticsearch document store
+    stream_eval_data(
+        document_store,
+        evaluation_data.as_posix(),
+        doc_index=doc_index,
+        label_index=label_index,
+        preprocessor=preprocessor,
+    )
+
+    for retriever in retrievers:
+        if type(retriever) in [DensePassageRetriever, TitleEmbeddingRetriever,
+                EmbeddingRetriever]:
+            with cached_embeddings(retriever, EMBEDDING_CACHE_DIR):
+                document_store.update_embeddings(retriever, index=doc_index)
+
+
 def optimize(parameters, n_calls, result_file_path, gpu_id=-1,
              elasticsearch_hostname="localhost",
              elasticsearch_port=9200,
-             yaml_dir_prefix="./output/pipelines/retriever_reader"):
+             yaml_dir_prefix="./output/pipelines/retriever_reader",
+             batch_size=None, reuse_index=False, n_workers=1, resume=False,
+             cache_predictions=True):
     """ Returns a list of n_calls tuples [(x1, v1), ...] where the lists xi are
     the parameter values for each evaluation and the dictionaries vi are the run
     results. The parameter values for the successive runs are determined by the
     bayesian optimization method gp_minimize.
+
+    When n_workers > 1, the runs are done in a pool of n_workers processes,
+    each run using its own Elasticsearch indices (see parallel_optimize).
+
+    When resume is True, the evaluations of the optimization dumped in
+    result_file_path are given to the optimizer before doing n_calls new runs.
+    The result is dumped after each run.
+
+    cache_predictions is passed to sweep_run.
     """
 
     dimensions = create_dimensions_from_parameters(parameters)
 
+    x0, y0 = load_previous_evaluations(result_file_path, dimensions) if resume else ([], [])
+
+    if n_workers > 1:
+        return parallel_optimize(dimensions, n_calls, result_file_path,
+                                 n_workers=n_workers, x0=x0, y0=y0, gpu_id=gpu_id,
+                                 elasticsearch_hostname=elasticsearch_hostname,
+                                 elasticsearch_port=elasticsearch_port,
+                                 yaml_dir_prefix=yaml_dir_prefix,
+                                 batch_size=batch_size, reuse_index=reuse_index,
+                                 cache_predictions=cache_predictions)
+
     # TODO: optimize should return a generator rather than a list to be
     # consistent with the functions grid_search and tune_pipeline.
     results = []
@@ -166,7 +416,10 @@ def optimize(parameters, n_calls, result_file_path, gpu_id=-1,
         result = single_run(params, gpu_id = gpu_id,
                             elasticsearch_hostname = elasticsearch_hostname, 
                             elasticsearch_port = elasticsearch_port,
-                            yaml_dir_prefix = yaml_dir_prefix)
+                            yaml_dir_prefix = yaml_dir_prefix,
+                            batch_size = batch_size,
+                            reuse_index = reuse_index,
+                            cache_predictions = cache_predictions)
 
         results.append((None, parameters, result))
 
@@ -176,7 +429,10 @@ def optimize(parameters, n_calls, result_file_path, gpu_id=-1,
         single_run_optimization,
         dimensions,
         n_calls=n_calls,
-        callback=LoggingCallback(n_calls),
+        x0=x0 or None,
+        y0=y0 or None,
+        callback=[LoggingCallback(n_calls),
+                  CheckpointSaver(str(result_file_path), store_objective=False)],
         n_jobs=-1,
     )
     dump(res, result_file_path, store_objective=True)
@@ -184,54 +440,380 @@ def optimize(parameters, n_calls, result_file_path, gpu_id=-1,
     return results
 
 
+def parallel_optimize(dimensions, n_calls, result_file_path, n_workers,
+                      x0=(), y0=(), **single_run_kwargs):
+    """ Bayesian optimization whose runs are done asynchronously in a pool of
+    n_workers processes, each run using its own Elasticsearch indices (see
+    sweep_run_isolated). Returns a list of n_calls tuples (None, params,
+    results).
+
+    The skopt Optimizer first proposes n_workers points at once. Each time a
+    run finishes, its result is told to the optimizer and a new point is
+    asked for the free worker. The runs still in progress are given to the
+    optimizer as constant lies (the best objective value found so far), so
+    that the new point is not proposed next to them. The result of the
+    optimization is dumped to result_file_path after each run.
+
+    x0 and y0 are previous evaluations given to the optimizer before the
+    first run. single_run_kwargs are passed to sweep_run_isolated.
+    """
+    optimizer = Optimizer(dimensions, base_estimator="GP", acq_func="gp_hedge")
+    if x0:
+        optimizer.tell(list(x0), list(y0))
+    names = [dimension.name for dimension in dimensions]
+
+    def next_point(pending):
+        if not pending:
+            return optimizer.ask()
+        lie = min(optimizer.yi) if optimizer.yi else 0.0
+        liar = optimizer.copy()
+        liar.tell(pending, [lie] * len(pending))
+        return liar.ask()
+
+    # Models are loaded with torch in each worker: use spawn rather than fork.
+    mp_context = multiprocessing.get_context("spawn")
+
+    results = []
+    progress = tqdm(total=n_calls, desc="Optimization", unit="config")
+    with ProcessPoolExecutor(max_workers=n_workers,
+                             mp_context=mp_context) as executor:
+        futures = {}
+        n_asked = 0
+
+        def submit(point):
+            # The parameters are saved as json with the pipeline yaml
+            params = {name: value.item() if isinstance(value, np.generic) else value
+                      for name, value in zip(names, point)}
+            logging.info(f"Submitting run with config : {params}")
+            # The run id only names the Elasticsearch indices of the run
+            run_id = f"optimize_{os.getpid()}_{n_asked}"
+            future = executor.submit(sweep_run_isolated, [run_id], [params],
+                                     **single_run_kwargs)
+            futures[future] = point
+
+        points = optimizer.ask(n_points=min(n_workers, n_calls), strategy="cl_min")
+        for point in points:
+            submit(point)
+            n_asked += 1
+
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                point = futures.pop(future)
+                _, params, result = future.result()[0]
+                # A failed run has no metrics
+                objective = 1 - result.get("reader_topk_accuracy_has_answer", 0)
+                optimizer.tell(point, objective)
+                dump(optimizer.get_result(), result_file_path, store_objective=False)
+                results.append((None, params, result))
+                progress.update()
+                logging.info(f"Objective {objective:.4f} for config {params}, "
+                             f"current minimum {min(optimizer.yi):.4f}")
+
+            while n_asked < n_calls and len(futures) < n_workers:
+                submit(next_point(list(futures.values())))
+                n_asked += 1
+    progress.close()
+
+    return results
+
+
 def grid_search(parameters, mlflow_client, experiment_name, use_cache=False,
                 result_file_path=Path("./output/results_reader.csv"), gpu_id=-1,
                 elasticsearch_hostname="localhost", elasticsearch_port=9200,
-                yaml_dir_prefix="./output/pipelines/retriever_reader"):
+                yaml_dir_prefix="./output/pipelines/retriever_reader",
+                batch_size=None, n_workers=1, reuse_index=False,
+                k_sweep=False, cache_predictions=True):
     """ Returns a generator of tuples [(id1, x1, v1), ...] where id1 is the run
     id, the lists xi are the parameter values for each evaluation and the
     dictionaries vi are the run results. The parameter values for each
     successive run are determined by a grid search method.
+
+    When n_workers > 1, the runs are done in a pool of n_workers processes,
+    each run using its own Elasticsearch indices. The results are then yielded
+    in the order in which the runs finish.
+
+    When k_sweep is True, the runs that only differ on the K_PARAMETERS are done
+    together by sweep_run, retrieving the documents once for the largest k.
+
+    cache_predictions is passed to sweep_run.
     """
     parameters_grid = list(ParameterGrid(param_grid=parameters))
     list_run_ids = create_run_ids(parameters_grid)
     list_past_run_names = get_list_past_run(mlflow_client, experiment_name)
 
-    for idx, param in tqdm(
-            zip(list_run_ids, parameters_grid),
-            total=len(list_run_ids),
+    if k_sweep:
+        groups = group_k_sweeps(list_run_ids, parameters_grid)
+    else:
+        groups = [([idx], [param]) for idx, param in zip(list_run_ids, parameters_grid)]
+
+    if n_workers > 1:
+        yield from parallel_grid_search(
+            groups, list_past_run_names, mlflow_client,
+            use_cache=use_cache, result_file_path=result_file_path,
+            n_workers=n_workers, gpu_id=gpu_id,
+            elasticsearch_hostname=elasticsearch_hostname,
+            elasticsearch_port=elasticsearch_port,
+            yaml_dir_prefix=yaml_dir_prefix, batch_size=batch_size,
+            reuse_index=reuse_index, cache_predictions=cache_predictions)
+        return
+
+    for run_ids, parameters_list in tqdm(
+            groups,
+            total=len(groups),
             desc="GridSearch",
             unit="config",
     ):
-        enriched_param = add_extra_params(param)
-        if (
-                idx in list_past_run_names.keys() and use_cache
-        ):  # run not done
-            logging.info(
-                f"Config {param} already done and found in mlflow. Not doing it again."
-            )
-            # Log again run with previous results
-            previous_metrics = mlflow_client.get_run(list_past_run_names[idx]).data.metrics
-
-            yield (idx, param, previous_metrics)
-
-        else:  # run notalready done or USE_CACHE set to False or not set
-            logging.info(f"Doing run with config : {param}")
-            run_results = single_run(param, gpu_id = gpu_id,
+        runs_todo = []
+        for idx, param in zip(run_ids, parameters_list):
+            if (
+                    idx in list_past_run_names.keys() and use_cache
+            ):  # run not done
+                logging.info(
+                    f"Config {param} already done and found in mlflow. Not doing it again."
+                )
+                # Log again run with previous results
+                previous_metrics = mlflow_client.get_run(list_past_run_names[idx]).data.metrics
+
+                yield (idx, param, previous_metrics)
+
+            else:  # run notalready done or USE_CACHE set to False or not set
+                runs_todo.append((idx, param))
+
+        if not runs_todo:
+            continue
+
+        logging.info(f"Doing runs with configs : {[param for _, param in runs_todo]}")
+        list_run_results = sweep_run([param for _, param in runs_todo],
+                                     gpu_id = gpu_id,
                                      elasticsearch_hostname = elasticsearch_hostname,
                                      elasticsearch_port = elasticsearch_port,
-                                     yaml_dir_prefix = yaml_dir_prefix)
+                                     yaml_dir_prefix = yaml_dir_prefix,
+                                     batch_size = batch_size,
+                                     reuse_index = reuse_index,
+                                     cache_predictions = cache_predictions)
+
+        # update list of past experiments
+        list_past_run_names = get_list_past_run(mlflow_client, experiment_name)
 
+        for (idx, param), run_results in zip(runs_todo, list_run_results):
             # For debugging purpose, we keep a copy of the results in a csv form
             save_results(result_file_path=result_file_path,
-                         results_list={**run_results, **enriched_param})
-
-            # update list of past experiments
-            list_past_run_names = get_list_past_run(mlflow_client, experiment_name)
+                         results_list={**run_results, **add_extra_params(param)})
 
             yield (idx, param, run_results)
 
 
+def parallel_grid_search(groups, list_past_run_names, mlflow_client,
+                         use_cache, result_file_path, n_workers,
+                         **single_run_kwargs):
+    """ Does the runs of a grid search in a pool of n_workers processes and
+    returns a generator of tuples (run_id, params, results) in the order in
+    which the runs finish. groups is a list [(run_ids, parameters_list), ...]
+    of runs done together by sweep_run. single_run_kwargs are passed to
+    sweep_run.
+    """
+    # Models are loaded with torch in each worker: use spawn rather than fork.
+    mp_context = multiprocessing.get_context("spawn")
+
+    with ProcessPoolExecutor(max_workers=n_workers,
+                             mp_context=mp_context) as executor:
+        futures = []
+        for run_ids, parameters_list in groups:
+            runs_todo = []
+            for idx, param in zip(run_ids, parameters_list):
+                if idx in list_past_run_names.keys() and use_cache:
+                    logging.info(
+                        f"Config {param} already done and found in mlflow. Not doing it again."
+                    )
+                    previous_metrics = mlflow_client.get_run(list_past_run_names[idx]).data.metrics
+                    yield (idx, param, previous_metrics)
+                else:
+                    runs_todo.append((idx, param))
+
+            if runs_todo:
+                logging.info(f"Submitting runs with configs : {[param for _, param in runs_todo]}")
+                futures.append(executor.submit(
+                    sweep_run_isolated, [idx for idx, _ in runs_todo],
+                    [param for _, param in runs_todo], **single_run_kwargs))
+
+        for future in tqdm(as_completed(futures), total=len(futures),
+                           desc="GridSearch", unit="config"):
+            for idx, param, run_results in future.result():
+
+                # For debugging purpose, we keep a copy of the results in a csv form
+                save_results(result_file_path=result_file_path,
+                             results_list={**run_results, **add_extra_params(param)})
+
+                yield (idx, param, run_results)
+
+
+def sweep_run_isolated(run_ids, parameters_list,
+                       elasticsearch_hostname="localhost",
+                       elasticsearch_port=9200, reuse_index=False,
+                       **single_run_kwargs):
+    """ Runs sweep_run on Elasticsearch indices dedicated to these runs, so
+    that it can be executed concurrently with other runs. The indices are
+    deleted at the end of the runs. Returns the list of tuples
+    (idx, param, results).
+
+    When reuse_index is True, the runs share the indices identified by their
+    content key instead (see single_run), and the indices are kept.
+    """
+    if reuse_index:
+        list_run_results = sweep_run(parameters_list,
+                                     elasticsearch_hostname=elasticsearch_hostname,
+                                     elasticsearch_port=elasticsearch_port,
+                                     reuse_index=True, **single_run_kwargs)
+        return list(zip(run_ids, parameters_list, list_run_results))
+
+    doc_index = f"document_elasticsearch_{run_ids[0]}".lower()
+    label_index = f"label_elasticsearch_{run_ids[0]}".lower()
+    try:
+        list_run_results = sweep_run(parameters_list,
+                                     elasticsearch_hostname=elasticsearch_hostname,
+                                     elasticsearch_port=elasticsearch_port,
+                                     doc_index=doc_index, label_index=label_index,
+                                     **single_run_kwargs)
+    finally:
+        if pipelines.uses_elasticsearch(parameters_list[0]):
+            delete_indices(elasticsearch_hostname, elasticsearch_port, index=doc_index)
+            delete_indices(elasticsearch_hostname, elasticsearch_port, index=label_index)
+
+    return list(zip(run_ids, parameters_list, list_run_results))
+
+
+def multi_objective(parameters, mlflow_client, experiment_name,
+                    accuracy_metric="reader_topk_accuracy_has_answer",
+                    latency_metric="query_latency_p95", latency_budget=None,
+                    batch_size=None, **grid_search_kwargs):
+    """ Returns a generator of tuples (id1, x1, v1), ... as grid_search, and
+    logs the Pareto front of accuracy_metric (maximized) versus
+    latency_metric (minimized) of these runs to MLflow once they are all done
+    (see mlflow_log_pareto_front). When latency_budget is set, the most
+    accurate run of the front whose latency is within the budget is logged as
+    the best run.
+
+    The runs are done without the prediction caches and without k_sweep, as
+    both would hide the latency of the models. The latencies of each query
+    are not measured in batched runs: time_per_label is used instead.
+    """
+    if batch_size and latency_metric.startswith("query_latency"):
+        logging.warning(f"{latency_metric} is not measured in batched runs, using time_per_label instead.")
+        latency_metric = "time_per_label"
+
+    runs = []
+    for run in grid_search(parameters, mlflow_client, experiment_name,
+                           batch_size=batch_size, k_sweep=False,
+                           cache_predictions=False, **grid_search_kwargs):
+        runs.append(run)
+        yield run
+
+    front = pareto_front(runs, accuracy_metric, latency_metric)
+    for run_id, params, results in front:
+        logging.info(f"Pareto front: {accuracy_metric} {results[accuracy_metric]:.4f}, "
+                     f"{latency_metric} {results[latency_metric]:.4f}s, config {params}")
+
+    best_run = mlflow_log_pareto_front(front, accuracy_metric, latency_metric,
+                                       latency_budget=latency_budget)
+    if latency_budget is not None and best_run is None:
+        logging.warning(f"No run has a {latency_metric} within the budget of {latency_budget}s.")
+    elif best_run:
+        logging.info(f"Best run within the latency budget: {best_run[0]}, config {best_run[1]}")
+
+
+def successive_halving(parameters, min_fraction=0.1, eta=3,
+                       metric="reader_topk_accuracy_has_answer",
+                       result_file_path=Path("./output/results_reader.csv"),
+                       n_workers=1, **single_run_kwargs):
+    """ Returns a generator of tuples (id1, x1, v1), ... as grid_search, for
+    the configs of the grid that survive a successive halving.
+
+    The configs are first evaluated on a sample of min_fraction of the
+    questions of their squad_dataset, stratified by article (see
+    stratified_question_order). The best 1 / eta of them, according to
+    metric, are promoted to the next rung, where they are evaluated on eta
+    times more questions, and so on until the last rung, where the remaining
+    configs are evaluated on all the questions. Only the runs of the last rung
+    are yielded. Each rung is logged to MLflow (see mlflow_log_rung).
+
+    The samples of the successive rungs are nested, so with cache_predictions
+    the reader predictions of a rung are read from the reader prediction cache
+    by the next ones.
+    With reuse_index, the indices built for a config are also reused by its
+    next rungs.
+
+    When n_workers > 1, the runs of a rung are done in a pool of n_workers
+    processes, each run using its own Elasticsearch indices.
+    single_run_kwargs are passed to sweep_run_isolated.
+    """
+    parameters_grid = list(ParameterGrid(param_grid=parameters))
+    list_run_ids = create_run_ids(parameters_grid)
+
+    question_orders = {
+        squad_dataset: stratified_question_order(squad_dataset)
+        for squad_dataset in set(param["squad_dataset"] for param in parameters_grid)
+    }
+
+    # The fractions of the questions of the rungs: ..., 1 / eta^2, 1 / eta, 1
+    n_rungs = int(np.floor(np.log(1 / min_fraction) / np.log(eta) + 1e-9)) + 1
+    survivors = list(zip(list_run_ids, parameters_grid))
+
+    for rung in range(n_rungs):
+        fraction = float(eta) ** (rung - n_rungs + 1)
+        last_rung = rung == n_rungs - 1
+
+        def rung_questions(param):
+            if last_rung:
+                return None
+            questions = question_orders[param["squad_dataset"]]
+            return questions[:max(1, int(round(fraction * len(questions))))]
+
+        logging.info(f"Successive halving rung {rung}: {len(survivors)} configs on {fraction:.0%} of the questions")
+        runs = evaluate_configs(survivors, rung_questions, n_workers, **single_run_kwargs)
+
+        if last_rung:
+            for idx, param, run_results in runs:
+                # For debugging purpose, we keep a copy of the results in a csv form
+                save_results(result_file_path=result_file_path,
+                             results_list={**run_results, **add_extra_params(param)})
+
+                yield (idx, param, run_results)
+            return
+
+        # The failed runs have no metrics
+        runs = sorted(runs, key=lambda run: run[2].get(metric, -np.inf), reverse=True)
+        promoted = runs[:max(1, int(len(runs) // eta))]
+        n_questions = max(len(rung_questions(param)) for _, param in survivors)
+        mlflow_log_rung(rung, n_questions, runs, [idx for idx, _, _ in promoted], metric,
+                        result_file_path=Path(f"./output/successive_halving/rung_{rung}.csv"))
+        survivors = [(idx, param) for idx, param, _ in promoted]
+
+
+def evaluate_configs(configs, config_questions, n_workers=1, **single_run_kwargs):
+    """ Evaluates the configs [(run_id, params), ...] on the questions
+    config_questions(params) with sweep_run_isolated, in a pool of n_workers
+    processes if n_workers > 1. Returns the list of tuples (run_id, params,
+    results) in the order of configs.
+    """
+    if n_workers <= 1:
+        return [sweep_run_isolated([idx], [param], questions=config_questions(param),
+                                   **single_run_kwargs)[0]
+                for idx, param in tqdm(configs, desc="SuccessiveHalving", unit="config")]
+
+    # Models are loaded with torch in each worker: use spawn rather than fork.
+    mp_context = multiprocessing.get_context("spawn")
+
+    with ProcessPoolExecutor(max_workers=n_workers,
+                             mp_context=mp_context) as executor:
+        futures = [executor.submit(sweep_run_isolated, [idx], [param],
+                                   questions=config_questions(param),
+                                   **single_run_kwargs)
+                   for idx, param in configs]
+        for _ in tqdm(as_completed(futures), total=len(futures),
+                      desc="SuccessiveHalving", unit="config"):
+            pass
+        return [future.result()[0] for future in futures]
 
 
 def tune_pipeline(
@@ -260,7 +842,10 @@ def tune_pipeline(
     else:
         gpu_id = -1
 
-    launch_ES(elasticsearch_hostname, elasticsearch_port)
+    # Elasticsearch is not needed when all the runs use the in-memory BM25
+    # document store
+    if any(pipelines.uses_elasticsearch(params) for params in ParameterGrid(parameters)):
+        launch_ES(elasticsearch_hostname, elasticsearch_port)
     client = MlflowClient()
     mlflow.set_experiment(experiment_name=experiment_name)
 
@@ -272,7 +857,12 @@ def tune_pipeline(
             gpu_id=gpu_id,
             elasticsearch_hostname=elasticsearch_hostname,
             elasticsearch_port=elasticsearch_port,
-            yaml_dir_prefix=yaml_dir_prefix)
+            yaml_dir_prefix=yaml_dir_prefix,
+            batch_size=parameter_tuning_options.get("batch_size"),
+            reuse_index=parameter_tuning_options.get("reuse_index", False),
+            n_workers=parameter_tuning_options.get("n_workers", 1),
+            resume=parameter_tuning_options.get("optimization_resume", False),
+            cache_predictions=parameter_tuning_options.get("cache_predictions", True))
 
     elif parameter_tuning_options["tuning_method"] == "grid_search":
         runs = grid_search(
@@ -284,7 +874,44 @@ def tune_pipeline(
             result_file_path=Path("./output/results_reader.csv"),
             elasticsearch_hostname=elasticsearch_hostname,
             elasticsearch_port=elasticsearch_port,
-            yaml_dir_prefix=yaml_dir_prefix)
+            yaml_dir_prefix=yaml_dir_prefix,
+            batch_size=parameter_tuning_options.get("batch_size"),
+            n_workers=parameter_tuning_options.get("n_workers", 1),
+            reuse_index=parameter_tuning_options.get("reuse_index", False),
+            k_sweep=parameter_tuning_options.get("k_sweep", False),
+            cache_predictions=parameter_tuning_options.get("cache_predictions", True))
+
+    elif parameter_tuning_options["tuning_method"] == "multi_objective":
+        runs = multi_objective(
+            parameters=parameters,
+            mlflow_client=client,
+            experiment_name=parameter_tuning_options["experiment_name"],
+            latency_metric=parameter_tuning_options.get("latency_metric", "query_latency_p95"),
+            latency_budget=parameter_tuning_options.get("latency_budget"),
+            use_cache=parameter_tuning_options["use_cache"],
+            gpu_id=gpu_id,
+            result_file_path=Path("./output/results_reader.csv"),
+            elasticsearch_hostname=elasticsearch_hostname,
+            elasticsearch_port=elasticsearch_port,
+            yaml_dir_prefix=yaml_dir_prefix,
+            batch_size=parameter_tuning_options.get("batch_size"),
+            n_workers=parameter_tuning_options.get("n_workers", 1),
+            reuse_index=parameter_tuning_options.get("reuse_index", False))
+
+    elif parameter_tuning_options["tuning_method"] == "successive_halving":
+        runs = successive_halving(
+            parameters=parameters,
+            min_fraction=parameter_tuning_options.get("halving_min_fraction", 0.1),
+            eta=parameter_tuning_options.get("halving_eta", 3),
+            result_file_path=Path("./output/results_reader.csv"),
+            n_workers=parameter_tuning_options.get("n_workers", 1),
+            gpu_id=gpu_id,
+            elasticsearch_hostname=elasticsearch_hostname,
+            elasticsearch_port=elasticsearch_port,
+            yaml_dir_prefix=yaml_dir_prefix,
+            batch_size=parameter_tuning_options.get("batch_size"),
+            reuse_index=parameter_tuning_options.get("reuse_index", False),
+            cache_predictions=parameter_tuning_options.get("cache_predictions", True))
 
     else:
         print("Unknown parameter tuning method: ",
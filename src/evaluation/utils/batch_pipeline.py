@@ -0,0 +1,323 @@
+"""
+Batched execution of haystack pipelines.
+
+`run_pipeline_batch` runs a pipeline on a group of queries. The nodes are
+executed in the same order as in `Pipeline.run` and each node still receives
+one query at a time, so that the evaluation nodes see the same per-question
+labels as with a plain `Pipeline.run` loop. Before a node runs, its expensive
+calls are done once for the whole group of queries:
+
+- the BM25 queries sent to an ElasticsearchDocumentStore are grouped in one
+  `_msearch` request,
+- the query embeddings of dense retrievers (sbert, dpr, title) are computed in
+  one batch,
+- the forward passes of a TransformersReader are run on padded batches built
+  from all the (question, passage) pairs of the group.
+
+The node then runs unchanged and gets its results from these precomputed
+values.
+"""
+
+import json
+from contextlib import ExitStack, contextmanager
+from typing import Dict, List
+
+import torch
+from haystack.document_store.elasticsearch import ElasticsearchDocumentStore
+from haystack.reader.transformers import TransformersReader
+from haystack.retriever.dense import DensePassageRetriever, EmbeddingRetriever
+
+from deployment.roles.haystack.files.custom_component import \
+    ReaderPredictionCache
+
+
+def run_pipeline_batch(pipeline, batch_kwargs: List[Dict],
+                       reader_batch_size: int = 32):
+    """
+    Returns the list of the outputs of `pipeline.run(**kwargs)` for each dict
+    `kwargs` of `batch_kwargs`.
+
+    :param pipeline: A haystack Pipeline
+    :param batch_kwargs: A list of the keyword arguments of each run, e.g.
+        [{"query": ..., "top_k_retriever": ..., "labels": ...}, ...]
+    :param reader_batch_size: Number of sequences in each padded batch sent to
+        the reader model
+    """
+    queries = [kwargs["query"] for kwargs in batch_kwargs]
+    if hasattr(pipeline, "pipeline_type"):
+        batch_kwargs = [{"pipeline_type": pipeline.pipeline_type, **kwargs}
+                        for kwargs in batch_kwargs]
+
+    # Same traversal as Pipeline.run, except that each entry of the stack
+    # holds the inputs of the node for every query of the batch.
+    root_node_id = getattr(pipeline, "root_node_id", "Query")
+    stack = {root_node_id: dict(enumerate(batch_kwargs))}
+    nodes_executed = set()
+    outputs = {}
+    i = -1
+    while stack:
+        node_id = list(stack.keys())[i]
+        predecessors = set(pipeline.graph.predecessors(node_id))
+        if not predecessors.issubset(nodes_executed):
+            # Try lower nodes in the stack as node_id has unprocessed
+            # predecessors
+            i -= 1
+            continue
+
+        nodes_executed.add(node_id)
+        node_inputs = stack.pop(node_id)
+        component = pipeline.graph.nodes[node_id]["component"]
+
+        with batched_calls(component, queries, list(node_inputs.values()),
+                           reader_batch_size):
+            for idx, node_input in node_inputs.items():
+                node_output, stream_id = component.run(**node_input)
+                outputs[idx] = node_output
+                for next_node in pipeline.get_next_nodes(node_id, stream_id):
+                    next_inputs = stack.setdefault(next_node, {})
+                    if idx not in next_inputs:
+                        next_inputs[idx] = node_output
+                    elif "inputs" not in next_inputs[idx].keys():
+                        # concatenate inputs if it's a join node
+                        next_inputs[idx] = {"inputs": [next_inputs[idx],
+                                                       node_output]}
+                    else:
+                        next_inputs[idx]["inputs"].append(node_output)
+        i = -1
+
+    return [outputs[idx] for idx in range(len(batch_kwargs))]
+
+
+@contextmanager
+def batched_calls(component, queries, node_inputs, reader_batch_size=32):
+    """
+    Context manager that precomputes the expensive calls of `component` for
+    all the queries of a batch. Components with nothing to batch are left
+    untouched.
+    """
+    with ExitStack() as stack:
+        document_store = getattr(component, "document_store", None)
+        if isinstance(document_store, ElasticsearchDocumentStore):
+            stack.enter_context(msearch_queries(document_store, queries))
+
+        if isinstance(component, (EmbeddingRetriever, DensePassageRetriever)):
+            stack.enter_context(batched_query_embeddings(component, queries))
+
+        if isinstance(component, TransformersReader):
+            stack.enter_context(batched_reader_forward(component, node_inputs,
+                                                       reader_batch_size))
+
+        yield
+
+
+@contextmanager
+def msearch_queries(document_store: ElasticsearchDocumentStore, queries):
+    """
+    Replaces `document_store.query` so that the first call sends the BM25
+    queries for all `queries` in a single `_msearch` request. Calls for other
+    queries or with a custom query fall back to the original method.
+    """
+    original_query = document_store.query
+    results = {}
+
+    def query(query, filters=None, top_k=10, custom_query=None, index=None):
+        if custom_query is not None or query not in queries:
+            return original_query(query, filters, top_k, custom_query, index)
+
+        key = (json.dumps(filters, sort_keys=True), top_k, index)
+        if key not in results:
+            results[key] = msearch(document_store, queries, filters, top_k,
+                                   index)
+        return results[key][query]
+
+    document_store.query = query
+    try:
+        yield
+    finally:
+        del document_store.query
+
+
+def msearch(document_store: ElasticsearchDocumentStore, queries, filters=None,
+            top_k=10, index=None):
+    """
+    Returns a dict {query: [Document, ...]} with the documents that
+    `document_store.query` would return for each query, using one
+    `_msearch` request.
+    """
+    index = index or document_store.index
+    body = []
+    for query in queries:
+        body.append({"index": index})
+        body.append(bm25_query_body(document_store, query, filters, top_k))
+
+    responses = document_store.client.msearch(body=body)["responses"]
+
+    return {
+        query: [
+            document_store._convert_es_hit_to_document(
+                hit, return_embedding=document_store.return_embedding)
+            for hit in response["hits"]["hits"]
+        ]
+        for query, response in zip(queries, responses)
+    }
+
+
+def bm25_query_body(document_store: ElasticsearchDocumentStore, query,
+                    filters=None, top_k=10):
+    """
+    Returns the body of the search request made by
+    `ElasticsearchDocumentStore.query` when no custom query is used.
+    """
+    body = {
+        "size": str(top_k),
+        "query": {
+            "bool": {
+                "should": [{"multi_match": {
+                    "query": query,
+                    "type": "most_fields",
+                    "fields": document_store.search_fields}}]
+            }
+        },
+    }
+    if filters:
+        body["query"]["bool"]["filter"] = [
+            {"terms": {key: values}} for key, values in filters.items()
+        ]
+    if document_store.excluded_meta_data:
+        body["_source"] = {"excludes": document_store.excluded_meta_data}
+    return body
+
+
+@contextmanager
+def batched_query_embeddings(retriever, queries):
+    """
+    Replaces `retriever.embed_queries` so that the embeddings of all `queries`
+    are computed in one batch on the first call.
+    """
+    original_embed_queries = retriever.embed_queries
+    embeddings = {}
+
+    def embed_queries(texts):
+        if not all(text in queries for text in texts):
+            return original_embed_queries(texts=texts)
+        if not embeddings:
+            embeddings.update(zip(queries, original_embed_queries(texts=queries)))
+        return [embeddings[text] for text in texts]
+
+    retriever.embed_queries = embed_queries
+    try:
+        yield
+    finally:
+        del retriever.embed_queries
+
+
+class BatchedForward:
+    """
+    Stands in for the torch model of a transformers question-answering
+    pipeline. While `recording` is True, the inputs of each call are stored
+    and dummy logits are returned. `forward_recorded` then runs the model on
+    all the recorded inputs in padded batches, and the following calls with
+    the same inputs get their logits from these batches.
+    """
+
+    def __init__(self, model, pad_token_id, batch_size=32):
+        self.model = model
+        self.pad_token_id = pad_token_id
+        self.batch_size = batch_size
+        self.recording = True
+        self.recorded = {}
+        self.logits = {}
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+    def __call__(self, **fw_args):
+        key = fw_args["input_ids"].cpu().numpy().tobytes()
+        if self.recording:
+            self.recorded[key] = fw_args
+            dummy = torch.zeros(fw_args["input_ids"].shape,
+                                device=fw_args["input_ids"].device)
+            return dummy, dummy
+        if key in self.logits:
+            return self.logits[key]
+        return self.model(**fw_args)
+
+    def forward_recorded(self):
+        self.recording = False
+
+        # One row per sequence, sorted by length to limit padding
+        rows = [(key, j) for key, fw_args in self.recorded.items()
+                for j in range(fw_args["input_ids"].shape[0])]
+        rows.sort(key=lambda row: self.recorded[row[0]]["input_ids"].shape[1])
+
+        starts, ends = {}, {}
+        for b in range(0, len(rows), self.batch_size):
+            batch_rows = rows[b:b + self.batch_size]
+            max_len = max(self.recorded[key]["input_ids"].shape[1]
+                          for key, _ in batch_rows)
+            batch = {
+                name: torch.stack([
+                    self._pad(self.recorded[key][name][j], max_len,
+                              self.pad_token_id if name == "input_ids" else 0)
+                    for key, j in batch_rows])
+                for name in self.recorded[batch_rows[0][0]]
+            }
+            with torch.no_grad():
+                start, end = self.model(**batch)[:2]
+            for (key, j), row_start, row_end in zip(batch_rows, start, end):
+                starts[(key, j)] = row_start
+                ends[(key, j)] = row_end
+
+        for key, fw_args in self.recorded.items():
+            n_rows, length = fw_args["input_ids"].shape
+            self.logits[key] = (
+                torch.stack([starts[(key, j)][:length] for j in range(n_rows)]),
+                torch.stack([ends[(key, j)][:length] for j in range(n_rows)]))
+        self.recorded = {}
+
+    @staticmethod
+    def _pad(tensor, length, value):
+        padding = tensor.new_full((length - tensor.shape[0],), value)
+        return torch.cat([tensor, padding])
+
+
+@contextmanager
+def batched_reader_forward(reader: TransformersReader, node_inputs,
+                           batch_size=32):
+    """
+    Runs the forward passes of `reader` for all the (question, passage) pairs
+    of `node_inputs` in padded batches. The answers are then decoded by the
+    transformers pipeline as usual.
+
+    The inputs of the model are collected with a first call to
+    `reader.predict` on each node input, so that they are built with exactly
+    the same parameters as during the actual run. When the reader uses a
+    ReaderPredictionCache, the pairs found in the cache are not sent to the
+    model, and nothing is written to the cache during this first call.
+    """
+    qa_pipeline = reader.model
+    cache = None
+    if isinstance(qa_pipeline, ReaderPredictionCache):
+        cache = qa_pipeline
+        qa_pipeline = cache.qa_pipeline
+
+    original_model = qa_pipeline.model
+    forward = BatchedForward(original_model, qa_pipeline.tokenizer.pad_token_id,
+                             batch_size)
+    qa_pipeline.model = forward
+    try:
+        if cache:
+            cache.writable = False
+        for node_input in node_inputs:
+            if node_input.get("documents"):
+                reader.predict(query=node_input["query"],
+                               documents=node_input["documents"],
+                               top_k=node_input.get("top_k_reader"))
+        if cache:
+            cache.writable = True
+        forward.forward_recorded()
+        yield
+    finally:
+        qa_pipeline.model = original_model
+        if cache:
+            cache.writable = True
@@ -0,0 +1,223 @@
+import copy
+import logging
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+from haystack import Document
+from haystack.document_store.memory import InMemoryDocumentStore
+
+from src.evaluation.utils.french_analyzer import analyze
+
+logger = logging.getLogger(__name__)
+
+
+class BM25DocumentStore(InMemoryDocumentStore):
+    """
+    An InMemoryDocumentStore with a BM25 inverted index, that can replace the
+    ElasticsearchDocumentStore of the evaluation pipelines without a running
+    Elasticsearch: its `query` method has the same signature and returns the
+    same documents, in the same order and with the same scores, as the
+    multi_match query of ElasticsearchDocumentStore on the squad mapping
+    (French analyzer, title boosted by title_boosting_factor). It can thus be
+    used with an ElasticsearchRetriever.
+
+    The inverted index of an index is built on the first query following a
+    write, so the documents should be written before querying.
+    """
+
+    def __init__(self, search_fields: List[str] = ["name", "text"],
+                 title_boosting_factor: float = 1, k1: float = 1.2,
+                 b: float = 0.75, **kwargs):
+        """
+        :param search_fields: The fields searched by the queries, "text" being
+            the text of the documents and the others fields of their meta
+        :param title_boosting_factor: Boost of the "name" field
+        :param k1: BM25 term frequency saturation, as in Elasticsearch
+        :param b: BM25 length normalization, as in Elasticsearch
+        :param kwargs: The parameters of InMemoryDocumentStore
+        """
+        super().__init__(**kwargs)
+
+        # save init parameters to enable export of component config as YAML.
+        # The config saved by InMemoryDocumentStore.__init__ is replaced to
+        # add the BM25 parameters.
+        self.pipeline_config = {}
+        self.set_config(search_fields = search_fields,
+                title_boosting_factor = title_boosting_factor, k1 = k1, b = b,
+                **kwargs)
+
+        self.search_fields = search_fields
+        self.title_boosting_factor = title_boosting_factor
+        self.k1 = k1
+        self.b = b
+        self.bm25_indexes: Dict[str, BM25Index] = {}
+        self.bm25_lock = threading.Lock()
+
+    def write_documents(self, documents, index: Optional[str] = None, **kwargs):
+        index = index or self.index
+        super().write_documents(documents, index=index, **kwargs)
+        self.bm25_indexes.pop(index, None)
+
+    def delete_all_documents(self, index: Optional[str] = None, **kwargs):
+        index = index or self.index
+        super().delete_all_documents(index=index, **kwargs)
+        self.bm25_indexes.pop(index, None)
+
+    def get_bm25_index(self, index: str) -> "BM25Index":
+        with self.bm25_lock:
+            if index not in self.bm25_indexes:
+                documents = list(self.indexes.get(index, {}).values())
+                logger.info(f"Building the BM25 index of {len(documents)} documents of {index}")
+                boosts = {field: self.title_boosting_factor if field == "name" else 1
+                          for field in self.search_fields}
+                self.bm25_indexes[index] = BM25Index(documents, boosts, self.k1, self.b)
+            return self.bm25_indexes[index]
+
+    def query(self, query: Optional[str], filters: Optional[Dict[str, List[str]]] = None,
+              top_k: int = 10, custom_query: Optional[str] = None,
+              index: Optional[str] = None) -> List[Document]:
+        """
+        Same as ElasticsearchDocumentStore.query, without custom queries.
+
+        :param filters: Keep the documents whose meta field (the key) has one
+            of the values of the list
+        """
+        if custom_query:
+            raise NotImplementedError("BM25DocumentStore does not support custom queries")
+
+        index = index or self.index
+        bm25_index = self.get_bm25_index(index)
+
+        if query is None:
+            scores = np.ones(len(bm25_index.documents), dtype=np.float32)
+        else:
+            scores = bm25_index.score(analyze(query))
+
+        candidates = np.flatnonzero(scores > 0)
+        if filters:
+            candidates = [i for i in candidates
+                          if matches_filters(bm25_index.documents[i], filters)]
+            candidates = np.asarray(candidates, dtype=np.int64)
+
+        # Stable sort: the ties are in the order in which the documents were
+        # written, as in Elasticsearch
+        order = np.argsort(-scores[candidates], kind="stable")[:top_k]
+
+        documents = []
+        for i in candidates[order]:
+            score = float(scores[i])
+            doc = copy.copy(bm25_index.documents[i])
+            doc.meta = dict(doc.meta)
+            if not self.return_embedding:
+                doc.embedding = None
+            doc.score = score
+            # Same scaling as ElasticsearchDocumentStore for BM25 scores
+            doc.probability = float(1 / (1 + np.exp(-score / 8)))
+            documents.append(doc)
+        return documents
+
+
+class BM25Index:
+    """
+    Inverted index of documents, with one posting list per field and term.
+    The scores are the ones of Lucene's BM25Similarity, including the lossy
+    encoding of the field lengths, summed over the fields as done by a
+    multi_match query of type most_fields.
+    """
+
+    def __init__(self, documents: List[Document], boosts: Dict[str, float],
+                 k1: float = 1.2, b: float = 0.75):
+        self.documents = documents
+        self.fields = {field: BM25Field(documents, field, boost, k1, b)
+                       for field, boost in boosts.items()}
+
+    def score(self, terms: List[str]) -> np.ndarray:
+        scores = np.zeros(len(self.documents), dtype=np.float32)
+        for field in self.fields.values():
+            field.add_scores(terms, scores)
+        return scores
+
+
+class BM25Field:
+    def __init__(self, documents: List[Document], field: str, boost: float,
+                 k1: float, b: float):
+        self.boost = boost
+        self.k1 = k1
+        self.b = b
+
+        postings = {}
+        lengths = np.zeros(len(documents), dtype=np.int64)
+        for position, doc in enumerate(documents):
+            value = doc.text if field == "text" else doc.meta.get(field)
+            if value is None:
+                continue
+            terms = analyze(str(value))
+            lengths[position] = len(terms)
+            frequencies = {}
+            for term in terms:
+                frequencies[term] = frequencies.get(term, 0) + 1
+            for term, frequency in frequencies.items():
+                postings.setdefault(term, ([], []))
+                postings[term][0].append(position)
+                postings[term][1].append(frequency)
+
+        self.postings = {term: (np.asarray(positions, dtype=np.int64),
+                                np.asarray(frequencies, dtype=np.float32))
+                         for term, (positions, frequencies) in postings.items()}
+
+        # Statistics of the documents that have the field
+        self.doc_count = int(np.count_nonzero(lengths))
+        avgdl = lengths.sum() / self.doc_count if self.doc_count else 1
+        encoded_lengths = np.asarray([decode_length(encode_length(int(length))) for length in lengths],
+                                     dtype=np.float32)
+        self.length_norms = k1 * ((1 - b) + b * encoded_lengths / avgdl)
+
+    def add_scores(self, terms: List[str], scores: np.ndarray):
+        # A term repeated in the query is counted once per occurrence, as in
+        # the boolean query built by Elasticsearch
+        for term in terms:
+            if term not in self.postings:
+                continue
+            positions, frequencies = self.postings[term]
+            doc_freq = len(positions)
+            idf = np.log(1 + (self.doc_count - doc_freq + 0.5) / (doc_freq + 0.5))
+            scores[positions] += (self.boost * idf * frequencies
+                                  / (frequencies + self.length_norms[positions]))
+
+
+def matches_filters(doc: Document, filters: Dict[str, List[str]]) -> bool:
+    for key, values in filters.items():
+        value = doc.meta.get(key)
+        doc_values = value if isinstance(value, list) else [value]
+        if not any(doc_value in values for doc_value in doc_values):
+            return False
+    return True
+
+
+# Lucene stores the field lengths on one byte (SmallFloat.intToByte4): the
+# lengths below NUM_FREE_VALUES are exact, the others are rounded down with a
+# 4 bit mantissa.
+NUM_FREE_VALUES = 24
+
+
+def encode_length(length: int) -> int:
+    if length < NUM_FREE_VALUES:
+        return length
+    length -= NUM_FREE_VALUES
+    num_bits = length.bit_length()
+    if num_bits < 4:
+        return NUM_FREE_VALUES + length
+    shift = num_bits - 4
+    return NUM_FREE_VALUES + (((length >> shift) & 0x07) | ((shift + 1) << 3))
+
+
+def decode_length(encoded: int) -> int:
+    if encoded < NUM_FREE_VALUES:
+        return encoded
+    encoded -= NUM_FREE_VALUES
+    bits = encoded & 0x07
+    shift = (encoded >> 3) - 1
+    if shift == -1:
+        return NUM_FREE_VALUES + bits
+    return NUM_FREE_VALUES + ((bits | 0x08) << shift)
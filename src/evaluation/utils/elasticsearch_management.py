@@ -2,6 +2,8 @@ import logging
 import platform
 import subprocess
 import time
+from contextlib import contextmanager
+from pathlib import Path
 
 from elasticsearch import Elasticsearch
 
@@ -38,6 +40,42 @@ def delete_indices(hostname = "localhost", port = "9200", index="document"):
     es.indices.delete(index=index, ignore=[400, 404])
 
 
+def mark_index_complete(hostname = "localhost", port = "9200", index="document"):
+    """
+    Flags index as completely built in its mapping metadata, see is_index_complete.
+    """
+    es = Elasticsearch([f"http://{hostname}:{port}/"], verify_certs=True)
+    es.indices.put_mapping(index=index, body={"_meta": {"complete": True}})
+
+
+def is_index_complete(hostname = "localhost", port = "9200", index="document"):
+    """
+    Returns True if index exists and was flagged by mark_index_complete.
+    """
+    es = Elasticsearch([f"http://{hostname}:{port}/"], verify_certs=True)
+    if not es.indices.exists(index=index):
+        return False
+    mapping = es.indices.get_mapping(index=index)[index]["mappings"]
+    return mapping.get("_meta", {}).get("complete", False)
+
+
+@contextmanager
+def index_lock(index, lock_dir="./.cache"):
+    """
+    Context manager holding an exclusive file lock for index, so that only one
+    process at a time builds it.
+    """
+    import fcntl
+
+    Path(lock_dir).mkdir(parents=True, exist_ok=True)
+    with open(Path(lock_dir) / f"{index}.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
 def prepare_mapping(mapping, title_boosting_factor=1, embedding_dimension=768):
     mapping["mappings"]["properties"]["name"]["boost"] = title_boosting_factor
     mapping["mappings"]["properties"]["emb"]["dims"] = embedding_dimension
@@ -0,0 +1,251 @@
+"""
+Python version of the French analyzer of the Elasticsearch indices (see
+analyzer_default in src.evaluation.utils.pipelines.components.document_stores):
+standard tokenizer, elision, lowercase, French stop words and light_french
+stemmer. It is used by the in-memory BM25DocumentStore so that its tokens are
+the same as the ones indexed by Elasticsearch.
+"""
+
+import re
+from typing import List
+
+# Same articles as the french_elision filter of analyzer_default
+FRENCH_ELISION_ARTICLES = {
+    "l", "m", "t", "qu", "n", "s", "j", "d", "c", "jusqu", "quoiqu", "lorsqu",
+    "puisqu",
+}
+
+# The _french_ stop words of Elasticsearch (Lucene's french_stop.txt)
+FRENCH_STOPWORDS = set("""
+au aux avec ce ces dans de des du elle en et eux il je la le leur lui ma mais
+me même mes moi mon ne nos notre nous on ou par pas pour qu que qui sa se ses
+son sur ta te tes toi ton tu un une vos votre vous c d j l à m n s t y été
+étée étées étés étant suis es est sommes êtes sont serai seras sera serons
+serez seront serais serait serions seriez seraient étais était étions étiez
+étaient fus fut fûmes fûtes furent sois soit soyons soyez soient fusse fusses
+fût fussions fussiez fussent ayant eu eue eues eus ai as avons avez ont aurai
+auras aura aurons aurez auront aurais aurait aurions auriez auraient avais
+avait avions aviez avaient eut eûmes eûtes eurent aie aies ait ayons ayez
+aient eusse eusses eût eussions eussiez eussent ceci cela celà cet cette ici
+ils les leurs quel quels quelle quelles sans soi
+""".split())
+
+# Approximation of the Unicode word boundaries of the standard tokenizer:
+# apostrophes and dots between two word characters do not split a token
+# ("l'impôt", "3.5").
+TOKEN_PATTERN = re.compile(r"\w+(?:['’.]\w+)*")
+
+APOSTROPHES = "'’"
+
+ACCENTS = str.maketrans("àáâôèéêùûîç", "aaaoeeeuuic")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text)
+
+
+def elision(token: str) -> str:
+    """
+    Removes the article before the first apostrophe of token, e.g. "l'impôt"
+    becomes "impôt".
+    """
+    for i, char in enumerate(token):
+        if char in APOSTROPHES:
+            if token[:i].lower() in FRENCH_ELISION_ARTICLES:
+                return token[i + 1:]
+            return token
+    return token
+
+
+def light_french_stem(token: str) -> str:
+    """
+    Light French stemmer of Savoy, as implemented by Lucene's
+    FrenchLightStemmer (the light_french stemmer of Elasticsearch).
+    """
+    s = list(token)
+    n = len(s)
+
+    def ends_with(suffix):
+        return n >= len(suffix) and "".join(s[n - len(suffix):n]) == suffix
+
+    if n > 5 and s[n - 1] == "x":
+        if s[n - 3] == "a" and s[n - 2] == "u" and s[n - 4] != "e":
+            s[n - 2] = "l"
+        n -= 1
+
+    if n > 3 and s[n - 1] == "x":
+        n -= 1
+
+    if n > 3 and s[n - 1] == "s":
+        n -= 1
+
+    if n > 9 and ends_with("issement"):
+        n -= 6
+        s[n - 1] = "r"
+        return _norm(s, n)
+
+    if n > 8 and ends_with("issant"):
+        n -= 4
+        s[n - 1] = "r"
+        return _norm(s, n)
+
+    if n > 6 and ends_with("ement"):
+        n -= 4
+        if n > 3 and ends_with("ive"):
+            n -= 1
+            s[n - 1] = "f"
+        return _norm(s, n)
+
+    if n > 11 and ends_with("ficatrice"):
+        n -= 5
+        s[n - 2] = "e"
+        s[n - 1] = "r"
+        return _norm(s, n)
+
+    if n > 10 and ends_with("ficateur"):
+        n -= 4
+        s[n - 2] = "e"
+        s[n - 1] = "r"
+        return _norm(s, n)
+
+    if n > 9 and ends_with("catrice"):
+        n -= 3
+        s[n - 4] = "q"
+        s[n - 3] = "u"
+        s[n - 2] = "e"
+        return _norm(s, n)
+
+    if n > 8 and ends_with("cateur"):
+        n -= 2
+        s[n - 4] = "q"
+        s[n - 3] = "u"
+        s[n - 2] = "e"
+        s[n - 1] = "r"
+        return _norm(s, n)
+
+    if n > 8 and ends_with("atrice"):
+        n -= 4
+        s[n - 2] = "e"
+        s[n - 1] = "r"
+        return _norm(s, n)
+
+    if n > 7 and ends_with("ateur"):
+        n -= 3
+        s[n - 2] = "e"
+        s[n - 1] = "r"
+        return _norm(s, n)
+
+    if n > 6 and ends_with("trice"):
+        n -= 1
+        s[n - 3] = "e"
+        s[n - 2] = "u"
+        s[n - 1] = "r"
+
+    if n > 5 and ends_with("ième"):
+        return _norm(s, n - 4)
+
+    if n > 7 and ends_with("teuse"):
+        n -= 2
+        s[n - 1] = "r"
+        return _norm(s, n)
+
+    if n > 6 and ends_with("teur"):
+        n -= 1
+        s[n - 1] = "r"
+        return _norm(s, n)
+
+    if n > 5 and ends_with("euse"):
+        return _norm(s, n - 2)
+
+    if n > 8 and ends_with("ère"):
+        n -= 1
+        s[n - 2] = "e"
+        return _norm(s, n)
+
+    if n > 7 and ends_with("ive"):
+        n -= 1
+        s[n - 1] = "f"
+        return _norm(s, n)
+
+    if n > 4 and (ends_with("folle") or ends_with("molle")):
+        n -= 2
+        s[n - 1] = "u"
+        return _norm(s, n)
+
+    if n > 9 and ends_with("nnelle"):
+        return _norm(s, n - 5)
+
+    if n > 9 and ends_with("nnel"):
+        return _norm(s, n - 3)
+
+    if n > 4 and ends_with("ète"):
+        n -= 1
+        s[n - 2] = "e"
+
+    if n > 8 and ends_with("ique"):
+        n -= 4
+
+    if n > 8 and ends_with("esse"):
+        return _norm(s, n - 3)
+
+    if n > 7 and ends_with("inage"):
+        return _norm(s, n - 3)
+
+    if n > 9 and ends_with("isation"):
+        n -= 7
+        if n > 5 and ends_with("ual"):
+            s[n - 2] = "e"
+        return _norm(s, n)
+
+    if n > 9 and ends_with("isateur"):
+        return _norm(s, n - 7)
+
+    if n > 8 and ends_with("ation"):
+        return _norm(s, n - 5)
+
+    if n > 8 and ends_with("ition"):
+        return _norm(s, n - 5)
+
+    return _norm(s, n)
+
+
+def _norm(s: List[str], n: int) -> str:
+    word = "".join(s[:n])
+
+    if len(word) > 4:
+        word = word.translate(ACCENTS)
+        # Remove the doubled letters
+        chars = [word[0]]
+        for char in word[1:]:
+            if not (char == chars[-1] and char.isalpha()):
+                chars.append(char)
+        word = "".join(chars)
+
+    if len(word) > 4 and word.endswith("ie"):
+        word = word[:-2]
+
+    if len(word) > 4:
+        if word[-1] == "r":
+            word = word[:-1]
+        if word[-1] == "e":
+            word = word[:-1]
+        if word[-1] == "e":
+            word = word[:-1]
+        if word[-1] == word[-2] and word[-1].isalpha():
+            word = word[:-1]
+
+    return word
+
+
+def analyze(text: str) -> List[str]:
+    """
+    Returns the terms indexed by the default analyzer of the Elasticsearch
+    indices for text.
+    """
+    terms = []
+    for token in tokenize(text):
+        token = elision(token).lower()
+        if not token or token in FRENCH_STOPWORDS:
+            continue
+        terms.append(light_french_stem(token))
+    return terms
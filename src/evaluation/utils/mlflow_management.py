@@ -6,6 +6,7 @@ from datetime import datetime
 from pathlib import Path
 
 import mlflow
+import pandas as pd
 from dotenv import load_dotenv
 from tqdm import tqdm
 from src.evaluation.utils.logging_management import logger
@@ -87,21 +88,62 @@ def create_run_ids(parameters_grid):
         )
     ).hexdigest()[:8]
     hash_code = hash_piaf_code()
-    hash_file = {}
+    hashes_file = {}
     run_ids = []
     for param in parameters_grid:
         file = param["squad_dataset"]
-        if file not in hash_file.keys():
-            with open(file, "r", encoding="utf-8") as f:
-                file_content = f.read()
-            file_hash = hashlib.md5(file_content.encode("utf-8")).hexdigest()[:8]
-            hash_file[file] = file_hash
+        if file not in hashes_file.keys():
+            hashes_file[file] = hash_file(file)
         hash_param = hashlib.md5(str(param).encode("utf-8")).hexdigest()[:8]
-        id = git_commit + hash_code + hash_librairies + hash_file[file] + hash_param
+        id = git_commit + hash_code + hash_librairies + hashes_file[file] + hash_param
         run_ids.append(id)
     return run_ids
 
 
+def hash_file(file):
+    """
+    Returns the first 8 characters of the md5 sum of the content of file.
+    """
+    with open(file, "r", encoding="utf-8") as f:
+        file_content = f.read()
+    return hashlib.md5(file_content.encode("utf-8")).hexdigest()[:8]
+
+
+# Parameters defining the embeddings stored in the document index for each
+# retriever type. Retriever types missing here do not store embeddings.
+EMBEDDING_PARAMETERS = {
+    "sbert": ("sbert", "retriever_model_version"),
+    "dpr": ("dpr", "dpr_model_version"),
+    "title": ("title", "retriever_model_version"),
+    "title_bm25": ("title", "retriever_model_version"),
+    "hot_reader": ("title", "retriever_model_version"),
+}
+
+
+def create_index_key(parameters):
+    """
+    This function creates a key identifying the content of the Elasticsearch indices built for a run: the hash of the
+    knowledge base file, the preprocessing parameters, the title boosting and the embeddings stored for the retriever.
+    Two runs with the same key can use the same indices, for example runs that only differ on the reader parameters.
+
+    :param parameters: the parameters of the run
+    :return: the index key
+    """
+    preprocessing = parameters["preprocessing"]
+    index_params = {
+        "preprocessing": preprocessing,
+        "split_by": parameters["split_by"] if preprocessing else None,
+        "split_length": parameters["split_length"] if preprocessing else None,
+        "boosting": parameters["boosting"],
+    }
+    if parameters["retriever_type"] in EMBEDDING_PARAMETERS:
+        embedding, model_version = EMBEDDING_PARAMETERS[parameters["retriever_type"]]
+        index_params["embedding"] = (embedding, parameters[model_version])
+
+    hash_params = hashlib.md5(str(index_params).encode("utf-8")).hexdigest()[:8]
+    return hash_file(parameters["squad_dataset"]) + hash_params
+
+
 def prepare_mlflow_server():
     try:
         tracking_uri = os.getenv("MLFLOW_TRACKING_SERVER_URI")
@@ -145,6 +187,9 @@ def mlflow_log_run(
             logger.error(f"Could not upload {yaml_path} to mlflow server.")
         if pass_criteria != None:
             mlflow.set_tag("pass_criteria", pass_criteria)
+        if retriever_reader_eval_results.get("reader_cache_hit_rate"):
+            # The latencies of this run include reader predictions read from the cache
+            mlflow.set_tag("latencies_from_cache", True)
         logger.info(f"Run finished successfully")
         try:
             mlflow.log_artifact(root_log_path)
@@ -153,3 +198,90 @@ def mlflow_log_run(
                 f"Could not upload log to artifact server. "
                 f"Still saved in logs/root_complete.log"
             )
+
+
+def mlflow_log_pareto_front(
+        front,
+        accuracy_metric,
+        latency_metric,
+        latency_budget=None,
+        result_file_path=Path("./output/pareto_front.csv"),
+        ):
+    """
+    Logs the Pareto front of accuracy versus latency found by a multi-objective
+    tuning in an MLflow run named pareto_front. The accuracy and the latency of
+    the runs of the front are logged as metrics, with the rank of the run in
+    the front as step, and the front is saved to result_file_path and logged as
+    an artifact. When latency_budget is set, the parameters of the most
+    accurate run of the front within the budget are logged as the parameters
+    of the pareto_front run.
+
+    :param front: list of tuples (run_id, params, results), see pareto_front
+    :return: the tuple (run_id, params, results) of the run within the budget,
+        or None
+    """
+    rows = [{"run_id": run_id, accuracy_metric: results[accuracy_metric],
+             latency_metric: results[latency_metric], **params}
+            for run_id, params, results in front]
+    result_file_path.parent.mkdir(parents=True, exist_ok=True)
+    pd.DataFrame(rows).to_csv(result_file_path, index=False)
+
+    within_budget = [run for run in front
+                     if latency_budget is None or run[2][latency_metric] <= latency_budget]
+    best_run = within_budget[-1] if within_budget and latency_budget is not None else None
+
+    with mlflow.start_run(run_name="pareto_front"):
+        for step, (run_id, params, results) in enumerate(front):
+            mlflow.log_metric(accuracy_metric, results[accuracy_metric], step=step)
+            mlflow.log_metric(latency_metric, results[latency_metric], step=step)
+        mlflow.set_tag("pareto_front", ",".join(str(run_id) for run_id, _, _ in front))
+        if latency_budget is not None:
+            mlflow.set_tag("latency_budget", latency_budget)
+        if best_run:
+            mlflow.log_params(best_run[1])
+            mlflow.set_tag("best_run", best_run[0])
+        try:
+            mlflow.log_artifact(result_file_path)
+        except Exception:
+            logger.error(f"Could not upload {result_file_path} to mlflow server.")
+
+    return best_run
+
+
+def mlflow_log_rung(
+        rung,
+        n_questions,
+        runs,
+        promoted_run_ids,
+        metric,
+        result_file_path,
+        ):
+    """
+    Logs a rung of a successive halving tuning in an MLflow run named
+    successive_halving_rung_<rung>: the number of questions and of configs of
+    the rung as parameters, the metric of each config as steps of the metric
+    (sorted by decreasing value) and the run ids of the promoted configs as a
+    tag. The results of the rung are saved to result_file_path and logged as
+    an artifact.
+
+    :param runs: list of tuples (run_id, params, results) evaluated in the rung
+    """
+    rows = [{"run_id": run_id, metric: results.get(metric),
+             "promoted": run_id in promoted_run_ids, **params}
+            for run_id, params, results in runs]
+    result_file_path.parent.mkdir(parents=True, exist_ok=True)
+    pd.DataFrame(rows).to_csv(result_file_path, index=False)
+
+    values = sorted((results[metric] for _, _, results in runs
+                     if results.get(metric) is not None), reverse=True)
+
+    with mlflow.start_run(run_name=f"successive_halving_rung_{rung}"):
+        mlflow.log_params({"rung": rung, "n_questions": n_questions,
+                           "n_configs": len(runs), "n_promoted": len(promoted_run_ids)})
+        for step, value in enumerate(values):
+            mlflow.log_metric(metric, value, step=step)
+        mlflow.set_tag("promoted", ",".join(str(run_id) for run_id in promoted_run_ids))
+        try:
+            mlflow.log_artifact(result_file_path)
+        except Exception:
+            logger.error(f"Could not upload {result_file_path} to mlflow server.")
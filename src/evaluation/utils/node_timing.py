@@ -0,0 +1,85 @@
+"""
+Per-node latency instrumentation of haystack pipelines.
+
+`NodeTimer.instrument` wraps the `run` method of every node of a pipeline and
+records the duration of each call. `get_metrics` returns, for each node, its
+number of calls, its total time and the p50/p95/p99 of its latencies, in
+seconds, under metric names that can be logged to MLflow:
+
+    node_Reader_calls, node_Reader_total, node_Reader_p50, node_Reader_p95, ...
+
+The latencies of the whole `pipeline.run` calls, i.e. of each query, are
+returned as query_latency_p50, query_latency_p95 and query_latency_p99.
+
+With batched runs (see `batch_pipeline`), the expensive calls of a node are
+done once for the group of queries before the node runs: the whole batch is
+then counted in the first call of the group, and `pipeline.run` is not called.
+"""
+
+import threading
+import time
+from typing import Dict, List
+
+import numpy as np
+
+PERCENTILES = [50, 95, 99]
+
+# Name under which the latencies of pipeline.run are recorded
+QUERY = "query_latency"
+
+
+class NodeTimer:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.lock = threading.Lock()
+
+    def instrument(self, pipeline):
+        """
+        Times every node of pipeline and its run calls. The timer is kept as
+        pipeline.node_timer.
+        """
+        for name in pipeline.graph.nodes:
+            self.wrap(name, pipeline.graph.nodes[name]["component"])
+        self.wrap(QUERY, pipeline)
+        pipeline.node_timer = self
+
+    def wrap(self, name: str, component):
+        """
+        Times the run calls of component, the node name of a pipeline. Must be
+        called again when the component of a node is replaced.
+        """
+        original_run = component.run
+        self.latencies.setdefault(name, [])
+
+        def run(**kwargs):
+            start = time.perf_counter()
+            try:
+                return original_run(**kwargs)
+            finally:
+                self.record(name, time.perf_counter() - start)
+
+        component.run = run
+
+    def record(self, name: str, latency: float):
+        with self.lock:
+            self.latencies.setdefault(name, []).append(latency)
+
+    def reset(self):
+        with self.lock:
+            self.latencies = {name: [] for name in self.latencies}
+
+    def get_metrics(self) -> Dict[str, float]:
+        metrics = {}
+        with self.lock:
+            for name, latencies in self.latencies.items():
+                if not latencies:
+                    continue
+                if name == QUERY:
+                    prefix = QUERY
+                else:
+                    prefix = f"node_{name}"
+                    metrics[f"{prefix}_calls"] = len(latencies)
+                    metrics[f"{prefix}_total"] = float(np.sum(latencies))
+                for percentile, value in zip(PERCENTILES, np.percentile(latencies, PERCENTILES)):
+                    metrics[f"{prefix}_p{percentile}"] = float(value)
+        return metrics
@@ -14,11 +14,11 @@ components used in the pipelines defined in the `custom_pipelines` submodule.
 
 
 import hashlib
-from haystack.pipeline import Pipeline
 import json
 from pathlib import Path
 
 import src.evaluation.utils.pipelines.custom_pipelines as custom_pipelines
+from src.evaluation.utils.node_timing import NodeTimer
 
 def retriever(
         parameters,
@@ -80,6 +80,29 @@ def retriever_reader(
     # Gather parameters
     retriever_type = parameters["retriever_type"]
 
+    # The in-process dense index, if any, is saved next to the pipeline yaml
+    dense_index = parameters.get("dense_index", "elasticsearch")
+    dense_index_path = pipeline_dirpath(parameters, yaml_dir_prefix) / "dense_index.faiss"
+
+    reader_backend = parameters.get("reader_backend", "pytorch")
+
+    # Adaptive number of documents passed to the reader, k_retriever being the
+    # maximum. Only for the pipelines with a single retriever: the scores of
+    # joined retrievers are not comparable.
+    if parameters.get("pruning_mode"):
+        pruning = {
+            "mode": parameters["pruning_mode"],
+            "threshold": parameters["pruning_threshold"],
+            "min_k": parameters.get("pruning_min_k", 1),
+        }
+    else:
+        pruning = None
+
+    # Cross-encoder re-ranking of the retrieved documents, keeping the
+    # k_reranker best ones for the reader
+    k_reranker = parameters.get("k_reranker")
+    reranker_model_version = parameters.get("reranker_model_version")
+
     if retriever_type == "bm25":
         pipeline = custom_pipelines.retriever_reader_bm25(
             elasticsearch_hostname = elasticsearch_hostname,
@@ -87,7 +110,12 @@ def retriever_reader(
             title_boosting_factor = parameters["boosting"],
             reader_model_version = parameters["reader_model_version"],
             gpu_id = gpu_id,
-            k_reader_per_candidate = parameters["k_reader_per_candidate"])
+            k_reader_per_candidate = parameters["k_reader_per_candidate"],
+            bm25_backend = parameters.get("bm25_backend", "elasticsearch"),
+            reader_backend = reader_backend,
+            pruning = pruning,
+            k_reranker = k_reranker,
+            reranker_model_version = reranker_model_version)
 
     elif retriever_type == "sbert":
         pipeline = custom_pipelines.retriever_reader_sbert(
@@ -97,7 +125,13 @@ def retriever_reader(
             retriever_model_version = parameters["retriever_model_version"],
             reader_model_version = parameters["reader_model_version"],
             gpu_id = gpu_id,
-            k_reader_per_candidate = parameters["k_reader_per_candidate"])
+            k_reader_per_candidate = parameters["k_reader_per_candidate"],
+            dense_index = dense_index,
+            dense_index_path = dense_index_path,
+            reader_backend = reader_backend,
+            pruning = pruning,
+            k_reranker = k_reranker,
+            reranker_model_version = reranker_model_version)
 
     elif retriever_type == "dpr":
         pipeline = custom_pipelines.retriever_reader_dpr(
@@ -107,7 +141,13 @@ def retriever_reader(
             dpr_model_version = parameters["dpr_model_version"],
             reader_model_version = parameters["reader_model_version"],
             gpu_id = gpu_id,
-            k_reader_per_candidate = parameters["k_reader_per_candidate"])
+            k_reader_per_candidate = parameters["k_reader_per_candidate"],
+            dense_index = dense_index,
+            dense_index_path = dense_index_path,
+            reader_backend = reader_backend,
+            pruning = pruning,
+            k_reranker = k_reranker,
+            reranker_model_version = reranker_model_version)
 
     elif retriever_type == "title_bm25":
         pipeline = custom_pipelines.retriever_reader_title_bm25(
@@ -119,7 +159,12 @@ def retriever_reader(
             gpu_id = gpu_id,
             k_reader_per_candidate = parameters["k_reader_per_candidate"],
             k_title_retriever = parameters["k_title_retriever"],
-            k_bm25_retriever = parameters["k_retriever"])
+            k_bm25_retriever = parameters["k_retriever"],
+            dense_index = dense_index,
+            dense_index_path = dense_index_path,
+            reader_backend = reader_backend,
+            k_reranker = k_reranker,
+            reranker_model_version = reranker_model_version)
 
     elif retriever_type == "title":
         pipeline = custom_pipelines.retriever_reader_title(
@@ -129,7 +174,13 @@ def retriever_reader(
             retriever_model_version = parameters["retriever_model_version"],
             reader_model_version = parameters["reader_model_version"],
             gpu_id = gpu_id,
-            k_reader_per_candidate = parameters["k_reader_per_candidate"])
+            k_reader_per_candidate = parameters["k_reader_per_candidate"],
+            dense_index = dense_index,
+            dense_index_path = dense_index_path,
+            reader_backend = reader_backend,
+            pruning = pruning,
+            k_reranker = k_reranker,
+            reranker_model_version = reranker_model_version)
 
     elif retriever_type == "hot_reader":
         pipeline = custom_pipelines.hottest_reader_pipeline(
@@ -142,7 +193,10 @@ def retriever_reader(
             k_reader_per_candidate = parameters["k_reader_per_candidate"],
             k_title_retriever = parameters["k_title_retriever"],
             k_bm25_retriever = parameters["k_retriever"],
-            threshold_score = parameters["threshold_score"])
+            threshold_score = parameters["threshold_score"],
+            dense_index = dense_index,
+            dense_index_path = dense_index_path,
+            reader_backend = reader_backend)
 
     else:
         logging.error(
@@ -157,7 +211,32 @@ def retriever_reader(
 
     return pipeline
 
+def uses_elasticsearch(parameters):
+    """
+    Returns False if the pipeline built from parameters does not need
+    Elasticsearch, i.e. its documents are searched by the in-memory
+    BM25DocumentStore.
+    """
+    return not (parameters["retriever_type"] == "bm25"
+            and parameters.get("bm25_backend", "elasticsearch") == "local")
+
 def pipeline_to_yaml_and_back(pipeline, parameters, prefix = "./output/pipelines/"):
+    yaml_path = save_pipeline_yaml(pipeline, parameters, prefix)
+
+    # Turn off overwriting with env variable to avoid accidentally constructing
+    # a different pipeline that the one defined in the yaml. Load it with the
+    # class of the original pipeline (e.g. ParallelPipeline).
+    pipeline = type(pipeline).load_from_yaml(yaml_path, overwrite_with_env_variables = False)
+
+    # Record the latency of each node, see pipeline.node_timer
+    NodeTimer().instrument(pipeline)
+    return pipeline
+
+def save_pipeline_yaml(pipeline, parameters, prefix = "./output/pipelines/"):
+    """
+    Saves the pipeline yaml and the parameters it was built from in the
+    directory of the parameters. Returns the path of the yaml file.
+    """
     dirname = pipeline_dirpath(parameters, prefix)
     dirname.mkdir(parents = True, exist_ok = True)
 
@@ -168,9 +247,7 @@ def pipeline_to_yaml_and_back(pipeline, parameters, prefix = "./output/pipelines
     with open(params_path, "w") as f:
         f.write(repr(parameters))
 
-    # Turn off overwriting with env variable to avoid accidentally constructing
-    # a different pipeline that the one defined in the yaml.
-    return Pipeline.load_from_yaml(yaml_path, overwrite_with_env_variables = False)
+    return yaml_path
 
 def pipeline_dirpath(parameters, prefix = "./output/pipelines/"):
     params_hash = hashlib.sha1(json.dumps(parameters, sort_keys=True).encode()).hexdigest()
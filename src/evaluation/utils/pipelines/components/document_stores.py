@@ -1,9 +1,45 @@
 from haystack.document_store.elasticsearch import ElasticsearchDocumentStore
 
+from deployment.roles.haystack.files.custom_component import \
+        ANNElasticsearchDocumentStore
+from src.evaluation.utils.bm25_document_store import BM25DocumentStore
+
 def elasticsearch(elasticsearch_hostname, elasticsearch_port,
-        similarity, embedding_dim, title_boosting_factor):
+        similarity, embedding_dim, title_boosting_factor,
+        dense_index = "elasticsearch", dense_index_path = None):
+    """
+    :param dense_index: "elasticsearch" to do the dense retrieval with a
+        script_score query in Elasticsearch, or the faiss index factory string
+        (e.g. "HNSW32") of the in-process index used instead
+    :param dense_index_path: Where the faiss index is saved
+    """
+
+    if dense_index != "elasticsearch":
+        return ANNElasticsearchDocumentStore(
+            ann_index_path=str(dense_index_path),
+            faiss_index_factory_str=dense_index,
+            **elasticsearch_params(elasticsearch_hostname, elasticsearch_port,
+                similarity, embedding_dim, title_boosting_factor))
 
     return ElasticsearchDocumentStore(
+            **elasticsearch_params(elasticsearch_hostname, elasticsearch_port,
+                similarity, embedding_dim, title_boosting_factor))
+
+def local_bm25(title_boosting_factor):
+    """
+    In-memory document store whose BM25 queries reproduce the ones of the
+    elasticsearch document store, for evaluations without Elasticsearch.
+    """
+    return BM25DocumentStore(
+            index="document_elasticsearch",
+            label_index="label_elasticsearch",
+            search_fields=["name", "text"],
+            title_boosting_factor=title_boosting_factor,
+        )
+
+def elasticsearch_params(elasticsearch_hostname, elasticsearch_port,
+        similarity, embedding_dim, title_boosting_factor):
+    return dict(
             host=elasticsearch_hostname,
             port=elasticsearch_port,
             username="",
@@ -1,6 +1,22 @@
 from haystack.reader.transformers import TransformersReader
 
-def transformers_reader(reader_model_version, gpu_id, k_reader_per_candidate):
+from deployment.roles.haystack.files.custom_component import \
+        ONNXTransformersReader
+
+def transformers_reader(reader_model_version, gpu_id, k_reader_per_candidate,
+        reader_backend = "pytorch"):
+    """
+    :param reader_backend: "pytorch", or "onnx" to run the model quantized to
+        int8 with onnxruntime on CPU (see ONNXTransformersReader)
+    """
+    if reader_backend == "onnx":
+        return ONNXTransformersReader(
+            model_name_or_path="etalab-ia/camembert-base-squadFR-fquad-piaf",
+            tokenizer="etalab-ia/camembert-base-squadFR-fquad-piaf",
+            model_version=reader_model_version,
+            top_k_per_candidate=k_reader_per_candidate,
+        )
+
     return TransformersReader(
         model_name_or_path="etalab-ia/camembert-base-squadFR-fquad-piaf",
         tokenizer="etalab-ia/camembert-base-squadFR-fquad-piaf",
@@ -8,4 +24,3 @@ def transformers_reader(reader_model_version, gpu_id, k_reader_per_candidate):
         use_gpu=gpu_id,
         top_k_per_candidate=k_reader_per_candidate,
     )
-
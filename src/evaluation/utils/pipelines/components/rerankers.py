@@ -0,0 +1,10 @@
+from deployment.roles.haystack.files.custom_component import \
+        CrossEncoderReranker
+
+def cross_encoder(k_reranker, gpu_id, reranker_model_version = None):
+    return CrossEncoderReranker(
+        model_name_or_path="cross-encoder/mmarco-mMiniLMv2-L12-H384-v1",
+        model_version=reranker_model_version,
+        top_k=k_reranker,
+        use_gpu=gpu_id,
+    )
@@ -13,11 +13,12 @@ from haystack.schema import BaseComponent
 
 from deployment.roles.haystack.files.custom_component import \
     MergeOverlappingAnswers, JoinDocumentsCustom, JoinAnswers, \
-    AnswerifyDocuments, StripLeadingSpace
+    AnswerifyDocuments, StripLeadingSpace, ParallelPipeline, PruneDocuments
 
 import src.evaluation.utils.pipelines.components.document_stores as document_stores
 import src.evaluation.utils.pipelines.components.evals as evals
 import src.evaluation.utils.pipelines.components.readers as readers
+import src.evaluation.utils.pipelines.components.rerankers as rerankers
 import src.evaluation.utils.pipelines.components.retrievers as retrievers
 
 # TODO: Obsolete?
@@ -120,7 +121,8 @@ class TitleBM25QAPipeline(BaseStandardPipeline):
 
 
 
-def retriever_reader(reader, retriever, eval_retriever, eval_reader):
+def retriever_reader(reader, retriever, eval_retriever, eval_reader,
+        pruning = None, reranker = None):
     """
     Returns an Evaluation Pipeline for Extractive Question Answering. This Pipeline is based on retriever reader architecture.
     it includes two evaluation nodes :
@@ -131,6 +133,10 @@ def retriever_reader(reader, retriever, eval_retriever, eval_reader):
     :param retriever: Retriever instance
     :param eval_retriever: EvalRetriever instance or None
     :param eval_reader: EvalReader instance or None
+    :param pruning: None, or the parameters of a PruneDocuments node added
+        before the reader (mode, threshold, min_k)
+    :param reranker: None, or a CrossEncoderReranker instance added before the
+        reader
     """
 
     pipeline = Pipeline()
@@ -139,20 +145,32 @@ def retriever_reader(reader, retriever, eval_retriever, eval_reader):
             name="Retriever",
             inputs=["Query"])
 
+    reader_input = "Retriever"
     if eval_retriever:
         pipeline.add_node(
                 component=eval_retriever,
                 name="EvalRetriever",
-                inputs=["Retriever"])
+                inputs=[reader_input])
+        reader_input = "EvalRetriever"
+
+    if pruning:
         pipeline.add_node(
-                component=reader,
-                name="Reader",
-                inputs=["EvalRetriever"])
-    else:
+                component=PruneDocuments(**pruning),
+                name="PruneDocuments",
+                inputs=[reader_input])
+        reader_input = "PruneDocuments"
+
+    if reranker:
         pipeline.add_node(
-                component=reader,
-                name="Reader",
-                inputs=["Retriever"])
+                component=reranker,
+                name="Reranker",
+                inputs=[reader_input])
+        reader_input = "Reranker"
+
+    pipeline.add_node(
+            component=reader,
+            name="Reader",
+            inputs=[reader_input])
 
     pipeline.add_node(
             component=MergeOverlappingAnswers(),
@@ -263,17 +281,37 @@ def retriever_reader_bm25(
         title_boosting_factor,
         reader_model_version,
         gpu_id,
-        k_reader_per_candidate):
+        k_reader_per_candidate,
+        bm25_backend = "elasticsearch",
+        reader_backend = "pytorch",
+        pruning = None,
+        k_reranker = None,
+        reranker_model_version = None):
+    """
+    :param bm25_backend: "elasticsearch", or "local" to search the documents
+        with the in-memory BM25DocumentStore instead of Elasticsearch
+    :param reader_backend: "pytorch", or "onnx" for the quantized
+        ONNXTransformersReader
+    :param pruning: See retriever_reader
+    :param k_reranker: None, or the number of documents kept by a
+        CrossEncoderReranker added before the reader
+    """
 
-    document_store = document_stores.elasticsearch(
-            elasticsearch_hostname, elasticsearch_port,
-            similarity = "cosine", embedding_dim = 768,
-            title_boosting_factor = title_boosting_factor)
+    if bm25_backend == "local":
+        document_store = document_stores.local_bm25(title_boosting_factor)
+    else:
+        document_store = document_stores.elasticsearch(
+                elasticsearch_hostname, elasticsearch_port,
+                similarity = "cosine", embedding_dim = 768,
+                title_boosting_factor = title_boosting_factor)
 
     retriever = retrievers.bm25(document_store)
 
     reader = readers.transformers_reader(reader_model_version, gpu_id,
-            k_reader_per_candidate)
+            k_reader_per_candidate, reader_backend = reader_backend)
+
+    reranker = rerankers.cross_encoder(k_reranker, gpu_id,
+            reranker_model_version) if k_reranker else None
 
     eval_retriever = evals.piaf_eval_retriever()
     eval_reader = evals.piaf_eval_reader()
@@ -282,7 +320,9 @@ def retriever_reader_bm25(
             reader = reader,
             retriever = retriever,
             eval_retriever = eval_retriever,
-            eval_reader = eval_reader)
+            eval_reader = eval_reader,
+            pruning = pruning,
+            reranker = reranker)
 
 
 
@@ -294,20 +334,31 @@ def retriever_reader_sbert(
         retriever_model_version,
         reader_model_version,
         gpu_id,
-        k_reader_per_candidate):
+        k_reader_per_candidate,
+        dense_index = "elasticsearch",
+        dense_index_path = None,
+        reader_backend = "pytorch",
+        pruning = None,
+        k_reranker = None,
+        reranker_model_version = None):
 
     document_store = document_stores.elasticsearch(
             elasticsearch_hostname, elasticsearch_port,
             similarity = "cosine", embedding_dim = 768,
-            title_boosting_factor = title_boosting_factor)
+            title_boosting_factor = title_boosting_factor,
+            dense_index = dense_index,
+            dense_index_path = dense_index_path)
 
     gpu_available = gpu_id >= 0
 
     retriever = retrievers.sbert(document_store, retriever_model_version,
             gpu_available)
 
-    reader = readers.transformers_reader(reader_model_version, gpu_id, 
-            k_reader_per_candidate)
+    reader = readers.transformers_reader(reader_model_version, gpu_id,
+            k_reader_per_candidate, reader_backend = reader_backend)
+
+    reranker = rerankers.cross_encoder(k_reranker, gpu_id,
+            reranker_model_version) if k_reranker else None
 
     eval_retriever = evals.piaf_eval_retriever()
     eval_reader = evals.piaf_eval_reader()
@@ -316,7 +367,9 @@ def retriever_reader_sbert(
             reader = reader,
             retriever = retriever,
             eval_retriever = eval_retriever,
-            eval_reader = eval_reader)
+            eval_reader = eval_reader,
+            pruning = pruning,
+            reranker = reranker)
 
 
 
@@ -328,12 +381,20 @@ def retriever_reader_dpr(
         dpr_model_version,
         reader_model_version,
         gpu_id,
-        k_reader_per_candidate):
+        k_reader_per_candidate,
+        dense_index = "elasticsearch",
+        dense_index_path = None,
+        reader_backend = "pytorch",
+        pruning = None,
+        k_reranker = None,
+        reranker_model_version = None):
 
     document_store = document_stores.elasticsearch(
             elasticsearch_hostname, elasticsearch_port,
             similarity = "dot_product", embedding_dim = 768,
-            title_boosting_factor = title_boosting_factor)
+            title_boosting_factor = title_boosting_factor,
+            dense_index = dense_index,
+            dense_index_path = dense_index_path)
 
     gpu_available = gpu_id >= 0
 
@@ -341,7 +402,10 @@ def retriever_reader_dpr(
             gpu_available)
 
     reader = readers.transformers_reader(reader_model_version, gpu_id,
-            k_reader_per_candidate)
+            k_reader_per_candidate, reader_backend = reader_backend)
+
+    reranker = rerankers.cross_encoder(k_reranker, gpu_id,
+            reranker_model_version) if k_reranker else None
 
     eval_retriever = evals.piaf_eval_retriever()
     eval_reader = evals.piaf_eval_reader()
@@ -350,7 +414,9 @@ def retriever_reader_dpr(
             reader = reader,
             retriever = retriever,
             eval_retriever = eval_retriever,
-            eval_reader = eval_reader)
+            eval_reader = eval_reader,
+            pruning = pruning,
+            reranker = reranker)
 
 
 
@@ -364,7 +430,12 @@ def retriever_reader_title_bm25(
         gpu_id,
         k_reader_per_candidate,
         k_title_retriever,
-        k_bm25_retriever):
+        k_bm25_retriever,
+        dense_index = "elasticsearch",
+        dense_index_path = None,
+        reader_backend = "pytorch",
+        k_reranker = None,
+        reranker_model_version = None):
     """
     Returns an Evaluation Pipeline for Extractive Question Answering. This Pipeline is based on on two retrievers and a reader.
     The two retrievers used for this pipeline are :
@@ -379,7 +450,9 @@ def retriever_reader_title_bm25(
     document_store = document_stores.elasticsearch(
             elasticsearch_hostname, elasticsearch_port,
             similarity = "cosine", embedding_dim = 768,
-            title_boosting_factor = title_boosting_factor)
+            title_boosting_factor = title_boosting_factor,
+            dense_index = dense_index,
+            dense_index_path = dense_index_path)
 
     gpu_available = gpu_id >= 0
 
@@ -388,8 +461,8 @@ def retriever_reader_title_bm25(
 
     retriever_bm25 = retrievers.bm25(document_store)
 
-    reader = readers.transformers_reader(reader_model_version, gpu_id, 
-            k_reader_per_candidate)
+    reader = readers.transformers_reader(reader_model_version, gpu_id,
+            k_reader_per_candidate, reader_backend = reader_backend)
 
     eval_retriever = evals.piaf_eval_retriever()
     eval_reader = evals.piaf_eval_reader()
@@ -409,20 +482,27 @@ def retriever_reader_title_bm25(
             name="JoinResults",
             inputs=["Retriever_bm25", "Retriever_title"])
 
+    reader_input = "JoinResults"
     if eval_retriever:
         pipeline.add_node(
                 component=eval_retriever,
                 name="EvalRetriever",
-                inputs=["JoinResults"])
-        pipeline.add_node(
-                component=reader,
-                name="Reader",
-                inputs=["EvalRetriever"])
-    else:
+                inputs=[reader_input])
+        reader_input = "EvalRetriever"
+
+    # The cross-encoder scores the joined documents on the same scale
+    if k_reranker:
         pipeline.add_node(
-                component=reader,
-                name="Reader",
-                inputs=["JoinResults"])
+                component=rerankers.cross_encoder(k_reranker, gpu_id,
+                    reranker_model_version),
+                name="Reranker",
+                inputs=[reader_input])
+        reader_input = "Reranker"
+
+    pipeline.add_node(
+            component=reader,
+            name="Reader",
+            inputs=[reader_input])
 
     pipeline.add_node(
             component=MergeOverlappingAnswers(),
@@ -451,12 +531,20 @@ def retriever_reader_title(
         retriever_model_version,
         reader_model_version,
         gpu_id,
-        k_reader_per_candidate):
+        k_reader_per_candidate,
+        dense_index = "elasticsearch",
+        dense_index_path = None,
+        reader_backend = "pytorch",
+        pruning = None,
+        k_reranker = None,
+        reranker_model_version = None):
 
     document_store = document_stores.elasticsearch(
             elasticsearch_hostname, elasticsearch_port,
             similarity = "cosine", embedding_dim = 768,
-            title_boosting_factor = title_boosting_factor)
+            title_boosting_factor = title_boosting_factor,
+            dense_index = dense_index,
+            dense_index_path = dense_index_path)
 
     gpu_available = gpu_id >= 0
 
@@ -464,7 +552,10 @@ def retriever_reader_title(
             gpu_available)
 
     reader = readers.transformers_reader(reader_model_version, gpu_id,
-            k_reader_per_candidate)
+            k_reader_per_candidate, reader_backend = reader_backend)
+
+    reranker = rerankers.cross_encoder(k_reranker, gpu_id,
+            reranker_model_version) if k_reranker else None
 
     eval_retriever = evals.piaf_eval_retriever()
     eval_reader = evals.piaf_eval_reader()
@@ -473,7 +564,9 @@ def retriever_reader_title(
             reader = reader,
             retriever = retriever,
             eval_retriever = eval_retriever,
-            eval_reader = eval_reader)
+            eval_reader = eval_reader,
+            pruning = pruning,
+            reranker = reranker)
 
 
 
@@ -488,7 +581,10 @@ def hottest_reader_pipeline(
             k_reader_per_candidate,
             k_title_retriever,
             k_bm25_retriever,
-            threshold_score):
+            threshold_score,
+            dense_index = "elasticsearch",
+            dense_index_path = None,
+            reader_backend = "pytorch"):
     """
     Initialize a Pipeline for Extractive Question Answering. This Pipeline is based on two retrievers and a reader.
     The two retrievers used for this pipeline are :
@@ -506,7 +602,9 @@ def hottest_reader_pipeline(
             elasticsearch_port = elasticsearch_port,
             similarity = "cosine",
             embedding_dim = 768,
-            title_boosting_factor = title_boosting_factor)
+            title_boosting_factor = title_boosting_factor,
+            dense_index = dense_index,
+            dense_index_path = dense_index_path)
 
     retriever_title = retrievers.title(
             document_store = document_store,
@@ -516,9 +614,9 @@ def hottest_reader_pipeline(
     retriever_bm25 = retrievers.bm25(document_store)
 
     reader = readers.transformers_reader(reader_model_version, gpu_id,
-            k_reader_per_candidate)
+            k_reader_per_candidate, reader_backend = reader_backend)
 
-    pipeline = Pipeline()
+    pipeline = ParallelPipeline()
     pipeline.add_node(
         component=retriever_bm25,
         name="Retriever_bm25",
@@ -0,0 +1,69 @@
+"""
+Retriever metrics computed from a relevance matrix.
+
+The relevance matrix is a boolean array of shape (number of questions, top_k)
+where `relevance[q, j]` is True when the j-th document retrieved for the
+question q is relevant. Since the metrics at k only depend on the first k
+columns, the metrics for every k up to the number of columns are computed from
+the same matrix, i.e. from one retrieval at the largest k.
+"""
+
+from typing import Dict, List
+
+import numpy as np
+
+
+def relevance_matrix(relevance_rows: List[List[bool]], width: int = 0) -> np.ndarray:
+    """
+    Returns the relevance matrix made of `relevance_rows`, padded with False up
+    to the length of the longest row (or `width` if larger).
+    """
+    width = max([width] + [len(row) for row in relevance_rows])
+    relevance = np.zeros((len(relevance_rows), width), dtype=bool)
+    for q, row in enumerate(relevance_rows):
+        relevance[q, :len(row)] = row
+    return relevance
+
+
+def retriever_metrics(relevance: np.ndarray, number_relevant, ks: List[int]) -> Dict[int, Dict]:
+    """
+    Returns a dict {k: metrics} with the recall, map, mrr and ndcg of the
+    retriever at each k of `ks`.
+
+    :param relevance: The relevance matrix of shape (number of questions, top_k)
+    :param number_relevant: The number of relevant documents of each question,
+        used as the denominator of the average precision and to compute the
+        ideal DCG
+    :param ks: The values of k, between 1 and top_k
+    """
+    number_of_questions, width = relevance.shape
+    number_relevant = np.asarray(number_relevant, dtype=float)
+    ranks = np.arange(1, width + 1)
+
+    relevant = relevance.astype(float)
+    hits = np.cumsum(relevant, axis=1)
+    summed_precision = np.cumsum(relevant * hits / ranks, axis=1)
+    first_hit = np.where(relevance.any(axis=1), relevance.argmax(axis=1) + 1, width + 1)
+    discounts = 1 / np.log2(ranks + 1)
+    dcg = np.cumsum(relevant * discounts, axis=1)
+    ideal_dcg = np.concatenate([[0.0], np.cumsum(discounts)])
+
+    metrics = {}
+    for k in ks:
+        correct_retrievals = int((hits[:, k - 1] > 0).sum())
+        avg_precision = np.divide(summed_precision[:, k - 1], number_relevant,
+                                  out=np.zeros(number_of_questions), where=number_relevant > 0)
+        reciprocal_rank = np.where(first_hit <= k, 1 / first_hit, 0.0)
+        ideal = ideal_dcg[np.minimum(number_relevant, k).astype(int)]
+        ndcg = np.divide(dcg[:, k - 1], ideal, out=np.zeros(number_of_questions), where=ideal > 0)
+
+        metrics[k] = {
+            "recall": correct_retrievals / number_of_questions,
+            "map": avg_precision.mean(),
+            "mrr": reciprocal_rank.mean(),
+            "ndcg": ndcg.mean(),
+            "correct_retrievals": correct_retrievals,
+            "number_of_questions": number_of_questions,
+        }
+
+    return metrics
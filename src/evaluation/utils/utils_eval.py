@@ -1,8 +1,9 @@
 import json
 import logging
 from pathlib import Path
-from typing import Dict, List, Union
+from typing import Dict, List, Optional, Union
 
+import numpy as np
 import pandas as pd
 from haystack.schema import BaseComponent
 from haystack.document_store.base import BaseDocumentStore
@@ -12,6 +13,12 @@ from haystack.eval import eval_counts_reader, calculate_reader_metrics, \
 from haystack.pipeline import Pipeline
 from tqdm import tqdm
 
+from deployment.roles.haystack.files.custom_component import \
+    iter_squad_articles
+from src.evaluation.utils.batch_pipeline import run_pipeline_batch
+from src.evaluation.utils.retriever_metrics import relevance_matrix, \
+    retriever_metrics
+
 logger = logging.getLogger()
 
 
@@ -48,6 +55,38 @@ def eval_retriever(
     associated answers are fetched from the document_store gold_label index.
     """
 
+    metrics = eval_retriever_at_k(
+        document_store=document_store,
+        pipeline=pipeline,
+        ks=[top_k],
+        label_index=label_index,
+        doc_index=doc_index,
+        label_origin=label_origin,
+        question_label_dict_list=question_label_dict_list,
+        get_doc_id=get_doc_id,
+    )[top_k]
+
+    return metrics
+
+
+def eval_retriever_at_k(
+        document_store: BaseDocumentStore,
+        pipeline: Pipeline,
+        ks: List[int],
+        label_index: str = "label",
+        doc_index: str = "eval_document",
+        label_origin: str = "gold_label",
+        question_label_dict_list=None,
+        get_doc_id=lambda doc: doc.id,
+) -> Dict[int, dict]:
+    """
+    Returns a dict {k: metrics} with the metrics of the retriever for each k of
+    ks. The documents are retrieved once for the largest k, the metrics at a
+    smaller k are computed on the first k documents.
+
+    See eval_retriever for the other arguments.
+    """
+
     if question_label_dict_list == None:
 
         # Extract all questions for evaluation
@@ -68,67 +107,59 @@ def eval_retriever(
             }
             question_label_dict_list.append(question_label_dict)
 
+    top_k = max(ks)
     retrieved_docs_list = [
         pipeline.run(query=question["query"], top_k_retriever=top_k, index=doc_index)
         for question in question_label_dict_list
     ]
 
-    metrics = get_retriever_metrics(retrieved_docs_list, question_label_dict_list, get_doc_id)
+    metrics_at_k = get_retriever_metrics_at_k(retrieved_docs_list,
+                                              question_label_dict_list, ks,
+                                              get_doc_id)
 
-    logger.info(
-        (
-            f"For {metrics['correct_retrievals']} out of {metrics['number_of_questions']} questions ({metrics['recall']:.2%}), the answer was in"
-            f" the top-{top_k} candidate passages selected by the retriever."
+    for k, metrics in metrics_at_k.items():
+        logger.info(
+            (
+                f"For {metrics['correct_retrievals']} out of {metrics['number_of_questions']} questions ({metrics['recall']:.2%}), the answer was in"
+                f" the top-{k} candidate passages selected by the retriever."
+            )
         )
-    )
 
-    return metrics
+    return metrics_at_k
 
 
 def get_retriever_metrics(retrieved_docs_list, question_label_dict_list,
                           get_doc_id=lambda doc: doc.id):
-    correct_retrievals = 0
-    summed_avg_precision = 0.0
-    summed_reciprocal_rank = []
+    top_k = max([len(docs["documents"]) for docs in retrieved_docs_list] + [1])
+    return get_retriever_metrics_at_k(retrieved_docs_list,
+                                      question_label_dict_list, [top_k],
+                                      get_doc_id)[top_k]
 
-    for question, retrieved_docs in tqdm(
-            zip(question_label_dict_list, retrieved_docs_list)
-    ):
+
+def get_retriever_metrics_at_k(retrieved_docs_list, question_label_dict_list,
+                               ks: List[int], get_doc_id=lambda doc: doc.id):
+    """
+    Returns a dict {k: metrics} with the retriever metrics for each k of `ks`,
+    computed from the documents retrieved once at the largest k.
+    """
+    relevance_rows = []
+    number_relevant = []
+    for question, retrieved_docs in zip(question_label_dict_list,
+                                        retrieved_docs_list):
         gold_ids = question["gold_ids"]
-        number_relevant_docs = len(gold_ids)
-        # check if correct doc in retrieved docs
-        found_relevant_doc = False
-        relevant_docs_found = 0
-        current_avg_precision = 0.0
-        for doc_idx, doc in enumerate(retrieved_docs["documents"]):
-            if str(get_doc_id(doc)) in gold_ids:
-                relevant_docs_found += 1
-                if not found_relevant_doc:
-                    correct_retrievals += 1
-                    summed_reciprocal_rank.append(1 / (doc_idx + 1))
-                current_avg_precision += relevant_docs_found / (doc_idx + 1)
-                found_relevant_doc = True
-                if relevant_docs_found == number_relevant_docs:
-                    break
-        if found_relevant_doc:
-            all_relevant_docs = len(set(gold_ids))
-            summed_avg_precision += current_avg_precision / all_relevant_docs
-
-    # Metrics
-    number_of_questions = len(question_label_dict_list)
-    recall = correct_retrievals / number_of_questions
-    mean_reciprocal_rank = sum(summed_reciprocal_rank) / number_of_questions
-    mean_avg_precision = summed_avg_precision / number_of_questions
-
-    metrics = {
-        "recall": recall,
-        "map": mean_avg_precision,
-        "mrr": mean_reciprocal_rank,
-        "correct_retrievals": correct_retrievals,
-        "number_of_questions": number_of_questions,
-    }
+        relevance = [str(get_doc_id(doc)) in gold_ids
+                     for doc in retrieved_docs["documents"]]
+        # Only the first len(gold_ids) relevant documents are counted
+        hits = 0
+        for doc_idx, relevant in enumerate(relevance):
+            hits += relevant
+            if relevant and hits > len(gold_ids):
+                relevance[doc_idx] = False
+        relevance_rows.append(relevance)
+        number_relevant.append(len(set(gold_ids)))
 
-    return metrics
+    return retriever_metrics(relevance_matrix(relevance_rows, max(ks)),
+                             number_relevant, ks)
 
 
 def eval_retriever_reader(
@@ -268,52 +299,27 @@ class PiafEvalRetriever(EvalDocuments, BaseComponent):
         This function takes retriever_labels Multilabel object as well as the preedicted documents to update metric counts
         
         """
-        relevant_docs_found = 0
-        found_relevant_doc = False
-        current_avg_precision = 0.0
-
         # extract the label document_ids (true relevant documents) and remove duplicated documents
         label_ids = list(set(retriever_labels.multiple_document_ids))
 
         if self.open_domain:
-            for doc_idx, doc in enumerate(predictions):
-                label_found = False
-                for label in retriever_labels.multiple_answers:
-                    # open domain : checks if answer in predicted document
-                    if label.lower() in doc.text.lower() and not label_found:
-                        label_found = True
-                        relevant_docs_found += 1
-                        if not found_relevant_doc:
-                            # update summed_reciprocal_rank only for the first relevant predicted document
-                            self.summed_reciprocal_rank += 1 / (doc_idx + 1)
-                        # update avg_precision each time a new relevant doc is found
-                        current_avg_precision += relevant_docs_found / (doc_idx + 1)
-                        found_relevant_doc = True
-
-            if found_relevant_doc:
-                all_relevant_docs = len(label_ids)
-                self.summed_avg_precision += current_avg_precision / all_relevant_docs
-            return found_relevant_doc
-
+            # open domain : checks if an answer is in the predicted document
+            answers = [label.lower() for label in retriever_labels.multiple_answers]
+            relevance = [any(answer in text for answer in answers)
+                         for text in (doc.text.lower() for doc in predictions)]
         else:
-            # check if the predicted document are relevant
-            for doc_idx, doc in enumerate(predictions):
-                # close domain checks if predicted document's ID in docuemt label ID
-                if doc.id in label_ids:
-                    # if predicted is relevant update count
-                    relevant_docs_found += 1
-                    if not found_relevant_doc:
-                        # update summed_reciprocal_rank only for the first relevant predicted document
-                        self.summed_reciprocal_rank += 1 / (doc_idx + 1)
-                    # update avg_precision each time a new relevant doc is found
-                    current_avg_precision += relevant_docs_found / (doc_idx + 1)
-                    found_relevant_doc = True
-            # if found relevant doc update summed_avg_precision
-            if found_relevant_doc:
-                all_relevant_docs = len(label_ids)
-                self.summed_avg_precision += current_avg_precision / all_relevant_docs
-            # returns true if relevant doc is found
-            return found_relevant_doc
+            # close domain checks if predicted document's ID in docuemt label ID
+            relevance = [doc.id in label_ids for doc in predictions]
+
+        relevant_ranks = [rank for rank, relevant in enumerate(relevance, 1) if relevant]
+        if relevant_ranks:
+            # reciprocal rank of the first relevant predicted document
+            self.summed_reciprocal_rank += 1 / relevant_ranks[0]
+            # precision at the rank of each relevant document
+            current_avg_precision = sum(n / rank for n, rank in enumerate(relevant_ranks, 1))
+            self.summed_avg_precision += current_avg_precision / len(label_ids)
+        # returns true if relevant doc is found
+        return len(relevant_ranks) > 0
 
     def get_metrics(self):
         return {
@@ -445,6 +451,8 @@ def full_eval_retriever_reader(
         k_reader_total: int,
         label_index: str = "label",
         label_origin: str = "gold_label",
+        batch_size: Optional[int] = None,
+        questions: Optional[List[str]] = None,
 ):
     """
     Performs retriever/reader evaluation on evaluation documents in the DocumentStore.
@@ -456,10 +464,16 @@ def full_eval_retriever_reader(
     :param document_store: DocumentStore containing the evaluation documents
     :param label_index: Index/Table name where labeled questions are stored
     :param doc_index: Index/Table name where documents that are used for evaluation are stored
+    :param batch_size: If set, the questions are sent through the pipeline by groups of batch_size questions
+                       (see src.evaluation.utils.batch_pipeline). Otherwise the questions are run one at a time.
+    :param questions: If set, only the labeled questions of this list are evaluated (see stratified_question_order)
     """
     filters = {"origin": [label_origin]}
     labels = document_store.get_all_labels_aggregated(index=label_index, filters=filters)
     labels = [label for label in labels if label.question]
+    if questions is not None:
+        questions = set(questions)
+        labels = [label for label in labels if label.question in questions]
     q_to_l_dict = {
         l.question: {
             "retriever": l,
@@ -468,6 +482,20 @@ def full_eval_retriever_reader(
     }
 
     answers = []
+    if batch_size:
+        questions = list(q_to_l_dict.items())
+        for i in tqdm(range(0, len(questions), batch_size), unit="batch"):
+            batch_kwargs = [
+                {
+                    "query": q,
+                    "top_k_retriever": k_retriever,
+                    "labels": l,
+                    "top_k_reader": k_reader_total,
+                } for q, l in questions[i:i + batch_size]
+            ]
+            answers.extend(run_pipeline_batch(pipeline, batch_kwargs))
+        return answers
+
     for q, l in q_to_l_dict.items():
         ans = pipeline.run(
             query=q,
@@ -479,6 +507,34 @@ def full_eval_retriever_reader(
 
     return answers
 
+def stratified_question_order(squad_file, seed: int = 42) -> List[str]:
+    """
+    Returns the questions of a SQuAD file in an order such that its first n
+    questions are a sample of the questions stratified by article: each
+    article contributes to the first n questions in proportion to its number
+    of questions. The questions of an article are shuffled and spread evenly
+    over the order, with a random offset.
+
+    The samples of the successive sizes are nested, so that the reader
+    predictions of a sample are reused by the larger ones.
+    """
+    rng = np.random.RandomState(seed)
+    ranked_questions = {}
+    for article in iter_squad_articles(squad_file):
+        article_questions = [qa["question"] for paragraph in article["paragraphs"]
+                             for qa in paragraph["qas"]]
+        article_questions = [question for question in article_questions
+                             if question not in ranked_questions]
+        # Keep one occurrence of the questions repeated in the article
+        article_questions = list(dict.fromkeys(article_questions))
+        rng.shuffle(article_questions)
+        offset = rng.uniform()
+        for i, question in enumerate(article_questions):
+            ranked_questions[question] = (i + offset) / len(article_questions)
+
+    return sorted(ranked_questions, key=ranked_questions.get)
+
+
 def eval_titleQA_pipeline(
         document_store: BaseDocumentStore,
         pipeline: Pipeline,
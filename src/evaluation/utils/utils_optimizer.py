@@ -1,7 +1,9 @@
 import logging
+from pathlib import Path
 from time import time
 
-from skopt.space import Categorical, Integer, Real
+from skopt import load
+from skopt.space import Categorical, Integer, Real, Space
 from tqdm import tqdm
 
 
@@ -80,6 +82,52 @@ def create_dimensions_from_parameters(parameters):
     return dimensions
 
 
+def load_previous_evaluations(result_file_path, dimensions):
+    """
+    Returns the points evaluated by a previous optimization dumped in
+    result_file_path and their objective values, as two lists (x0, y0) that
+    can be told to a new optimizer. The points that are not in dimensions
+    anymore, e.g. because the parameters changed, are skipped.
+    """
+    result_file_path = Path(result_file_path)
+    if not result_file_path.exists():
+        return [], []
+
+    result = load(result_file_path)
+    space = Space(dimensions)
+    x0, y0 = [], []
+    for x, y in zip(result.x_iters, result.func_vals):
+        if x in space:
+            x0.append(list(x))
+            y0.append(float(y))
+    logging.info(f"Resuming from {len(x0)} evaluations of {result_file_path} "
+                 f"({len(result.x_iters) - len(x0)} skipped).")
+    return x0, y0
+
+
+def pareto_front(runs, accuracy_metric="reader_topk_accuracy_has_answer",
+                 latency_metric="query_latency_p95"):
+    """
+    Returns the runs of the Pareto front of accuracy (maximized) versus latency
+    (minimized): the runs such that no other run is both at least as accurate
+    and at least as fast, and strictly better on one of them. The front is
+    sorted by increasing latency, hence increasing accuracy.
+
+    :param runs: list of tuples (run_id, params, results)
+    :return: list of tuples (run_id, params, results)
+    """
+    runs = [run for run in runs
+            if run[2].get(accuracy_metric) is not None
+            and run[2].get(latency_metric) is not None]
+    runs = sorted(runs, key=lambda run: (run[2][latency_metric], -run[2][accuracy_metric]))
+
+    front = []
+    for run in runs:
+        if not front or run[2][accuracy_metric] > front[-1][2][accuracy_metric]:
+            front.append(run)
+    return front
+
+
 class LoggingCallback(object):
     """
     Callback to control the verbosity.
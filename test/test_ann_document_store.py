@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from haystack import Document
+
+from deployment.roles.haystack.files.custom_component import \
+    ANNElasticsearchDocumentStore
+from src.evaluation.utils.elasticsearch_management import delete_indices
+
+
+@pytest.mark.elasticsearch
+@pytest.mark.parametrize("similarity", ["cosine", "dot_product"])
+def test_ann_query_by_embedding(tmp_path, similarity):
+    delete_indices(index="test_ann_document")
+    document_store = ANNElasticsearchDocumentStore(
+        ann_index_path=str(tmp_path / "dense_index.faiss"),
+        faiss_index_factory_str="Flat",
+        index="test_ann_document",
+        embedding_dim=4,
+        similarity=similarity,
+    )
+    rng = np.random.RandomState(0)
+    docs = [Document(text=f"document {i}", embedding=rng.rand(4).astype(np.float32),
+                     meta={"name": f"name {i}"})
+            for i in range(20)]
+    document_store.write_documents(docs)
+
+    query_emb = rng.rand(4).astype(np.float32)
+    expected = super(ANNElasticsearchDocumentStore, document_store).query_by_embedding(
+        query_emb, top_k=5)
+
+    # Without a saved faiss index, the query falls back to Elasticsearch and
+    # does not build it
+    results = document_store.query_by_embedding(query_emb, top_k=5)
+    assert [doc.id for doc in results] == [doc.id for doc in expected]
+    assert not (tmp_path / "dense_index.faiss").exists()
+
+    document_store.build_ann_index()
+    assert (tmp_path / "dense_index.faiss").exists()
+    results = document_store.query_by_embedding(query_emb, top_k=5)
+
+    assert [doc.id for doc in results] == [doc.id for doc in expected]
+    assert [doc.score for doc in results] == pytest.approx([doc.score for doc in expected], abs=1e-4)
+    assert [doc.probability for doc in results] == pytest.approx(
+        [doc.probability for doc in expected], abs=1e-4)
+    assert all(doc.embedding is None for doc in results)
+
+    # A deleted document is not returned anymore
+    document_store.client.delete(index="test_ann_document", id=results[0].id, refresh=True)
+    results = document_store.query_by_embedding(query_emb, top_k=5)
+    assert [doc.id for doc in results] == [doc.id for doc in expected[1:]]
+
+    delete_indices(index="test_ann_document")
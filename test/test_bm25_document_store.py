@@ -0,0 +1,57 @@
+from pathlib import Path
+
+import pytest
+
+from deployment.roles.haystack.files.custom_component import stream_eval_data
+from src.evaluation.utils.bm25_document_store import BM25DocumentStore, \
+    decode_length, encode_length
+from src.evaluation.utils.french_analyzer import analyze, light_french_stem
+
+
+@pytest.mark.parametrize("word, stem", [
+    ("chevaux", "cheval"), ("affreuse", "afreu"), ("investissement", "investi"),
+    ("administrativement", "administratif"), ("justificatrice", "justifi"),
+    ("communicateur", "comuniqu"), ("caissière", "caisi"), ("personnelle", "person"),
+    ("ritualisation", "rituel"), ("disposition", "dispos"),
+])
+def test_light_french_stem(word, stem):
+    assert light_french_stem(word) == stem
+
+
+def test_analyze():
+    assert analyze("L'impôt sur le revenu d’une Société, jusqu'au 3.5 ans") == \
+        ["impot", "revenu", "societ", "3.5", "ans"]
+
+
+def test_encode_length():
+    assert [decode_length(encode_length(n)) for n in [0, 23, 24, 40, 100, 1000]] == \
+        [0, 23, 24, 40, 96, 984]
+
+
+@pytest.mark.elasticsearch
+def test_bm25_document_store_same_as_elasticsearch(document_store):
+    squad = Path("./test/samples/squad/small.json").as_posix()
+    document_store.delete_all_documents(index="test_bm25_document")
+    document_store.delete_all_documents(index="test_bm25_feedback")
+    stream_eval_data(document_store, squad, doc_index="test_bm25_document",
+                     label_index="test_bm25_feedback")
+
+    local_store = BM25DocumentStore(index="test_bm25_document", label_index="test_bm25_feedback")
+    # The documents get the same ids as in Elasticsearch
+    local_store.write_documents(document_store.get_all_documents(index="test_bm25_document"))
+
+    search_fields = document_store.search_fields
+    document_store.search_fields = ["name", "text"]
+    for label in document_store.get_all_labels(index="test_bm25_feedback"):
+        expected = document_store.query(label.question, top_k=5, index="test_bm25_document")
+        documents = local_store.query(label.question, top_k=5)
+        assert [doc.id for doc in documents] == [doc.id for doc in expected]
+        assert [doc.score for doc in documents] == pytest.approx([doc.score for doc in expected], rel=1e-4)
+    document_store.search_fields = search_fields
+
+    documents = local_store.query("impôt", top_k=3, filters={"name": ["unknown"]})
+    assert documents == []
+
+    # clean up
+    document_store.delete_all_documents(index="test_bm25_document")
+    document_store.delete_all_documents(index="test_bm25_feedback")
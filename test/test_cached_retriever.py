@@ -0,0 +1,42 @@
+from haystack import Document
+
+from deployment.roles.haystack.files.custom_component import CachedRetriever
+
+
+class CountingRetriever:
+    document_store = None
+
+    def __init__(self):
+        self.calls = 0
+
+    def retrieve(self, query, filters=None, top_k=None, index=None):
+        self.calls += 1
+        return [Document(text=f"Réponse à {query}", meta={"name": query})]
+
+
+def test_cached_retriever():
+    retriever = CountingRetriever()
+    cached = CachedRetriever(retriever, max_size=2, ttl=None)
+
+    documents = cached.retrieve("Quelle  est la durée ?", top_k=5)
+    documents[0].meta["weight"] = 10
+    again = cached.retrieve(" Quelle est la durée ? ", top_k=5)
+    assert retriever.calls == 1
+    assert "weight" not in again[0].meta
+
+    cached.retrieve("Quelle est la durée ?", top_k=3)
+    cached.retrieve("Autre question", top_k=5)
+    assert retriever.calls == 3
+
+    # The least recently used result was evicted
+    cached.retrieve("Quelle est la durée ?", top_k=5)
+    assert retriever.calls == 4
+    assert cached.cache_info() == {"hits": 1, "misses": 4, "size": 2}
+
+
+def test_cached_retriever_ttl():
+    retriever = CountingRetriever()
+    cached = CachedRetriever(retriever, ttl=0)
+    cached.retrieve("Quelle est la durée ?")
+    cached.retrieve("Quelle est la durée ?")
+    assert retriever.calls == 2
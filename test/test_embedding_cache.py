@@ -0,0 +1,59 @@
+import numpy as np
+
+from deployment.roles.haystack.files.custom_component import EmbeddingCache
+
+
+def test_embedding_cache(tmp_path):
+    cache = EmbeddingCache(tmp_path, "model")
+    assert cache.get(["a", "b"]) == {}
+
+    embeddings = np.random.rand(2, 4).astype(np.float32)
+    cache.add(["a", "b"], embeddings)
+    cache.add(["c"], np.ones((1, 4)))
+
+    # A new cache object reads what was written by the previous one
+    cache = EmbeddingCache(tmp_path, "model")
+    found = cache.get(["a", "c", "d"])
+    assert set(found.keys()) == {"a", "c"}
+    assert np.array_equal(found["a"], embeddings[0])
+    assert np.array_equal(found["c"], np.ones(4, dtype=np.float32))
+
+    # Caches of different models are separated
+    assert EmbeddingCache(tmp_path, "other_model").get(["a"]) == {}
+
+
+def test_embedding_cache_shared(tmp_path):
+    # An empty index file, e.g. left by an interrupted insertion
+    (tmp_path / "model").mkdir()
+    (tmp_path / "model" / "index.txt").touch()
+    first = EmbeddingCache(tmp_path, "model")
+    second = EmbeddingCache(tmp_path, "model")
+    assert first.get(["a"]) == {}
+
+    first.add(["a", "b"], np.zeros((2, 4)))
+    first.add([], [])
+    # second reads the rows added by first before adding its own
+    second.add(["c"], np.ones((1, 4)))
+    assert second.rows == {"a": 0, "b": 1, "c": 2}
+    assert np.array_equal(second.get(["c"])["c"], np.ones(4, dtype=np.float32))
+
+    # first only reads the new key from the index
+    first.load()
+    assert first.rows == second.rows
+    assert first.index_offset == (tmp_path / "model" / "index.txt").stat().st_size
+    assert np.array_equal(first.get(["b", "c"])["c"], np.ones(4, dtype=np.float32))
+
+
+def test_embedding_cache_interrupted_add(tmp_path):
+    cache = EmbeddingCache(tmp_path, "model")
+    cache.add(["a"], np.zeros((1, 4)))
+    # A writer died after writing its embeddings, before writing their keys
+    with open(tmp_path / "model" / "embeddings.f32", "ab") as f:
+        f.write(np.full((2, 4), 5, dtype=np.float32).tobytes())
+
+    cache = EmbeddingCache(tmp_path, "model")
+    cache.add(["b"], np.ones((1, 4)))
+    assert np.array_equal(cache.get(["b"])["b"], np.ones(4, dtype=np.float32))
+    found = EmbeddingCache(tmp_path, "model").get(["a", "b"])
+    assert np.array_equal(found["a"], np.zeros(4, dtype=np.float32))
+    assert np.array_equal(found["b"], np.ones(4, dtype=np.float32))
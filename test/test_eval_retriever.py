@@ -1,11 +1,16 @@
+import json
+
 import pytest
 from pathlib import Path
 
 from haystack.document_store.base import BaseDocumentStore
 from haystack.pipeline import Pipeline
 
+from deployment.roles.haystack.files.custom_component import \
+    blue_green_sync, iter_squad_articles, stable_docs_and_labels, \
+    stream_eval_data, sync_eval_data
 from src.evaluation.utils.elasticsearch_management import delete_indices
-from src.evaluation.utils.utils_eval import eval_retriever
+from src.evaluation.utils.utils_eval import eval_retriever, eval_retriever_at_k
 from src.data.evaluation_datasets import prepare_fquad_eval
 
 
@@ -52,6 +57,115 @@ def test_add_eval_data(document_store):
     document_store.delete_all_documents(index="test_feedback")
 
 
+def test_iter_squad_articles():
+    filename = Path("./test/samples/squad/small.json")
+    with open(filename, encoding="utf-8") as f:
+        articles = json.load(f)["data"]
+
+    assert list(iter_squad_articles(filename, buffer_size=100)) == articles
+
+
+def test_iter_squad_articles_root_keys(tmp_path):
+    articles = [{"title": "Sport", "paragraphs": []}, {"title": "Santé", "paragraphs": []}]
+    squad = {
+        "version": "v2.0",
+        "metadata": {"note": 'the key "data": [ of a string', "data": [{"title": "nested"}]},
+        "data": articles,
+        "after": [1, 2],
+    }
+    filename = tmp_path / "squad.json"
+    filename.write_text(json.dumps(squad, indent=2), encoding="utf-8")
+
+    for buffer_size in [5, 1 << 20]:
+        assert list(iter_squad_articles(filename, buffer_size=buffer_size)) == articles
+
+    filename.write_text(json.dumps({"version": "v2.0"}), encoding="utf-8")
+    assert list(iter_squad_articles(filename)) == []
+
+
+@pytest.mark.elasticsearch
+def test_stream_eval_data(document_store):
+    document_store.delete_all_documents(index="test_eval_document")
+    document_store.delete_all_documents(index="test_feedback")
+    stream_eval_data(
+        document_store,
+        Path("./test/samples/squad/small.json").as_posix(),
+        doc_index="test_eval_document",
+        label_index="test_feedback",
+        chunk_size=2,
+        thread_count=3,
+    )
+
+    assert document_store.get_document_count(index="test_eval_document") == 11
+    assert document_store.get_label_count(index="test_feedback") == 65
+
+    # clean up
+    document_store.delete_all_documents(index="test_eval_document")
+    document_store.delete_all_documents(index="test_feedback")
+
+
+@pytest.mark.elasticsearch
+def test_sync_eval_data(document_store):
+    delete_indices(index="test_sync_document")
+    delete_indices(index="test_sync_feedback")
+    small = Path("./test/samples/squad/small.json").as_posix()
+    tiny = Path("./test/samples/squad/tiny.json").as_posix()
+
+    stats = sync_eval_data(document_store, small, doc_index="test_sync_document",
+                           label_index="test_sync_feedback", chunk_size=2)
+    assert stats["added_documents"] == 11
+    assert document_store.get_document_count(index="test_sync_document") == 11
+
+    # Nothing changed
+    stats = sync_eval_data(document_store, small, doc_index="test_sync_document",
+                           label_index="test_sync_feedback", chunk_size=2)
+    assert stats["added_documents"] == 0
+    assert stats["deleted_documents"] == 0
+    assert stats["added_labels"] == 0
+    assert stats["kept_documents"] == 11
+
+    # The documents of small.json that are not in tiny.json are deleted
+    sync_eval_data(document_store, tiny, doc_index="test_sync_document",
+                   label_index="test_sync_feedback")
+    expected_ids = {doc.id for article in iter_squad_articles(tiny)
+                    for doc in stable_docs_and_labels(article)[0]}
+    docs = document_store.get_all_documents(index="test_sync_document")
+    assert {doc.id for doc in docs} == expected_ids
+    labels = document_store.get_all_labels(index="test_sync_feedback")
+    assert {label.document_id for label in labels} <= expected_ids
+
+    # clean up
+    delete_indices(index="test_sync_document")
+    delete_indices(index="test_sync_feedback")
+
+
+@pytest.mark.elasticsearch
+def test_blue_green_sync(document_store):
+    client = document_store.client
+    for colour in ["", "_blue", "_green"]:
+        delete_indices(index=f"test_bg_document{colour}")
+        delete_indices(index=f"test_bg_feedback{colour}")
+    small = Path("./test/samples/squad/small.json").as_posix()
+    tiny = Path("./test/samples/squad/tiny.json").as_posix()
+
+    blue_green_sync(document_store, small, doc_index="test_bg_document",
+                    label_index="test_bg_feedback")
+    assert list(client.indices.get_alias(name="test_bg_document")) == ["test_bg_document_green"]
+    assert document_store.get_document_count(index="test_bg_document") == 11
+
+    stats = blue_green_sync(document_store, tiny, doc_index="test_bg_document",
+                            label_index="test_bg_feedback")
+    assert stats["kept_documents"] > 0
+    assert list(client.indices.get_alias(name="test_bg_document")) == ["test_bg_document_blue"]
+    # The previous index is kept as it was
+    assert document_store.get_document_count(index="test_bg_document_green") == 11
+
+    # clean up
+    for colour in ["_blue", "_green"]:
+        delete_indices(index=f"test_bg_document{colour}")
+        delete_indices(index=f"test_bg_feedback{colour}")
+
+
 @pytest.mark.elasticsearch
 def test_add_eval_data_with_preprocessor(document_store, preprocessor):
     # add eval data (SQUAD format)
@@ -173,3 +287,22 @@ def test_eval_elastic_retriever(document_store: BaseDocumentStore, retriever_bm2
 
     assert recall_expected == pytest.approx(retriever_eval_results["recall"], abs=1e-4)
     assert mrr_expected == pytest.approx(retriever_eval_results["mrr"], abs=1e-4)
+
+    # One retrieval at k=3 gives the metrics at k=1 and k=3
+    retriever_eval_results_at_k = eval_retriever_at_k(
+        document_store=document_store,
+        pipeline=p,
+        ks=[1, 3],
+        label_index=label_index,
+        doc_index=doc_index,
+    )
+    retriever_eval_results_1 = eval_retriever(
+        document_store=document_store,
+        pipeline=p,
+        top_k=1,
+        label_index=label_index,
+        doc_index=doc_index,
+    )
+
+    assert retriever_eval_results_at_k[3] == retriever_eval_results
+    assert retriever_eval_results_at_k[1] == retriever_eval_results_1
@@ -9,8 +9,9 @@ from src.evaluation.utils.utils_eval import full_eval_retriever_reader
 
 @pytest.mark.elasticsearch
 @pytest.mark.parametrize("k_reader_total", [10])
+@pytest.mark.parametrize("batch_size", [None, 4])
 def test_eval_elastic_retriever_reader(document_store: BaseDocumentStore, retriever_bm25, reader, k_reader_total,
-                                       retriever_piafeval, reader_piafeval):
+                                       retriever_piafeval, reader_piafeval, batch_size):
     doc_index = "document"
     label_index = "label"
 
@@ -37,7 +38,7 @@ def test_eval_elastic_retriever_reader(document_store: BaseDocumentStore, retrie
     k_retriever = 3
     answers = full_eval_retriever_reader(document_store=document_store, pipeline=p,
                                k_retriever=k_retriever, k_reader_total=k_reader_total,
-                               label_index=label_index)
+                               label_index=label_index, batch_size=batch_size)
 
     retriever_eval_results = retriever_piafeval.get_metrics()
     retriever_eval_results.update(reader_piafeval.get_metrics())
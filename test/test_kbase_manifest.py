@@ -0,0 +1,32 @@
+import os
+
+from src.data.knowledge_base.manifest import diff_manifest, load_manifest, \
+    save_manifest
+
+
+def test_diff_manifest(tmp_path):
+    for name in ["F1.xml", "F2.xml", "F3.xml"]:
+        (tmp_path / name).write_text(name)
+    doc_paths = sorted(tmp_path.glob("*.xml"))
+
+    entries, changed, removed = diff_manifest({}, tmp_path, doc_paths)
+    assert changed == doc_paths
+    assert removed == []
+
+    save_manifest(tmp_path / "manifest.json", entries)
+    manifest = load_manifest(tmp_path / "manifest.json")
+    assert manifest == entries
+
+    # F1 is touched with the same content, F2 changes, F3 is removed and F4
+    # is added
+    os.utime(tmp_path / "F1.xml", (0, 0))
+    (tmp_path / "F2.xml").write_text("new content")
+    (tmp_path / "F3.xml").unlink()
+    (tmp_path / "F4.xml").write_text("F4.xml")
+    doc_paths = sorted(tmp_path.glob("*.xml"))
+
+    entries, changed, removed = diff_manifest(manifest, tmp_path, doc_paths)
+    assert changed == [tmp_path / "F2.xml", tmp_path / "F4.xml"]
+    assert removed == ["F3.xml"]
+    assert entries["F1.xml"]["mtime"] == 0
+    assert sorted(entries) == ["F1.xml", "F2.xml", "F4.xml"]
@@ -26,6 +26,10 @@ def test_merge_strings():
     assert merge_strings("a black coffee", "", 0.1) == ("", 0)
     assert merge_strings("a coffee is my first thing in the morning", "morning or evening", 0.5) == ("", 0)
     assert merge_strings("a coffee is my first thing in the morning", "in the morning", 0.5) == ("a coffee is my first thing in the morning", 27)
+    assert merge_strings("abab", "ab", 0) == ("abab", 2)
+    assert merge_strings("ab", "abab", 0) == ("abab", 0)
+    assert merge_strings("aab", "abaa", 0.5) == ("aabaa", 1)
+    assert merge_strings("abaa", "aab", 0.5) == ("abaab", 2)
 
 
 @pytest.mark.elasticsearch
@@ -0,0 +1,47 @@
+import time
+
+import pytest
+from haystack.pipeline import Pipeline
+from haystack.schema import BaseComponent
+
+from deployment.roles.haystack.files.custom_component import ParallelPipeline
+from src.evaluation.utils.node_timing import NodeTimer
+
+
+class SleepingNode(BaseComponent):
+    outgoing_edges = 1
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    def run(self, **kwargs):
+        time.sleep(self.delay)
+        return kwargs, "output_1"
+
+
+@pytest.mark.parametrize("pipeline_class", [Pipeline, ParallelPipeline])
+def test_node_timer(pipeline_class):
+    pipeline = pipeline_class()
+    pipeline.add_node(component=SleepingNode(0.01), name="Fast", inputs=["Query"])
+    pipeline.add_node(component=SleepingNode(0.05), name="Slow", inputs=["Fast"])
+    NodeTimer().instrument(pipeline)
+
+    for _ in range(3):
+        pipeline.run(query="Quand ?")
+
+    metrics = pipeline.node_timer.get_metrics()
+    assert metrics["node_Query_calls"] == metrics["node_Fast_calls"] == metrics["node_Slow_calls"] == 3
+    assert 0.01 <= metrics["node_Fast_p50"] <= metrics["node_Fast_p95"] <= metrics["node_Fast_p99"] < 0.05
+    assert 0.05 <= metrics["node_Slow_p50"]
+    assert metrics["node_Slow_total"] >= 0.15
+    assert metrics["query_latency_p50"] >= 0.06
+
+    # A replaced node is timed once wrapped again
+    pipeline.node_timer.reset()
+    pipeline.graph.nodes["Slow"]["component"] = SleepingNode(0)
+    pipeline.node_timer.wrap("Slow", pipeline.graph.nodes["Slow"]["component"])
+    pipeline.run(query="Quand ?")
+    metrics = pipeline.node_timer.get_metrics()
+    assert metrics["node_Slow_calls"] == 1
+    assert metrics["node_Slow_p99"] < 0.01
+    assert metrics["query_latency_p99"] < 0.05
@@ -0,0 +1,44 @@
+import pytest
+from haystack import Document
+
+from deployment.roles.haystack.files.custom_component import ONNXTransformersReader
+
+
+DOCUMENTS = [
+    Document(text="La carte grise est le certificat d'immatriculation d'un véhicule. Elle doit être demandée "
+                  "dans un délai d'un mois après l'achat du véhicule.", meta={"name": "Carte grise"}),
+    Document(text="La déclaration de revenus doit être faite chaque année au printemps, en ligne sur le site "
+                  "des impôts.", meta={"name": "Impôt sur le revenu"}),
+]
+
+
+@pytest.mark.parametrize("quantize", [False, True])
+def test_onnx_reader(reader, tmp_path, quantize):
+    onnx_reader = ONNXTransformersReader(
+        model_name_or_path="etalab-ia/camembert-base-squadFR-fquad-piaf",
+        tokenizer="etalab-ia/camembert-base-squadFR-fquad-piaf",
+        top_k_per_candidate=3,
+        onnx_cache_dir=str(tmp_path),
+        quantize=quantize,
+    )
+    assert len(list(tmp_path.glob("*/*.onnx"))) == (2 if quantize else 1)
+
+    query = "Dans quel délai faut-il demander la carte grise ?"
+    expected = reader.predict(query=query, documents=DOCUMENTS, top_k=3)["answers"]
+    answers = onnx_reader.predict(query=query, documents=DOCUMENTS, top_k=3)["answers"]
+
+    assert set(answers[0].keys()) == set(expected[0].keys())
+    assert answers[0]["answer"] == expected[0]["answer"]
+    assert answers[0]["offset_start"] == expected[0]["offset_start"]
+    if not quantize:
+        assert [a["answer"] for a in answers] == [a["answer"] for a in expected]
+        assert [a["probability"] for a in answers] == pytest.approx([a["probability"] for a in expected], abs=1e-3)
+
+    # The exported model is read from the cache
+    ONNXTransformersReader(
+        model_name_or_path="etalab-ia/camembert-base-squadFR-fquad-piaf",
+        tokenizer="etalab-ia/camembert-base-squadFR-fquad-piaf",
+        onnx_cache_dir=str(tmp_path),
+        quantize=quantize,
+    )
+    assert len(list(tmp_path.glob("*/*"))) == (2 if quantize else 1)
@@ -0,0 +1,123 @@
+import threading
+import time
+
+from haystack import Document
+from haystack.pipeline import Pipeline
+from haystack.schema import BaseComponent
+
+from deployment.roles.haystack.files.custom_component import \
+    AnswerifyDocuments, ConfidenceRouter, JoinAnswers, JoinDocumentsCustom, \
+    ParallelPipeline
+
+
+class SlowRetriever(BaseComponent):
+    outgoing_edges = 1
+
+    def __init__(self, text, delay):
+        self.text = text
+        self.delay = delay
+
+    def run(self, query, **kwargs):
+        time.sleep(self.delay)
+        documents = [Document(text=self.text, id=self.text)]
+        return {"query": query, "documents": documents}, "output_1"
+
+
+def build(pipeline):
+    names = ["Retriever_a", "Retriever_b", "Retriever_c"]
+    for name in names:
+        pipeline.add_node(component=SlowRetriever(name, 0.2), name=name,
+                          inputs=["Query"])
+    pipeline.add_node(component=JoinDocumentsCustom(), name="Join",
+                      inputs=names)
+    return pipeline
+
+
+def test_parallel_pipeline():
+    expected = build(Pipeline()).run(query="Quand ?")
+
+    start = time.perf_counter()
+    output = build(ParallelPipeline()).run(query="Quand ?")
+    duration = time.perf_counter() - start
+
+    # Same documents in the same order, in about the time of one retriever
+    assert [d.id for d in output["documents"]] == \
+        [d.id for d in expected["documents"]]
+    assert duration < 0.5
+
+
+def test_parallel_pipeline_reuses_executor():
+    pipeline = build(ParallelPipeline())
+    executor = pipeline.executor
+    pipeline.run(query="Quand ?")
+    pipeline.run(query="Quand ?")
+    assert pipeline.executor is executor
+
+
+class WeightedRetriever(BaseComponent):
+    outgoing_edges = 1
+
+    def __init__(self, text, weight):
+        self.text = text
+        self.weight = weight
+
+    def run(self, query, **kwargs):
+        documents = [Document(text=self.text, id=self.text, score=1.0,
+                              meta={"name": self.text, "weight": self.weight})]
+        return {"query": query, "documents": documents}, "output_1"
+
+
+class CountingReader(BaseComponent):
+    outgoing_edges = 1
+
+    def __init__(self):
+        self.calls = 0
+        self.threads = []
+
+    def run(self, query, documents, **kwargs):
+        self.calls += 1
+        self.threads.append(threading.current_thread())
+        answers = [{"answer": "reader", "score": None, "probability": 0.9}]
+        return {"query": query, "answers": answers}, "output_1"
+
+
+def build_early_exit(label_weight):
+    reader = CountingReader()
+    pipeline = ParallelPipeline()
+    pipeline.add_node(component=WeightedRetriever("title", 10),
+                      name="Retriever_title", inputs=["Query"])
+    pipeline.add_node(component=WeightedRetriever("label", label_weight),
+                      name="Retriever_label", inputs=["Query"])
+    pipeline.add_node(component=JoinDocumentsCustom(), name="Join",
+                      inputs=["Retriever_title", "Retriever_label"])
+    pipeline.add_node(component=ConfidenceRouter(weight_threshold=99),
+                      name="EarlyExit", inputs=["Join"])
+    pipeline.add_node(component=reader, name="Reader",
+                      inputs=["EarlyExit.output_1"])
+    pipeline.add_node(component=AnswerifyDocuments(), name="AnswerifyEarlyExit",
+                      inputs=["EarlyExit.output_2"])
+    pipeline.add_node(component=AnswerifyDocuments(), name="Answerify",
+                      inputs=["Join"])
+    pipeline.add_node(component=JoinAnswers(threshold_score=0.5),
+                      name="JoinResults",
+                      inputs=["Reader", "AnswerifyEarlyExit", "Answerify"])
+    return pipeline, reader
+
+
+def test_confidence_router():
+    # No confident document: the reader runs
+    pipeline, reader = build_early_exit(label_weight=0)
+    output = pipeline.run(query="Quand ?")
+    assert reader.calls == 1
+    assert [a["answer"] for a in output["answers"]] == ["label", "title", "reader"]
+    # The reader shares its documents with Answerify: it is not run in a
+    # worker thread
+    assert reader.threads == [threading.main_thread()]
+
+    # The label retriever found the question: the reader is skipped and the
+    # join node runs with the answerified documents only, the confident one
+    # being answered once
+    pipeline, reader = build_early_exit(label_weight=99)
+    output = pipeline.run(query="Quand ?")
+    assert reader.calls == 0
+    assert [a["answer"] for a in output["answers"]] == ["label", "title"]
@@ -63,6 +63,12 @@ def test_retriever_reader_build():
             elasticsearch_port = "9200", gpu_id = -1,
             yaml_dir_prefix = "output/test/pipelines/retriever_reader")
 
+    parameters["bm25_backend"] = "local"
+    pipelines.retriever_reader(parameters, elasticsearch_hostname = "localhost",
+            elasticsearch_port = "9200", gpu_id = -1,
+            yaml_dir_prefix = "output/test/pipelines/retriever_reader")
+    del parameters["bm25_backend"]
+
     parameters["retriever_type"] = "sbert"
     pipelines.retriever_reader(parameters, elasticsearch_hostname = "localhost",
             elasticsearch_port = "9200", gpu_id = -1,
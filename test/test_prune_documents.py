@@ -0,0 +1,40 @@
+import pytest
+from haystack import Document
+
+from deployment.roles.haystack.files.custom_component import PruneDocuments
+
+
+def make_documents(scores):
+    return [Document(text=f"document {i}", id=str(i), score=score)
+            for i, score in enumerate(scores)]
+
+
+@pytest.mark.parametrize("mode, threshold, min_k, max_k, expected", [
+    ("score_gap", 0.5, 1, None, ["1", "0"]),
+    ("score_gap", 0.1, 1, None, ["1"]),
+    ("score_gap", 0.1, 3, None, ["1", "0", "3"]),
+    ("score_gap", 1, 1, 3, ["1", "0", "3"]),
+    ("cumulative_score", 0.5, 1, None, ["1", "0"]),
+    ("cumulative_score", 0.9, 1, None, ["1", "0", "3"]),
+    ("cumulative_score", 0.9, 1, 2, ["1", "0"]),
+])
+def test_prune_documents(mode, threshold, min_k, max_k, expected):
+    prune = PruneDocuments(mode=mode, threshold=threshold, min_k=min_k, max_k=max_k)
+    documents = make_documents([6, 10, 2, 4])
+    output, edge = prune.run(query="query", documents=documents)
+    assert edge == "output_1"
+    assert output["query"] == "query"
+    assert [doc.id for doc in output["documents"]] == expected
+    assert prune.get_metrics() == {"mean_kept_documents": len(expected)}
+
+
+def test_prune_documents_without_scores():
+    prune = PruneDocuments(max_k=2)
+    documents = make_documents([None, None, None])
+    assert [doc.id for doc in prune.prune(documents)] == ["0", "1"]
+    assert prune.prune([]) == []
+
+
+def test_prune_documents_unknown_mode():
+    with pytest.raises(ValueError):
+        PruneDocuments(mode="top_k")
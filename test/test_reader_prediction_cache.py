@@ -0,0 +1,98 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from deployment.roles.haystack.files.custom_component import ReaderPredictionCache, \
+    enable_prediction_cache
+
+
+class CountingQAPipeline:
+    def __init__(self):
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, inputs, **kwargs):
+        with self.lock:
+            self.calls += 1
+        return [{"answer": inputs["context"][:5], "score": 0.5, "start": 0, "end": 5}]
+
+
+def test_reader_prediction_cache(tmp_path):
+    cache_path = tmp_path / "reader.sqlite"
+    qa_pipeline = CountingQAPipeline()
+    cache = ReaderPredictionCache(qa_pipeline, cache_path, "model")
+    inputs = {"question": "Quand ?", "context": "Hier soir."}
+
+    first = cache(inputs, topk=4)
+    assert cache(inputs, topk=4) == first
+    assert qa_pipeline.calls == 1
+
+    # Other arguments or other models are not read from the cache
+    cache(inputs, topk=2)
+    assert qa_pipeline.calls == 2
+    other_model = ReaderPredictionCache(qa_pipeline, cache_path, "other model")
+    other_model(inputs, topk=4)
+    assert qa_pipeline.calls == 3
+
+    # Predictions are persisted, but not written when the cache is read-only
+    reloaded = ReaderPredictionCache(qa_pipeline, cache_path, "model")
+    assert reloaded(inputs, topk=4) == first
+    reloaded.writable = False
+    reloaded({"question": "Où ?", "context": "Ici."}, topk=4)
+    reloaded({"question": "Où ?", "context": "Ici."}, topk=4)
+    assert qa_pipeline.calls == 5
+
+
+def test_reader_prediction_cache_threads(tmp_path):
+    qa_pipeline = CountingQAPipeline()
+    cache = ReaderPredictionCache(qa_pipeline, tmp_path / "reader.sqlite", "model")
+    inputs = [{"question": f"Question {i} ?", "context": f"Passage {i}."} for i in range(20)]
+
+    def predict(i):
+        return cache(inputs[i % 20], topk=4)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        first = list(executor.map(predict, range(40)))
+        second = list(executor.map(predict, range(40)))
+
+    assert second == first
+    assert [p[0]["answer"] for p in first[:20]] == [i["context"][:5] for i in inputs]
+    # Each pair is predicted at most twice (by two threads missing the cache at
+    # the same time), and never again once stored
+    assert 20 <= qa_pipeline.calls <= 40
+    calls = qa_pipeline.calls
+    predict(0)
+    assert qa_pipeline.calls == calls
+
+
+def test_reader_prediction_cache_metrics(tmp_path):
+    cache = ReaderPredictionCache(CountingQAPipeline(), tmp_path / "reader.sqlite", "model")
+    assert cache.get_metrics() == {"reader_cache_hit_rate": 0}
+    inputs = {"question": "Quand ?", "context": "Hier soir."}
+    for _ in range(4):
+        cache(inputs, topk=4)
+    assert (cache.hits, cache.misses) == (3, 1)
+    assert cache.get_metrics() == {"reader_cache_hit_rate": 0.75}
+
+
+class FakeReader:
+    def __init__(self, **params):
+        self.pipeline_config = {"params": params}
+        self.model = CountingQAPipeline()
+
+
+class FakeONNXReader(FakeReader):
+    pass
+
+
+def test_prediction_cache_model_key(tmp_path):
+    cache_path = tmp_path / "reader.sqlite"
+    inputs = {"question": "Quand ?", "context": "Hier soir."}
+    readers = [FakeReader(model_name_or_path="model"),
+               FakeONNXReader(model_name_or_path="model", quantize=False),
+               FakeONNXReader(model_name_or_path="model", quantize=True)]
+    for reader in readers:
+        qa_pipeline = reader.model
+        enable_prediction_cache(reader, cache_path)
+        reader.model(inputs, topk=4)
+        # The predictions of the other backends are not read
+        assert qa_pipeline.calls == 1
@@ -0,0 +1,35 @@
+from haystack import Document
+
+from deployment.roles.haystack.files.custom_component import CrossEncoderReranker
+
+
+DOCUMENTS = [
+    Document(text="La déclaration de revenus doit être faite chaque année au printemps, en ligne sur le site "
+                  "des impôts.", id="impots"),
+    Document(text="Le passeport est délivré par la mairie, sur rendez-vous.", id="passeport"),
+    Document(text="La carte grise est le certificat d'immatriculation d'un véhicule. Elle doit être demandée "
+                  "dans un délai d'un mois après l'achat du véhicule.", id="carte_grise"),
+]
+
+
+def test_reranker(tmp_path, monkeypatch):
+    reranker = CrossEncoderReranker(top_k=2, cache_path=str(tmp_path / "scores.sqlite"))
+    query = "Dans quel délai faut-il demander la carte grise ?"
+
+    output, edge = reranker.run(query=query, documents=DOCUMENTS)
+    assert edge == "output_1"
+    assert output["query"] == query
+    documents = output["documents"]
+    assert len(documents) == 2
+    assert documents[0].id == "carte_grise"
+    assert documents[0].score >= documents[1].score
+    assert 0 < documents[1].probability < documents[0].probability < 1
+    scores = [doc.score for doc in documents]
+
+    # The scores of the pairs already seen are read from the cache
+    reranker = CrossEncoderReranker(top_k=2, cache_path=str(tmp_path / "scores.sqlite"))
+    monkeypatch.setattr(reranker, "predict_scores", lambda query, texts: [0.0] * len(texts))
+    documents = reranker.run(query=query, documents=DOCUMENTS)[0]["documents"]
+    assert [doc.score for doc in documents] == scores
+    documents = reranker.run(query="Une autre question", documents=DOCUMENTS)[0]["documents"]
+    assert [doc.score for doc in documents] == [0.0, 0.0]
@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+
+from src.evaluation.utils.retriever_metrics import relevance_matrix, \
+    retriever_metrics
+
+
+def test_retriever_metrics():
+    relevance = relevance_matrix([[False, True, True], [True], []], width=4)
+    assert relevance.shape == (3, 4)
+
+    metrics = retriever_metrics(relevance, [2, 1, 1], [1, 2, 4])
+
+    assert metrics[1]["recall"] == pytest.approx(1 / 3)
+    assert metrics[1]["mrr"] == pytest.approx(1 / 3)
+    assert metrics[2]["recall"] == pytest.approx(2 / 3)
+    assert metrics[2]["mrr"] == pytest.approx((1 / 2 + 1) / 3)
+    # AP of the first question: (1/2 + 2/3) / 2
+    assert metrics[4]["map"] == pytest.approx(((1 / 2 + 2 / 3) / 2 + 1) / 3)
+    # nDCG of the first question: (1/log2(3) + 1/log2(4)) / (1 + 1/log2(3))
+    first_ndcg = (1 / np.log2(3) + 1 / np.log2(4)) / (1 + 1 / np.log2(3))
+    assert metrics[4]["ndcg"] == pytest.approx((first_ndcg + 1) / 3)
+    assert metrics[4]["correct_retrievals"] == 2
+    assert metrics[4]["number_of_questions"] == 3
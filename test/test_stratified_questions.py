@@ -0,0 +1,23 @@
+import json
+from pathlib import Path
+
+from src.evaluation.utils.utils_eval import stratified_question_order
+
+
+def test_stratified_question_order():
+    squad = Path("./test/samples/squad/small.json")
+    with open(squad, encoding="utf-8") as f:
+        articles = json.load(f)["data"]
+    article_questions = [{qa["question"] for paragraph in article["paragraphs"] for qa in paragraph["qas"]}
+                         for article in articles]
+
+    order = stratified_question_order(squad.as_posix())
+    assert sorted(order) == sorted(set.union(*article_questions))
+    assert order == stratified_question_order(squad.as_posix())
+
+    # Each article contributes to a sample in proportion to its number of questions
+    for n in [len(order) // 10, len(order) // 3, len(order) // 2]:
+        sample = set(order[:n])
+        for questions in article_questions:
+            expected = n * len(questions) / len(order)
+            assert abs(len(sample & questions) - expected) <= 1
@@ -0,0 +1,42 @@
+from skopt import Optimizer, dump
+from skopt.space import Categorical, Integer
+
+from src.evaluation.utils.utils_optimizer import load_previous_evaluations, \
+    pareto_front
+
+
+def test_pareto_front():
+    runs = [
+        ("slow", {"k_retriever": 20}, {"reader_topk_accuracy_has_answer": 0.8, "query_latency_p95": 2.0}),
+        ("dominated", {"k_retriever": 10}, {"reader_topk_accuracy_has_answer": 0.6, "query_latency_p95": 1.5}),
+        ("fast", {"k_retriever": 1}, {"reader_topk_accuracy_has_answer": 0.5, "query_latency_p95": 0.2}),
+        ("medium", {"k_retriever": 5}, {"reader_topk_accuracy_has_answer": 0.7, "query_latency_p95": 0.8}),
+        ("tie", {"k_retriever": 6}, {"reader_topk_accuracy_has_answer": 0.7, "query_latency_p95": 0.9}),
+        ("failed", {"k_retriever": 3}, {}),
+    ]
+    front = pareto_front(runs)
+    assert [run_id for run_id, _, _ in front] == ["fast", "medium", "slow"]
+
+    front = pareto_front(runs, latency_metric="time_per_label")
+    assert front == []
+
+
+def test_load_previous_evaluations(tmp_path):
+    dimensions = [Integer(name="k_retriever", low=1, high=20),
+                  Categorical(name="retriever_type", categories=["bm25", "dpr"])]
+    result_file_path = tmp_path / "optimize_result.z"
+    assert load_previous_evaluations(result_file_path, dimensions) == ([], [])
+
+    optimizer = Optimizer(dimensions)
+    optimizer.tell([[3, "bm25"], [15, "dpr"], [8, "dpr"]], [0.5, 0.4, 0.3])
+    dump(optimizer.get_result(), result_file_path, store_objective=False)
+
+    x0, y0 = load_previous_evaluations(result_file_path, dimensions)
+    assert x0 == [[3, "bm25"], [15, "dpr"], [8, "dpr"]]
+    assert y0 == [0.5, 0.4, 0.3]
+
+    # The points outside of the new dimensions are skipped
+    dimensions[0] = Integer(name="k_retriever", low=1, high=10)
+    x0, y0 = load_previous_evaluations(result_file_path, dimensions)
+    assert x0 == [[3, "bm25"], [8, "dpr"]]
+    assert y0 == [0.5, 0.3]